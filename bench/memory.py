@@ -0,0 +1,94 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Compare memory held by templates built with and without compact resources.
+
+    python bench/memory.py              # all sizes, 5 copies each
+    python bench/memory.py large -n 20  # hold 20 copies of the large template
+"""
+
+import argparse
+import collections
+import gc
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import synthetic
+from run import SIZES
+
+
+# RSS moves in whole pages and allocator arenas, so readings under this
+# many KB are mostly noise and the percentage saved means nothing
+NOISE_FLOOR = 1024
+
+
+def _rss():
+    # Current resident size in KB, ru_maxrss only gives the high-water mark
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+def _measure(args):
+    """Build copies of one size in a fresh worker and report the memory they hold."""
+    size, copies, compact = args
+    cls = synthetic.make_template(**SIZES[size])
+    # Build one up front so class setup and import costs aren't counted
+    data = cls(compact=compact).to_json()
+    gc.collect()
+    before = _rss()
+    templates = [cls(compact=compact) for _ in xrange(copies)]
+    gc.collect()
+    held = _rss() - before
+    assert templates[0].to_json() == data
+    return held, len(templates[0].resources)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sizes', nargs='*', default=list(SIZES), metavar='SIZE',
+                        help='sizes to run ({})'.format(', '.join(SIZES)))
+    parser.add_argument('-n', '--copies', type=int, default=5, help='templates held at once')
+    args = parser.parse_args(argv)
+    for size in args.sizes:
+        if size not in SIZES:
+            parser.error('unknown size {}'.format(size))
+
+    tasks = [(size, args.copies, compact) for size in args.sizes for compact in (False, True)]
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        results = collections.OrderedDict(zip(tasks, pool.map(_measure, tasks, chunksize=1)))
+    finally:
+        pool.close()
+        pool.join()
+    for size in args.sizes:
+        full, resources = results[(size, args.copies, False)]
+        compact, _ = results[(size, args.copies, True)]
+        if full < NOISE_FLOOR:
+            saved = 'under the {}KB noise floor, hold more copies with -n'.format(NOISE_FLOOR)
+        else:
+            saved = '{:.0%} saved'.format(1 - float(compact) / full)
+        sys.stdout.write('{} ({} resources x {}): {}KB full, {}KB compact ({})\n'.format(
+            size, resources, args.copies, full, compact, saved))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Benchmark Template construction and serialization on synthetic templates.
+
+    python bench/run.py                 # run and print results
+    python bench/run.py --save          # store results as the new baseline
+    python bench/run.py --check         # fail if slower than the baseline
+"""
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import synthetic
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+SIZES = collections.OrderedDict([
+    ('small', dict(subnets=10, security_groups=10, rules=10, asgs=2, join_depth=2, depends_on=5)),
+    ('medium', dict(subnets=100, security_groups=50, rules=20, asgs=10, join_depth=3, depends_on=20)),
+    ('large', dict(subnets=500, security_groups=200, rules=40, asgs=50, join_depth=4, depends_on=50)),
+])
+
+PHASES = ['construct', 'to_json', 'write_json']
+
+
+class _NullFile(object):
+    def write(self, data):
+        pass
+
+
+def _maxrss():
+    # Kilobytes on Linux, and a high-water mark so only growth is meaningful
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run_phase(args):
+    """Run one phase for one size.
+
+    Each phase gets a fresh worker, and ru_maxrss is a high-water mark, so
+    the growth over the phase is how far that phase pushed peak memory
+    past what the template itself (built before measuring) needs.
+    """
+    size, phase, repeat = args
+    cls = synthetic.make_template(**SIZES[size])
+    template = None if phase == 'construct' else cls()
+    best = None
+    rss = _maxrss()
+    for _ in xrange(repeat):
+        start = time.time()
+        if phase == 'construct':
+            template = None
+            template = cls()
+        elif phase == 'to_json':
+            template.to_json()
+        else:
+            template.write_json(_NullFile())
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return size, phase, {'seconds': best, 'peak_kb': _maxrss() - rss}, len(template.resources)
+
+
+def run(sizes, repeat):
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        tasks = [(size, phase, repeat) for size in sizes for phase in PHASES]
+        results = collections.OrderedDict((size, {}) for size in sizes)
+        for size, phase, result, resources in pool.map(_run_phase, tasks, chunksize=1):
+            results[size][phase] = result
+            results[size]['resources'] = resources
+        return results
+    finally:
+        pool.close()
+        pool.join()
+
+
+def check(results, baseline, tolerance):
+    """Return a list of regression messages comparing results to baseline."""
+    regressions = []
+    for size, phases in results.iteritems():
+        for phase in PHASES:
+            base = baseline.get(size, {}).get(phase)
+            if not base:
+                continue
+            current = phases[phase]
+            # Timer noise dominates phases of a few milliseconds, so allow a little absolute slack
+            if current['seconds'] > base['seconds'] * (1 + tolerance) + 0.01:
+                regressions.append('{} {}: {:.4f}s vs baseline {:.4f}s'.format(
+                    size, phase, current['seconds'], base['seconds']))
+            # Small allocations round to nothing in ru_maxrss, give them some slack
+            if current['peak_kb'] > base['peak_kb'] * (1 + tolerance) + 1024:
+                regressions.append('{} {}: {}KB peak vs baseline {}KB'.format(
+                    size, phase, current['peak_kb'], base['peak_kb']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sizes', nargs='*', default=list(SIZES), metavar='SIZE',
+                        help='sizes to run ({})'.format(', '.join(SIZES)))
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='runs per phase, best is kept')
+    parser.add_argument('--save', action='store_true', help='write results to the baseline file')
+    parser.add_argument('--check', action='store_true', help='exit non-zero on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed slowdown (default: 0.5)')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file')
+    args = parser.parse_args(argv)
+    for size in args.sizes:
+        if size not in SIZES:
+            parser.error('unknown size {}'.format(size))
+
+    results = run(args.sizes, args.repeat)
+    for size, phases in results.iteritems():
+        sys.stdout.write('{} ({} resources)\n'.format(size, phases['resources']))
+        for phase in PHASES:
+            sys.stdout.write('    {:<12} {:>9.4f}s {:>9}KB\n'.format(
+                phase, phases[phase]['seconds'], phases[phase]['peak_kb']))
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+            f.write('\n')
+    if args.check:
+        with open(args.baseline) as f:
+            regressions = check(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            sys.stderr.write('REGRESSION: {}\n'.format(regression))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
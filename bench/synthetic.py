@@ -0,0 +1,108 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import stratosphere
+from stratosphere import Base64, Equals, GetAZs, If, Join, Ref, Select
+
+
+def _nested_join(depth, i):
+    if depth <= 0:
+        return Join('', ['#!/bin/bash\n', 'echo ', Ref('AWS::StackName'), ' ', str(i), '\n'])
+    return Join('', [
+        If('IsProd', _nested_join(depth - 1, i), 'echo dev\n'),
+        _nested_join(depth - 1, i),
+    ])
+
+
+def make_template(subnets=10, security_groups=10, rules=10, asgs=5, join_depth=3, depends_on=10,
+                  name='SyntheticTemplate'):
+    """Build a Template subclass with a configurable number of resources.
+
+    Each subnet gets a route table and association, each security group gets
+    a list of ingress rules, and each ASG gets a launch configuration whose
+    UserData is a Join/If tree join_depth levels deep. ASGs depend on the
+    first depends_on subnets.
+    """
+    d = {'__doc__': 'Synthetic benchmark template.'}
+
+    def param_Env(self):
+        return {'Type': 'String', 'Default': 'dev'}
+    d['param_Env'] = param_Env
+
+    def cond_IsProd(self):
+        return Equals(Ref('Env'), 'prod')
+    d['cond_IsProd'] = cond_IsProd
+
+    def vpc(self):
+        return {'CidrBlock': '10.0.0.0/8'}
+    d['vpc'] = vpc
+
+    for i in xrange(subnets):
+        def subnet(self, i=i):
+            return {
+                'VpcId': Ref(self.vpc()),
+                'CidrBlock': '10.{}.{}.0/24'.format(i // 256, i % 256),
+                'AvailabilityZone': Select(str(i % 3), GetAZs('')),
+            }
+        def rtb(self):
+            return {'VpcId': Ref(self.vpc())}
+        def srta(self, i=i):
+            return {
+                'SubnetId': Ref('Subnet{}'.format(i)),
+                'RouteTableId': Ref('RouteTable{}'.format(i)),
+            }
+        d['subnet_Subnet{}'.format(i)] = subnet
+        d['rtb_RouteTable{}'.format(i)] = rtb
+        d['srta_RouteTableAssociation{}'.format(i)] = srta
+
+    for i in xrange(security_groups):
+        def sg(self, i=i):
+            """Synthetic security group."""
+            return {
+                'VpcId': Ref(self.vpc()),
+                'SecurityGroupIngress': [{
+                    'IpProtocol': 'tcp',
+                    'FromPort': str(1000 + j),
+                    'ToPort': str(1000 + j),
+                    'CidrIp': '10.{}.{}.0/24'.format(i % 256, j % 256),
+                } for j in xrange(rules)],
+            }
+        d['sg_SecurityGroup{}'.format(i)] = sg
+
+    for i in xrange(asgs):
+        def lc(self, i=i):
+            return {
+                'ImageId': 'ami-12345678',
+                'InstanceType': 'm3.medium',
+                'SecurityGroups': [Ref('SecurityGroup{}'.format(j)) for j in xrange(min(security_groups, 3))],
+                'UserData': Base64(_nested_join(join_depth, i)),
+            }
+        def asg(self, i=i):
+            """Synthetic autoscaling group."""
+            return {
+                'AvailabilityZones': GetAZs(''),
+                'LaunchConfigurationName': Ref('LaunchConfiguration{}'.format(i)),
+                'MinSize': '1',
+                'MaxSize': '3',
+                'VPCZoneIdentifier': [Ref('Subnet{}'.format(j)) for j in xrange(subnets)],
+                'DependsOn': ['Subnet{}'.format(j) for j in xrange(min(subnets, depends_on))],
+            }
+        d['lc_LaunchConfiguration{}'.format(i)] = lc
+        d['asg_AutoScalingGroup{}'.format(i)] = asg
+
+    return type(name, (stratosphere.Template,), d)
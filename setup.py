@@ -44,6 +44,12 @@ setup(
     ],
     zip_safe = False,
     install_requires = ['troposphere'],
+    entry_points = {
+        'console_scripts': [
+            'stratosphere-render = stratosphere.render:main',
+            'stratosphere-validate = stratosphere.validate:main',
+        ],
+    },
     tests_require = ['pytest', 'pretend', 'flake8'],
     cmdclass = {'test': PyTest},
 )
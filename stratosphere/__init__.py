@@ -18,11 +18,16 @@
 
 import collections
 import functools
+import inspect
+import json
 
 import troposphere
 
-from . import autoscaling, cloudformation, ec2, elasticloadbalancing, iam
+from . import autoscaling, cloudformation, ec2, elasticloadbalancing, iam, limits, profiling
 from .base import StratospherePendingObject, StratosphereObject
+from .canonical import canonicalize, to_plain
+from .graph import CycleError, DependencyGraph
+from .tags import apply_tags, tag_policy
 from .functions import *
 
 class Parameter(StratosphereObject, troposphere.Parameter):
@@ -56,10 +61,11 @@ class Mapping(troposphere.AWSObject):
 class Condition(troposphere.AWSObject):
     props = {}
 
-    def __init__(self, name, template=None, **kwargs): # FIXMEFIXMEFIXMEFIXME
+    def __init__(self, name, template=None, **kwargs):
+        kwargs.pop('Description', None) # From the docstring, but conditions can't have one
         self.data = kwargs
         self.template = template
-        super(Mapping, self).__init__(name)
+        super(Condition, self).__init__(name)
 
     def JSONrepr(self):
         return self.data
@@ -69,17 +75,67 @@ class Condition(troposphere.AWSObject):
         template.add_condition(name, obj)
 
 
+PRETTY = 'pretty'
+MINIFIED = 'minified'
+CANONICAL = 'canonical'
+
+SizeReport = collections.namedtuple('SizeReport', ['size', 'fits_inline', 'fits_s3'])
+
+
+class _CountingFile(object):
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+def _pending_object(template, fn, name, type, value):
+    if fn.__doc__:
+        value.setdefault('Description', fn.__doc__)
+    value['template'] = template
+    return StratospherePendingObject(name, type, **value)
+
+
+def _batch(template, fn, items, default_type):
+    """Normalize what a generator magic method yields into (type, name, object)."""
+    types = None
+    for item in items:
+        if len(item) == 3:
+            type, name, value = item
+            if isinstance(type, basestring):
+                if types is None:
+                    types = template.STRATOSPHERE_TYPES()
+                if type not in types:
+                    raise ValueError('unknown type prefix "{}" from {}'.format(type, fn.__name__))
+                type = types[type]
+        else:
+            name, value = item
+            type = default_type
+            if value is not None and not isinstance(value, dict) and hasattr(value.__class__, 'add_to_template'):
+                type = value.__class__
+        if isinstance(value, dict):
+            value = _pending_object(template, fn, name, type, value)
+        elif value is not None and getattr(value, 'title', name) != name:
+            raise ValueError('{} yielded "{}" for an object named "{}"'.format(fn.__name__, name, value.title))
+        yield type, name, value
+
+
 def cfn(name, type):
     def decorator(fn):
-        @functools.wraps(fn)
-        def inner(self, *args, **kwargs):
-            value = fn(self, *args, **kwargs)
-            if isinstance(value, dict):
-                if fn.__doc__:
-                    value.setdefault('Description', fn.__doc__)
-                value['template'] = self
-                value = StratospherePendingObject(name, type, **value)
-            return value
+        if inspect.isgeneratorfunction(fn):
+            # Yields many objects, as (name, value) or (type, name, value)
+            @functools.wraps(fn)
+            def inner(self, *args, **kwargs):
+                return _batch(self, fn, fn(self, *args, **kwargs), type)
+            inner._stratosphere_batch = True
+        else:
+            @functools.wraps(fn)
+            def inner(self, *args, **kwargs):
+                value = fn(self, *args, **kwargs)
+                if isinstance(value, dict):
+                    value = _pending_object(self, fn, name, type, value)
+                return value
         inner._stratosphere_name = name
         inner._stratosphere_type = type
         return inner
@@ -89,13 +145,20 @@ def cfn(name, type):
 class TemplateMeta(type):
     def __init__(self, name, bases, d):
         types = self.STRATOSPHERE_TYPES()
+        # Inherit the magic methods of all bases, in MRO order so overrides win
+        magic = set()
+        for base in reversed(self.__mro__[1:]):
+            magic.update(base.__dict__.get('_stratosphere_magic', ()))
         for key, value in d.iteritems():
             if key.startswith('_'):
                 continue
             parts = key.split('_', 1)
             prefix = parts[0]
             value_type = types.get(prefix)
-            if not value_type:
+            if not value_type or value is None:
+                # Overridden by something that isn't a magic method, or
+                # knocked out with foo = None
+                magic.discard(key)
                 continue
             if len(parts) == 1:
                 name = value_type.__name__ if value_type else key
@@ -104,11 +167,20 @@ class TemplateMeta(type):
             # Apply the @cfn() decorator
             value = cfn(name, value_type)(value)
             setattr(self, key, value)
+            magic.add(key)
+        # Sorted to match the order dir() used to give us
+        self._stratosphere_magic = tuple(sorted(magic))
+        # Work out which types take tags up front rather than per resource
+        for value_type in types.itervalues():
+            tag_policy(value_type)
 
 
 class Template(troposphere.Template):
     __metaclass__ = TemplateMeta
 
+    # Tags added to every taggable resource that doesn't already set them
+    DEFAULT_TAGS = {}
+
     @classmethod
     def STRATOSPHERE_TYPES(cls):
         return {
@@ -135,20 +207,200 @@ class Template(troposphere.Template):
             'vga': ec2.VPCGatewayAttachment,
         }
 
-    def __init__(self):
+    def __init__(self, lazy=False, profiler=None, inputs=None, compact=False):
         super(Template, self).__init__()
+        # Store resources as CompactResource, see add_resource()
+        self._compact = compact
+        # Per-render parameters for magic methods to read, see stratosphere.matrix
+        self.inputs = inputs if inputs is not None else {}
+        # Pending objects not yet converted, only used in lazy mode
+        self._pending = collections.OrderedDict()
+        self._profiler = profiler
+        if profiler is not None and profiler.name is None:
+            profiler.name = self.__class__.__name__
         # Use the docstring of the class as a default
         if self.__class__.__doc__:
             self.add_description(self.__class__.__doc__)
         # Process all magic methods
-        for key in dir(self):
-            value = getattr(self, key)
-            if getattr(value, '_stratosphere_type', False):
-                obj = value()
-                if not obj:
-                    continue # Returning none is a knockout
-                if isinstance(obj, StratospherePendingObject):
-                    obj = obj.to_object()
-                value._stratosphere_type.add_to_template(self, value._stratosphere_name, obj)
-                if hasattr(obj, 'post_add'):
-                    obj.post_add(self)
+        for key in self._stratosphere_magic:
+            self._process_magic(key, lazy)
+
+    def _process_magic(self, key, lazy=False):
+        value = getattr(self, key)
+        if not getattr(value, '_stratosphere_type', False):
+            return
+        if getattr(value, '_stratosphere_batch', False):
+            return self._process_batch(key, value(), lazy)
+        with self._measure('call', key):
+            obj = value()
+        if not obj:
+            return # Returning none is a knockout
+        if isinstance(obj, StratospherePendingObject):
+            if lazy:
+                self._pending[obj._stratosphere_name] = obj
+                return
+            obj = self._to_object(obj)
+        self._add_object(value._stratosphere_type, value._stratosphere_name, obj)
+
+    def _process_batch(self, key, items, lazy=False):
+        # Objects are converted and added as they are yielded, so only one
+        # is held at a time
+        seen = set()
+        while True:
+            with self._measure('call', key):
+                try:
+                    type, name, obj = next(items)
+                except StopIteration:
+                    return
+            if name in seen or name in self._pending or name in self.resources or \
+                    name in self.parameters or name in self.outputs:
+                raise ValueError('duplicate name "{}" from {}'.format(name, key))
+            seen.add(name)
+            if not obj:
+                continue
+            if isinstance(obj, StratospherePendingObject):
+                if lazy:
+                    self._pending[name] = obj
+                    continue
+                obj = self._to_object(obj)
+            self._add_object(type, name, obj)
+
+    def add_resource(self, resource):
+        """Add a resource, as a CompactResource copy if compact mode is on.
+
+        DEFAULT_TAGS are merged into the resource's Tags first, and the tag
+        count checked against limits.MAX_TAGS. The copy is made as soon as
+        the resource is added, so changes made to the original afterwards
+        (including in post_add) aren't seen.
+        """
+        if isinstance(resource, StratosphereObject):
+            apply_tags(resource.__class__, resource.properties, defaults=self.DEFAULT_TAGS, name=resource.title)
+        if self._compact and isinstance(resource, StratosphereObject):
+            resource = resource.compact()
+        return super(Template, self).add_resource(resource)
+
+    def _measure(self, phase, key):
+        if self._profiler is None:
+            return profiling.NULL_MEASUREMENT
+        return self._profiler.measure(phase, key)
+
+    def _to_object(self, pending):
+        with self._measure('to_object', pending._stratosphere_type.__name__):
+            return pending.to_object()
+
+    def _add_object(self, type, name, obj):
+        with self._measure('add', type.__name__):
+            type.add_to_template(self, name, obj)
+        if hasattr(obj, 'post_add'):
+            with self._measure('post_add', type.__name__):
+                obj.post_add(self)
+
+    def materialize(self, name=None):
+        """Convert pending objects from a lazy template into real objects.
+
+        With no name, everything still pending is converted (in the order the
+        magic methods ran). Returns the object for name, if given.
+        """
+        if name is not None:
+            pending = self._pending.pop(name)
+            obj = self._to_object(pending)
+            self._add_object(pending._stratosphere_type, name, obj)
+            return obj
+        while self._pending:
+            self.materialize(next(iter(self._pending)))
+
+    def logical_ids(self):
+        """Return the sorted logical IDs of all resources, without materializing anything."""
+        ids = set(self.resources)
+        for name, pending in self._pending.iteritems():
+            type = pending._stratosphere_type
+            if issubclass(type, StratosphereObject) and issubclass(type, troposphere.AWSObject):
+                ids.add(name)
+        return sorted(ids)
+
+    def get_object(self, name):
+        """Find a resource, parameter or output by name, materializing it if needed."""
+        if name in self._pending:
+            return self.materialize(name)
+        for section in (self.resources, self.parameters, self.outputs):
+            if name in section:
+                return section[name]
+        raise KeyError(name)
+
+    def dependency_graph(self):
+        """Build a DependencyGraph of this template's resources."""
+        return DependencyGraph.from_template(self)
+
+    def _json_dict(self):
+        self.materialize()
+        t = {}
+        if self.description:
+            t['Description'] = self.description
+        if self.conditions:
+            t['Conditions'] = self.conditions
+        if self.mappings:
+            t['Mappings'] = self.mappings
+        if self.outputs:
+            t['Outputs'] = self.outputs
+        if self.parameters:
+            t['Parameters'] = self.parameters
+        if self.version:
+            t['AWSTemplateFormatVersion'] = self.version
+        t['Resources'] = self.resources
+        return t
+
+    def _serialization(self, mode, indent, sort_keys, separators):
+        data = self._json_dict()
+        if mode is None or mode == PRETTY:
+            return data, dict(indent=indent, sort_keys=sort_keys, separators=separators)
+        if mode not in (MINIFIED, CANONICAL):
+            raise ValueError('unknown serialization mode {!r}'.format(mode))
+        if mode == CANONICAL:
+            data = canonicalize(to_plain(data))
+        return data, dict(indent=None, sort_keys=True, separators=(',', ':'))
+
+    def to_json(self, indent=4, sort_keys=True, separators=(', ', ': '), mode=None):
+        """Serialize the template.
+
+        mode can be MINIFIED for output without whitespace, or CANONICAL for
+        minified output with Joins, Tags and DependsOn normalized (see
+        stratosphere.canonical) so equivalent templates give equal bytes.
+        Both ignore the formatting arguments.
+        """
+        data, kwargs = self._serialization(mode, indent, sort_keys, separators)
+        return json.dumps(data, cls=troposphere.awsencode, **kwargs)
+
+    def write_json(self, fp, indent=4, sort_keys=True, separators=(', ', ': '), buffer_size=64*1024, mode=None):
+        """Stream the JSON for this template to a file-like object.
+
+        Output is byte-for-byte identical to to_json() with the same
+        arguments, but only buffer_size bytes of it are held at a time.
+        """
+        data, kwargs = self._serialization(mode, indent, sort_keys, separators)
+        encoder = troposphere.awsencode(**kwargs)
+        buf = []
+        size = 0
+        for chunk in encoder.iterencode(data):
+            buf.append(chunk)
+            size += len(chunk)
+            if size >= buffer_size:
+                fp.write(''.join(buf))
+                buf = []
+                size = 0
+        if buf:
+            fp.write(''.join(buf))
+
+    def json_size(self, mode=None):
+        """Return the size in bytes of the serialized template, without building it in memory."""
+        counter = _CountingFile()
+        self.write_json(counter, mode=mode)
+        return counter.size
+
+    def size_report(self):
+        """Return an OrderedDict of serialization mode to SizeReport."""
+        report = collections.OrderedDict()
+        for mode in (None, MINIFIED, CANONICAL):
+            size = self.json_size(mode)
+            report[mode or PRETTY] = SizeReport(size, size <= limits.MAX_BODY_SIZE,
+                                                size <= limits.MAX_S3_BODY_SIZE)
+        return report
@@ -23,6 +23,7 @@ from .base import StratosphereObject
 
 class AutoScalingGroup(StratosphereObject, troposphere.autoscaling.AutoScalingGroup):
     DESCRIPTION_TAG_EXTRA = {'PropagateAtLaunch': False}
+    TAG_EXTRA = {'PropagateAtLaunch': True}
 
 
 class LaunchConfiguration(StratosphereObject, troposphere.autoscaling.LaunchConfiguration):
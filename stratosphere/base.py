@@ -20,6 +20,9 @@ import itertools
 
 import troposphere
 
+from .compact import compact_class
+from .tags import apply_tags
+
 
 class StratospherePendingObject(dict):
     """A dict that will later on be converted to a Stratosphere/Troposphere object."""
@@ -39,17 +42,9 @@ class StratospherePendingObject(dict):
             elif 'GroupDescription' in self._stratosphere_type.props:
                 # Security groups use GroupDescription for whatever reason
                 self['GroupDescription'] = description
-            elif 'Tags' in type.props:
-                # Fallback, set a tag named Description
-                self.setdefault('Tags', [])
-                for tag in self['Tags']:
-                    if tag['Key'] == 'Description':
-                        # If it already has a description, don't change it
-                        break
-                else:
-                    tag = {'Key': 'Description', 'Value': description}
-                    tag.update(getattr(self._stratosphere_type, 'DESCRIPTION_TAG_EXTRA', {}))
-                    self['Tags'].append(tag)
+            else:
+                # Fallback, set a tag named Description unless it already has one
+                apply_tags(type, self, description=description, name=self._stratosphere_name)
         return self._stratosphere_type(self._stratosphere_name, **self)
 
 
@@ -58,8 +53,8 @@ class StratosphereObject(object):
     def __init__(self, name, **kwargs):
         self.name = name # So it is available for later calls
         self.template = template = kwargs.pop('template', None)
-        for prop in itertools.chain(self.__class__.props.iterkeys(), ['Metadata', 'DependsOn']):
-            if prop not in kwargs and hasattr(self, prop):
+        for prop in self._defaults():
+            if prop not in kwargs:
                 # Can't use getattr() because AWSObject overrides that and isn't initialized yet
                 value = object.__getattribute__(self, prop)
                 if callable(value):
@@ -84,6 +79,36 @@ class StratosphereObject(object):
         # Reset it because Troposphere set it to None again
         self.template = template
 
+    @classmethod
+    def _defaults(cls):
+        """Return the names of properties this class provides a default for.
+
+        Computed once per class. It is stored in the class's own __dict__ so
+        a subclass adding defaults gets its own list rather than inheriting
+        its parent's. The list is never recomputed, so a default set on the
+        class after its first instance was created isn't picked up.
+        """
+        defaults = cls.__dict__.get('_stratosphere_defaults')
+        if defaults is None:
+            defaults = tuple(prop for prop in itertools.chain(cls.props.iterkeys(), ['Metadata', 'DependsOn'])
+                             if hasattr(cls, prop))
+            cls._stratosphere_defaults = defaults
+        return defaults
+
+    def compact(self):
+        """Return a CompactResource copy of this resource.
+
+        Validation runs now rather than at serialization, since the copy
+        can't change afterwards.
+        """
+        if not isinstance(self, troposphere.AWSObject):
+            raise TypeError('only resources can be compacted, not {}'.format(self.__class__.__name__))
+        self.JSONrepr()
+        keys = tuple(sorted(self.properties))
+        attrs = tuple((key, value) for key, value in sorted(self.resource.iteritems())
+                      if key not in ('Type', 'Properties'))
+        return compact_class(self.__class__)(self.title, keys, tuple(self.properties[key] for key in keys), attrs)
+
     @classmethod
     def add_to_template(cls, template, name, obj):
         """Add an object to a given template."""
@@ -0,0 +1,170 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+
+import troposphere
+
+
+_package_digest = None
+
+
+def package_digest():
+    """Return a hash of stratosphere's own source, worked out once per process."""
+    global _package_digest
+    if _package_digest is None:
+        h = hashlib.sha1()
+        root = os.path.dirname(os.path.abspath(__file__))
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith('.py'):
+                    path = os.path.join(dirpath, filename)
+                    h.update(os.path.relpath(path, root))
+                    with open(path, 'rb') as f:
+                        h.update(f.read())
+        _package_digest = h.hexdigest()
+    return _package_digest
+
+
+class BuildCache(object):
+    """An on-disk cache of rendered template JSON, keyed by a hash of the source.
+
+    Entries are evicted least-recently-used first once the cache grows past
+    max_size bytes. Hits refresh the entry's mtime, which is used as the LRU
+    clock since atime is unreliable on most mounts.
+    """
+    def __init__(self, path, max_size=64*1024*1024):
+        self.path = path
+        self.max_size = max_size
+        self._sources = {}
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def __getstate__(self):
+        # Don't ship the source memo to worker processes, it holds classes
+        state = self.__dict__.copy()
+        state['_sources'] = {}
+        return state
+
+    def _source(self, cls):
+        if cls not in self._sources:
+            try:
+                source = inspect.getsource(cls)
+            except (IOError, TypeError):
+                # No source (e.g. built with type()), nothing to key on
+                source = None
+            self._sources[cls] = source
+        return self._sources[cls]
+
+    def key(self, cls, inputs=None):
+        """Compute the cache key for a Template class, or None if it can't be cached.
+
+        The key covers the source of the class and every base and mixin
+        outside troposphere, the STRATOSPHERE_TYPES() map along with the
+        source of each type class, stratosphere's own source, the
+        troposphere version, and any extra inputs (anything
+        JSON-serializable) the caller knows the output depends on.
+        Module-level constants and helper functions a template uses are not
+        covered, pass anything like that in inputs or clear the cache.
+        """
+        h = hashlib.sha1()
+        h.update(troposphere.__version__)
+        h.update(package_digest())
+        for klass in inspect.getmro(cls):
+            if klass is object or klass.__module__.split('.')[0] == 'troposphere':
+                continue
+            source = self._source(klass)
+            if source is None:
+                return None
+            h.update(source)
+        for prefix, value_type in sorted(cls.STRATOSPHERE_TYPES().iteritems()):
+            h.update(prefix)
+            source = self._source(value_type)
+            if source is None:
+                return None
+            h.update(source)
+        h.update(json.dumps(inputs, sort_keys=True, default=repr))
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.path, '{}.json'.format(key))
+
+    def get(self, key):
+        """Return the cached JSON for key, or None on a miss."""
+        if key is None:
+            return None
+        path = self._entry(key)
+        try:
+            with open(path, 'r') as f:
+                data = f.read()
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+        return data
+
+    def put(self, key, data):
+        """Store rendered JSON under key. Writes are atomic so concurrent readers never see partial data."""
+        if key is None:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.rename(tmp, self._entry(key))
+        except:
+            os.unlink(tmp)
+            raise
+
+    def evict(self):
+        """Remove least-recently-used entries until the cache fits in max_size."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            if not name.endswith('.json'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue # Raced with another evict
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        entries.sort()
+        for mtime, size, name in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
+
+    def render(self, cls, inputs=None):
+        """Return (json, hit) for a Template class, rendering and storing it on a miss."""
+        key = self.key(cls, inputs)
+        data = self.get(key)
+        if data is not None:
+            return data, True
+        data = cls().to_json()
+        self.put(key, data)
+        self.evict()
+        return data, False
@@ -0,0 +1,74 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+
+import troposphere
+
+
+def to_plain(value):
+    """Convert an object tree (helpers, troposphere objects) to plain JSON data."""
+    return json.loads(json.dumps(value, cls=troposphere.awsencode))
+
+
+def simplify_join(args):
+    """Merge adjacent literals in Fn::Join args, returning a string if nothing else is left."""
+    if not isinstance(args, list) or len(args) != 2 or not isinstance(args[0], basestring) \
+            or not isinstance(args[1], list):
+        return {'Fn::Join': args}
+    delimiter, values = args
+    # Join(d, [a, b, X]) is the same as Join(d, [a+d+b, X])
+    merged = []
+    for value in values:
+        if isinstance(value, basestring) and merged and isinstance(merged[-1], basestring):
+            merged[-1] = merged[-1] + delimiter + value
+        else:
+            merged.append(value)
+    if not merged:
+        return ''
+    if len(merged) == 1 and isinstance(merged[0], basestring):
+        return merged[0]
+    return {'Fn::Join': [delimiter, merged]}
+
+
+def canonicalize(value):
+    """Normalize plain JSON template data so equivalent templates are equal.
+
+    Joins have adjacent literal strings merged (and collapse to a string if
+    nothing else is left), Tags are sorted by key and DependsOn lists are
+    sorted, with a single dependency written as a plain string. Returns a
+    new value, the input isn't modified.
+    """
+    if isinstance(value, dict):
+        out = {}
+        for key, item in value.iteritems():
+            item = canonicalize(item)
+            if key == 'Tags' and isinstance(item, list) \
+                    and all(isinstance(tag, dict) and 'Key' in tag for tag in item):
+                item = sorted(item, key=lambda tag: tag['Key'])
+            elif key == 'DependsOn' and isinstance(item, list):
+                item = sorted(item)
+                if len(item) == 1:
+                    item = item[0]
+            out[key] = item
+        if len(out) == 1 and 'Fn::Join' in out:
+            return simplify_join(out['Fn::Join'])
+        return out
+    elif isinstance(value, list):
+        return [canonicalize(item) for item in value]
+    return value
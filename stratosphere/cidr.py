@@ -0,0 +1,198 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import bisect
+
+from .functions import GetAZs, Select
+
+
+# IPv4 only, blocks are (network, prefixlen) tuples with the network as an int
+
+
+def parse_cidr(cidr):
+    """Parse 'a.b.c.d/n' into (network, prefixlen). Host bits must be zero."""
+    try:
+        address, prefixlen = cidr.split('/')
+        octets = [int(octet) for octet in address.split('.')]
+        prefixlen = int(prefixlen)
+    except (AttributeError, ValueError):
+        raise ValueError('invalid CIDR block {!r}'.format(cidr))
+    if len(octets) != 4 or not all(0 <= octet <= 255 for octet in octets) or not 0 <= prefixlen <= 32:
+        raise ValueError('invalid CIDR block {!r}'.format(cidr))
+    network = (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+    if network & ~netmask(prefixlen) & 0xffffffff:
+        raise ValueError('CIDR block {!r} has host bits set'.format(cidr))
+    return network, prefixlen
+
+
+def format_cidr(block):
+    network, prefixlen = block
+    return '{}.{}.{}.{}/{}'.format(network >> 24, (network >> 16) & 0xff, (network >> 8) & 0xff,
+                                   network & 0xff, prefixlen)
+
+
+def netmask(prefixlen):
+    return (0xffffffff << (32 - prefixlen)) & 0xffffffff
+
+
+def block_range(block):
+    """Return the (first, last) addresses of a block, inclusive."""
+    network, prefixlen = block
+    return network, network | (~netmask(prefixlen) & 0xffffffff)
+
+
+def contains(outer, inner):
+    """Check if inner is inside (or the same as) outer."""
+    return outer[1] <= inner[1] and inner[0] & netmask(outer[1]) == outer[0]
+
+
+def supernet(block, prefixlen):
+    """Return the block of the given shorter prefix length containing block."""
+    return block[0] & netmask(prefixlen), prefixlen
+
+
+def collapse(blocks):
+    """Merge blocks into the fewest blocks covering the same addresses.
+
+    Contained blocks are dropped and pairs of sibling blocks (the two
+    halves of a larger block) are merged, repeatedly. Linear after a sort.
+    """
+    out = []
+    for block in sorted(set(blocks), key=lambda block: (block[0], block[1])):
+        if out and contains(out[-1], block):
+            continue
+        out.append(block)
+        # Merging can cascade back down the stack, 10.0.1.0/24 completing
+        # 10.0.0.0/23 which then completes 10.0.0.0/22
+        while len(out) >= 2:
+            (a_net, a_len), (b_net, b_len) = out[-2], out[-1]
+            if a_len != b_len or a_len == 0 or a_net & netmask(a_len - 1) != b_net & netmask(a_len - 1) \
+                    or a_net == b_net:
+                break
+            out[-2:] = [(a_net, a_len - 1)]
+    return out
+
+
+class CidrAllocator(object):
+    """Hand out non-overlapping CIDR blocks from a pool.
+
+    Allocations are kept as a sorted list of address ranges, so an overlap
+    check is a bisect and its two neighbours. Giving a key makes
+    allocation idempotent: asking again with the same key returns the same
+    block, which lets magic methods (which run every time they are called)
+    share one allocator. Share it across templates by keeping it at module
+    level. Blocks are handed out first-fit in request order, so with
+    parallel renders allocate anything the workers need to agree on
+    before forking.
+    """
+    def __init__(self, pool='10.0.0.0/8'):
+        self.pool = parse_cidr(pool) if isinstance(pool, basestring) else pool
+        self._starts = []
+        self._ranges = []
+        self._keys = {}
+        self._children = {}
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def overlaps(self, cidr):
+        """Return the allocated block overlapping cidr, or None."""
+        first, last = block_range(parse_cidr(cidr) if isinstance(cidr, basestring) else cidr)
+        i = bisect.bisect_right(self._starts, last) - 1
+        # Allocations don't overlap each other, so only the one starting
+        # closest before the end of this range can reach into it
+        if i >= 0 and self._ranges[i][1] >= first:
+            return format_cidr(self._ranges[i][2])
+        return None
+
+    def _insert(self, block, key):
+        first, last = block_range(block)
+        i = bisect.bisect_left(self._starts, first)
+        self._starts.insert(i, first)
+        self._ranges.insert(i, (first, last, block))
+        if key is not None:
+            self._keys[key] = block
+        return format_cidr(block)
+
+    def _existing(self, key, prefixlen=None, cidr=None):
+        block = self._keys.get(key) if key is not None else None
+        if block is None:
+            return None
+        if (prefixlen is not None and block[1] != prefixlen) or (cidr is not None and block != cidr):
+            raise ValueError('key {!r} already has {}'.format(key, format_cidr(block)))
+        return format_cidr(block)
+
+    def reserve(self, cidr, key=None):
+        """Mark a specific block as taken, raising ValueError if it overlaps anything."""
+        block = parse_cidr(cidr) if isinstance(cidr, basestring) else cidr
+        existing = self._existing(key, cidr=block)
+        if existing:
+            return existing
+        if not contains(self.pool, block):
+            raise ValueError('{} is outside {}'.format(format_cidr(block), format_cidr(self.pool)))
+        overlap = self.overlaps(block)
+        if overlap:
+            raise ValueError('{} overlaps {}'.format(format_cidr(block), overlap))
+        return self._insert(block, key)
+
+    def allocate(self, prefixlen, key=None):
+        """Allocate the first free block of the given prefix length and return it as a string."""
+        existing = self._existing(key, prefixlen=prefixlen)
+        if existing:
+            return existing
+        if prefixlen < self.pool[1] or prefixlen > 32:
+            raise ValueError('can\'t allocate a /{} from {}'.format(prefixlen, format_cidr(self.pool)))
+        size = 1 << (32 - prefixlen)
+        pool_first, pool_last = block_range(self.pool)
+        candidate = pool_first
+        while candidate + size - 1 <= pool_last:
+            # Find the first allocation not ending before the candidate, then
+            # see if the gap up to it is big enough
+            i = max(0, bisect.bisect_right(self._starts, candidate) - 1)
+            if i < len(self._ranges) and self._ranges[i][1] < candidate:
+                i += 1
+            if i == len(self._ranges) or self._ranges[i][0] > candidate + size - 1:
+                return self._insert((candidate, prefixlen), key)
+            candidate = -(-(self._ranges[i][1] + 1) // size) * size
+        raise ValueError('no free /{} left in {}'.format(prefixlen, format_cidr(self.pool)))
+
+    def child(self, cidr):
+        """Return the allocator for carving up a block from this one, e.g. subnets of a VPC.
+
+        The block has to be one this allocator handed out or had reserved,
+        or is reserved now, so it can't be given to anything else later.
+        Raises ValueError if it is outside the pool or overlaps another block.
+        """
+        block = parse_cidr(cidr) if isinstance(cidr, basestring) else cidr
+        if block not in self._children:
+            if self.overlaps(block) != format_cidr(block):
+                self.reserve(block)
+            self._children[block] = CidrAllocator(block)
+        return self._children[block]
+
+    def az_subnets(self, vpc_cidr, prefixlen, azs=3, key=None, region=''):
+        """Allocate one subnet per AZ out of a VPC block.
+
+        Returns a list of (CidrBlock, AvailabilityZone) pairs, the zone as
+        Select(index, GetAZs(region)). With a key, the subnets are keyed
+        '<key>/<index>' in the VPC's allocator.
+        """
+        subnets = self.child(vpc_cidr)
+        return [(subnets.allocate(prefixlen, None if key is None else '{}/{}'.format(key, i)),
+                 Select(str(i), GetAZs(region)))
+                for i in xrange(azs)]
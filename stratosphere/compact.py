@@ -0,0 +1,82 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+class CompactResource(object):
+    """A frozen, slotted copy of a resource that serializes the same way.
+
+    A troposphere object carries a properties dict, a resource dict and a
+    per-instance list of every property name. This keeps the set property
+    names as a tuple shared by every resource of the class with the same
+    names, and the values in a tuple alongside it. Build them with
+    StratosphereObject.compact().
+    """
+    __slots__ = ('title', '_keys', '_values', '_attrs')
+
+    # Set on the generated subclass for each resource class
+    type = None
+    _keysets = None
+
+    def __init__(self, title, keys, values, attrs):
+        self.title = title
+        self._keys = self._keysets.setdefault(keys, keys)
+        self._values = values
+        self._attrs = attrs
+
+    @property
+    def name(self):
+        return self.title
+
+    @property
+    def properties(self):
+        return dict(zip(self._keys, self._values))
+
+    @property
+    def resource(self):
+        resource = {'Type': self.type, 'Properties': self.properties}
+        resource.update(self._attrs)
+        return resource
+
+    def __getattr__(self, name):
+        try:
+            return self._values[self._keys.index(name)]
+        except ValueError:
+            raise AttributeError(name)
+
+    def JSONrepr(self):
+        # Same as troposphere: without properties, only the Type survives
+        if not self._keys:
+            return {'Type': self.type}
+        return self.resource
+
+
+_classes = {}
+
+
+def compact_class(cls):
+    """Return the CompactResource subclass for a resource class, creating it once."""
+    compact = _classes.get(cls)
+    if compact is None:
+        compact = type(cls.__name__, (CompactResource,), {
+            '__slots__': (),
+            '__module__': cls.__module__,
+            'type': cls.type,
+            '_keysets': {},
+        })
+        _classes[cls] = compact
+    return compact
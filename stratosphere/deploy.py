@@ -0,0 +1,294 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import abc
+import collections
+import inspect
+import json
+import Queue
+import threading
+import time
+import traceback
+
+from . import MINIFIED
+from .evaluate import Evaluator
+from .graph import CycleError, DependencyGraph
+
+
+DeployResult = collections.namedtuple('DeployResult', ['name', 'action', 'outputs', 'error', 'attempts', 'duration'])
+
+CREATE = 'create'
+UPDATE = 'update'
+
+
+class DeployError(Exception):
+    pass
+
+
+class ThrottlingError(DeployError):
+    """Raised by a backend when the API asks us to slow down, the call is retried."""
+
+
+class StackOutput(object):
+    """Placeholder for an output of another stack, usable as a parameter value.
+
+    The stack using it waits for that stack to be deployed. Stacks not part
+    of the same deploy are looked up with Backend.get_outputs().
+    """
+    def __init__(self, stack, output):
+        self.stack = stack
+        self.output = output
+
+    def __repr__(self):
+        return 'StackOutput({!r}, {!r})'.format(self.stack, self.output)
+
+
+class StackSpec(object):
+    """A stack to deploy: a name, a Template (class or instance), template dict or JSON, and parameters."""
+    def __init__(self, name, template, parameters=None, depends_on=()):
+        self.name = name
+        self.template = template
+        self.parameters = parameters or {}
+        self.depends_on = list(depends_on)
+
+    def dependencies(self):
+        deps = set(self.depends_on)
+        deps.update(value.stack for value in self.parameters.itervalues() if isinstance(value, StackOutput))
+        return deps
+
+    def body(self):
+        template = self.template
+        if inspect.isclass(template):
+            template = template()
+        if isinstance(template, basestring):
+            return template
+        if isinstance(template, dict):
+            return json.dumps(template, sort_keys=True, separators=(',', ':'))
+        return template.to_json(mode=MINIFIED)
+
+
+class Backend(object):
+    """Interface to whatever actually runs stacks.
+
+    create_stack and update_stack block until the stack is done and return
+    its outputs as a dict. Raise ThrottlingError for calls that should be
+    retried later, anything else fails the stack.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def stack_exists(self, name):
+        """Return True if a stack with this name exists."""
+
+    @abc.abstractmethod
+    def create_stack(self, name, body, parameters):
+        """Create a stack and return its outputs."""
+
+    @abc.abstractmethod
+    def update_stack(self, name, body, parameters):
+        """Update an existing stack and return its outputs."""
+
+    @abc.abstractmethod
+    def get_outputs(self, name):
+        """Return the outputs of an existing stack, or None if there is no such stack."""
+
+
+class FakeBackend(Backend):
+    """An in-process stand-in for CloudFormation.
+
+    Outputs are worked out with stratosphere.evaluate, with resources named
+    after their stack. Each create or update takes latency seconds, the
+    first throttle calls raise ThrottlingError, and stacks named in failures
+    fail. calls records (action, name) in the order calls were made and
+    max_active the most calls ever running at once.
+    """
+    def __init__(self, latency=0.0, throttle=0, failures=(), sleep=time.sleep):
+        self.latency = latency
+        self.throttle = throttle
+        self.failures = set(failures)
+        self.sleep = sleep
+        self.stacks = {}
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def stack_exists(self, name):
+        with self._lock:
+            return name in self.stacks
+
+    def _run(self, action, name, body, parameters):
+        with self._lock:
+            self.calls.append((action, name))
+            if self.throttle > 0:
+                self.throttle -= 1
+                raise ThrottlingError('Rate exceeded')
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if self.latency:
+                self.sleep(self.latency)
+            if name in self.failures:
+                raise DeployError('stack {} failed'.format(name))
+            template = json.loads(body)
+            physical_ids = dict((logical, '{}-{}'.format(name, logical)) for logical in template.get('Resources', {}))
+            outputs = Evaluator(template, pseudo_parameters={'AWS::StackName': name},
+                                physical_ids=physical_ids).evaluate(parameters).outputs
+            outputs = dict((key, value if isinstance(value, basestring) else json.dumps(value))
+                           for key, value in outputs.iteritems())
+            with self._lock:
+                self.stacks[name] = (body, dict(parameters), outputs)
+            return outputs
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def create_stack(self, name, body, parameters):
+        if self.stack_exists(name):
+            raise DeployError('stack {} already exists'.format(name))
+        return self._run(CREATE, name, body, parameters)
+
+    def update_stack(self, name, body, parameters):
+        if not self.stack_exists(name):
+            raise DeployError('stack {} does not exist'.format(name))
+        return self._run(UPDATE, name, body, parameters)
+
+    def get_outputs(self, name):
+        with self._lock:
+            stack = self.stacks.get(name)
+        return dict(stack[2]) if stack else None
+
+
+class Deployer(object):
+    """Create or update stacks concurrently, in dependency order.
+
+    At most max_workers stacks are in flight at once. Throttled calls are
+    retried up to max_retries times, sleeping base_delay seconds doubled on
+    every attempt (capped at max_delay). sleep can be swapped out for tests.
+    """
+    def __init__(self, backend, max_workers=4, max_retries=5, base_delay=1.0, max_delay=30.0, sleep=time.sleep):
+        self.backend = backend
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+
+    def _parameters(self, spec, results):
+        parameters = {}
+        for key, value in spec.parameters.iteritems():
+            if isinstance(value, StackOutput):
+                if value.stack in results:
+                    outputs = results[value.stack].outputs
+                else:
+                    outputs = self.backend.get_outputs(value.stack)
+                    if outputs is None:
+                        raise DeployError('stack {} does not exist'.format(value.stack))
+                if value.output not in outputs:
+                    raise DeployError('stack {} has no output {}'.format(value.stack, value.output))
+                value = outputs[value.output]
+            parameters[key] = value
+        return parameters
+
+    def _deploy_one(self, spec, results):
+        start = time.time()
+        action = None
+        attempts = 0
+        try:
+            body = spec.body()
+            parameters = self._parameters(spec, results)
+            while True:
+                attempts += 1
+                try:
+                    if self.backend.stack_exists(spec.name):
+                        action = UPDATE
+                        outputs = self.backend.update_stack(spec.name, body, parameters)
+                    else:
+                        action = CREATE
+                        outputs = self.backend.create_stack(spec.name, body, parameters)
+                    break
+                except ThrottlingError:
+                    if attempts > self.max_retries:
+                        raise
+                    self.sleep(min(self.max_delay, self.base_delay * 2 ** (attempts - 1)))
+        except Exception:
+            return DeployResult(spec.name, action, None, traceback.format_exc(), attempts, time.time() - start)
+        return DeployResult(spec.name, action, outputs, None, attempts, time.time() - start)
+
+    def deploy(self, stacks):
+        """Deploy a list of StackSpec, returning an OrderedDict of name to DeployResult.
+
+        A stack that fails doesn't stop the others, but everything that
+        depends on it is skipped with an error. Raises CycleError before
+        deploying anything if the stacks depend on each other in a loop.
+        """
+        specs = collections.OrderedDict()
+        for spec in stacks:
+            if spec.name in specs:
+                raise ValueError('duplicate stack name "{}"'.format(spec.name))
+            specs[spec.name] = spec
+        graph = DependencyGraph(dict((name, {'DependsOn': sorted(spec.dependencies())})
+                                     for name, spec in specs.iteritems()))
+        cycles = graph.find_cycles()
+        if cycles:
+            raise CycleError(cycles[0])
+
+        results = {}
+        waiting = dict((name, len(graph.dependencies(name))) for name in specs)
+        work = Queue.Queue()
+        done = Queue.Queue()
+
+        def worker():
+            while True:
+                name = work.get()
+                if name is None:
+                    return
+                done.put(self._deploy_one(specs[name], results))
+
+        threads = [threading.Thread(target=worker, name='deploy-{}'.format(i))
+                   for i in xrange(min(self.max_workers, len(specs)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            for name, count in waiting.iteritems():
+                if count == 0:
+                    work.put(name)
+            running = sum(1 for count in waiting.itervalues() if count == 0)
+            while running:
+                result = done.get()
+                running -= 1
+                results[result.name] = result
+                if result.error:
+                    # Everything downstream can't go ahead
+                    for name in graph.dependents(result.name, recursive=True):
+                        if name not in results:
+                            results[name] = DeployResult(name, None, None, 'dependency {} failed'.format(result.name),
+                                                         0, 0.0)
+                    continue
+                for name in graph.dependents(result.name):
+                    waiting[name] -= 1
+                    if waiting[name] == 0 and name not in results:
+                        work.put(name)
+                        running += 1
+        finally:
+            for thread in threads:
+                work.put(None)
+            for thread in threads:
+                thread.join()
+        return collections.OrderedDict((name, results[name]) for name in specs)
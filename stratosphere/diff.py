@@ -0,0 +1,187 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import collections
+import json
+
+from . import CANONICAL
+from .canonical import canonicalize
+from .graph import DependencyGraph, iter_references
+
+
+Change = collections.namedtuple('Change', ['section', 'name', 'action', 'type', 'properties', 'replacement'])
+
+ADD = 'Add'
+REMOVE = 'Remove'
+MODIFY = 'Modify'
+
+# Replacement values, in the same terms CloudFormation uses
+REPLACE_TRUE = 'True'
+REPLACE_CONDITIONAL = 'Conditional'
+REPLACE_FALSE = 'False'
+
+_REPLACEMENT_RANK = {None: 0, REPLACE_FALSE: 0, REPLACE_CONDITIONAL: 1, REPLACE_TRUE: 2}
+
+# Properties that force a new physical resource when changed, '*' for all of them
+REPLACEMENT_PROPERTIES = {
+    'AWS::AutoScaling::AutoScalingGroup': set(['InstanceId', 'LoadBalancerNames', 'PlacementGroup']),
+    'AWS::AutoScaling::LaunchConfiguration': '*',
+    'AWS::EC2::DHCPOptions': '*',
+    'AWS::EC2::Instance': set(['AvailabilityZone', 'ImageId', 'KeyName', 'NetworkInterfaces',
+                               'PlacementGroupName', 'PrivateIpAddress', 'SecurityGroups', 'SubnetId',
+                               'Tenancy']),
+    'AWS::EC2::Route': set(['DestinationCidrBlock', 'RouteTableId']),
+    'AWS::EC2::RouteTable': set(['VpcId']),
+    'AWS::EC2::SecurityGroup': set(['GroupDescription', 'VpcId']),
+    'AWS::EC2::SecurityGroupIngress': '*',
+    'AWS::EC2::Subnet': set(['AvailabilityZone', 'CidrBlock', 'VpcId']),
+    'AWS::EC2::SubnetRouteTableAssociation': set(['SubnetId']),
+    'AWS::EC2::VPC': set(['CidrBlock', 'InstanceTenancy']),
+    'AWS::EC2::VPCDHCPOptionsAssociation': set(['VpcId']),
+    'AWS::ElasticLoadBalancing::LoadBalancer': set(['LoadBalancerName', 'Scheme']),
+    'AWS::IAM::InstanceProfile': set(['Path']),
+    'AWS::IAM::Role': set(['Path']),
+}
+
+SECTIONS = ['Description', 'Parameters', 'Mappings', 'Conditions', 'Resources', 'Outputs']
+
+
+def _canonical(template):
+    if isinstance(template, dict):
+        return canonicalize(template)
+    return json.loads(template.to_json(mode=CANONICAL))
+
+
+def _is_intrinsic(value):
+    if isinstance(value, dict) and len(value) == 1:
+        key = next(iter(value))
+        return key == 'Ref' or key.startswith('Fn::')
+    return False
+
+
+def _requires_replacement(type, prop):
+    props = REPLACEMENT_PROPERTIES.get(type, ())
+    return props == '*' or prop in props
+
+
+def _max_replacement(a, b):
+    return a if _REPLACEMENT_RANK[a] >= _REPLACEMENT_RANK[b] else b
+
+
+def _resource_change(name, old, new):
+    type = new.get('Type')
+    if old.get('Type') != type:
+        return Change('Resources', name, MODIFY, type, ['Type'], REPLACE_TRUE)
+    old_props = old.get('Properties', {})
+    new_props = new.get('Properties', {})
+    changed = []
+    replacement = REPLACE_FALSE
+    for prop in sorted(set(old_props) | set(new_props)):
+        old_value = old_props.get(prop)
+        new_value = new_props.get(prop)
+        if old_value == new_value:
+            continue
+        changed.append(prop)
+        if _requires_replacement(type, prop):
+            # An intrinsic might still resolve to the same value
+            if _is_intrinsic(old_value) or _is_intrinsic(new_value):
+                replacement = _max_replacement(replacement, REPLACE_CONDITIONAL)
+            else:
+                replacement = REPLACE_TRUE
+    for key in sorted(set(old) | set(new)):
+        if key not in ('Type', 'Properties') and old.get(key) != new.get(key):
+            changed.append(key)
+    return Change('Resources', name, MODIFY, type, changed, replacement)
+
+
+def diff_templates(old, new):
+    """Compare two Templates (or template dicts) and return a list of Change.
+
+    Both sides are canonicalized first, so reordered Tags or DependsOn don't
+    show up. Entries are compared with ==, which stops at the first
+    difference, and only the ones that differ are walked. Resource changes
+    say whether they are likely to replace the resource, and resources
+    whose Ref or GetAtt target gets replaced are reported too since their
+    values will change even though their JSON didn't.
+    """
+    old = _canonical(old)
+    new = _canonical(new)
+    changes = []
+    resource_changes = collections.OrderedDict()
+    for section in SECTIONS:
+        old_section = old.get(section, {})
+        new_section = new.get(section, {})
+        if section == 'Description':
+            if old_section != new_section:
+                changes.append(Change(section, None, MODIFY, None, [], None))
+            continue
+        for name in sorted(set(old_section) | set(new_section)):
+            if name not in new_section:
+                type = old_section[name].get('Type') if section == 'Resources' else None
+                change = Change(section, name, REMOVE, type, [], None)
+            elif name not in old_section:
+                type = new_section[name].get('Type') if section == 'Resources' else None
+                change = Change(section, name, ADD, type, [], None)
+            elif old_section[name] == new_section[name]:
+                continue
+            elif section == 'Resources':
+                change = _resource_change(name, old_section[name], new_section[name])
+            else:
+                change = Change(section, name, MODIFY, None, [], None)
+            if section == 'Resources':
+                resource_changes[name] = change
+            else:
+                changes.append(change)
+
+    replaced = [name for name, change in resource_changes.iteritems()
+                if change.replacement in (REPLACE_TRUE, REPLACE_CONDITIONAL)]
+    if replaced:
+        # Only pay for the graph when something is actually being replaced
+        resources = new.get('Resources', {})
+        graph = DependencyGraph(resources)
+        queue = collections.deque(replaced)
+        while queue:
+            target = queue.popleft()
+            for name in graph.dependents(target):
+                body = resources[name]
+                values = dict((key, value) for key, value in body.iteritems()
+                              if key not in ('Type', 'Properties', 'DependsOn'))
+                values.update(body.get('Properties', {}))
+                referencing = sorted(key for key, value in values.iteritems()
+                                     if any(ref == target for kind, ref in iter_references(value)))
+                if not referencing:
+                    continue # Only a DependsOn, nothing it uses changes
+                replacement = REPLACE_FALSE
+                type = body.get('Type')
+                if any(_requires_replacement(type, prop) for prop in referencing):
+                    replacement = REPLACE_CONDITIONAL
+                existing = resource_changes.get(name)
+                if existing is None:
+                    change = Change('Resources', name, MODIFY, type, referencing, replacement)
+                elif existing.action == MODIFY:
+                    change = existing._replace(
+                        properties=sorted(set(existing.properties) | set(referencing)),
+                        replacement=_max_replacement(existing.replacement, replacement))
+                else:
+                    continue
+                if _REPLACEMENT_RANK[change.replacement] > _REPLACEMENT_RANK[
+                        existing.replacement if existing else None]:
+                    queue.append(name)
+                resource_changes[name] = change
+    changes.extend(resource_changes[name] for name in sorted(resource_changes))
+    return sorted(changes, key=lambda change: (SECTIONS.index(change.section), change.name))
@@ -0,0 +1,391 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import base64
+import collections
+import json
+
+from . import MINIFIED
+from .canonical import simplify_join
+
+class EvaluationError(ValueError):
+    pass
+
+
+PSEUDO_PARAMETERS = {
+    'AWS::AccountId': '123456789012',
+    'AWS::NotificationARNs': [],
+    'AWS::Region': 'us-east-1',
+    'AWS::StackId': 'arn:aws:cloudformation:us-east-1:123456789012:stack/stack/00000000-0000-0000-0000-000000000000',
+    'AWS::StackName': 'stack',
+}
+
+LIST_PARAMETER_TYPES = ('CommaDelimitedList', 'List<')
+
+# Marker for Ref('AWS::NoValue'), dropped from the dict or list it's in
+NO_VALUE = object()
+
+EvaluationResult = collections.namedtuple('EvaluationResult', ['conditions', 'resources', 'outputs'])
+
+
+def _intern(value, table):
+    """Hash-cons a JSON tree so equal subtrees are the same object.
+
+    Returns (value, key). Containers are keyed by the identity of their
+    already-interned children, which makes this a single linear pass.
+    """
+    if isinstance(value, dict):
+        items = []
+        key = ['d']
+        for k in sorted(value):
+            v, vkey = _intern(value[k], table)
+            items.append((k, v))
+            key.append((k, vkey))
+        key = tuple(key)
+        return table.setdefault(key, dict(items)), ('c', id(table[key]))
+    elif isinstance(value, list):
+        items = []
+        key = ['l']
+        for item in value:
+            v, vkey = _intern(item, table)
+            items.append(v)
+            key.append(vkey)
+        key = tuple(key)
+        return table.setdefault(key, items), ('c', id(table[key]))
+    return value, ('s', type(value), value)
+
+
+def is_expression(value):
+    """Is this an intrinsic function (or condition reference) that hasn't been resolved?"""
+    if isinstance(value, dict) and len(value) == 1:
+        key = next(iter(value))
+        return key in ('Ref', 'Condition') or key.startswith('Fn::')
+    return False
+
+
+def _is_concrete(value):
+    if isinstance(value, dict):
+        return not is_expression(value) and all(_is_concrete(v) for v in value.itervalues())
+    elif isinstance(value, list):
+        return all(_is_concrete(v) for v in value)
+    return True
+
+
+def _join_item(value):
+    # CloudFormation stringifies scalars in a Join, the same way as in JSON
+    if isinstance(value, basestring):
+        return value
+    elif isinstance(value, bool):
+        return 'true' if value else 'false'
+    elif isinstance(value, (int, long, float)):
+        return str(value)
+    raise EvaluationError('can\'t Join non-scalar value {!r}'.format(value))
+
+
+class Evaluator(object):
+    """Resolve intrinsic functions in a rendered template without deploying it.
+
+    Build one per template and call evaluate() once per set of parameter
+    values. The template is hash-consed up front, so subexpressions shared
+    between resources (the same Join or If repeated across launch
+    configurations, say) are resolved once per evaluate() call.
+
+    Refs to resources resolve to the logical ID unless physical_ids says
+    otherwise. GetAtt only resolves if the attribute is in attributes,
+    keyed by (logical ID, attribute name); otherwise it is left as-is, as is
+    anything built from it.
+    """
+    def __init__(self, template, pseudo_parameters=None, physical_ids=None, attributes=None, azs=None):
+        if not isinstance(template, dict):
+            template = json.loads(template.to_json(mode=MINIFIED))
+        self.template, _ = _intern(template, {})
+        self.pseudo_parameters = dict(PSEUDO_PARAMETERS)
+        self.pseudo_parameters.update(pseudo_parameters or {})
+        self.physical_ids = physical_ids or {}
+        self.attributes = attributes or {}
+        self.azs = azs or {}
+        self.resource_names = set(self.template.get('Resources', {}))
+        self.condition_defs = self.template.get('Conditions', {})
+        self.mappings = self.template.get('Mappings', {})
+
+    def _parameter_values(self, parameters, defaults=True):
+        values = {}
+        for name, definition in self.template.get('Parameters', {}).iteritems():
+            if name in parameters:
+                value = parameters[name]
+            elif defaults and 'Default' in definition:
+                value = definition['Default']
+            else:
+                continue # Only an error if something uses it
+            allowed = definition.get('AllowedValues')
+            if allowed is not None and value not in allowed:
+                raise EvaluationError('parameter {} value {!r} not in {!r}'.format(name, value, allowed))
+            if definition.get('Type', '').startswith(LIST_PARAMETER_TYPES) and isinstance(value, basestring):
+                value = value.split(',') if value else []
+            values[name] = value
+        unknown = set(parameters) - set(self.template.get('Parameters', {}))
+        if unknown:
+            raise EvaluationError('unknown parameters: {}'.format(', '.join(sorted(unknown))))
+        return values
+
+    def partial(self, parameters=None):
+        """Return a context that resolves only what parameters fully determine.
+
+        Its resolve(value) and condition(name) leave anything that depends
+        on an unknown value as an expression. Defaults aren't used, since
+        they can be overridden at deploy time.
+        """
+        return _PartialContext(self, self._parameter_values(parameters or {}, defaults=False))
+
+    def evaluate(self, parameters=None):
+        """Resolve the template for one set of parameter values.
+
+        Returns an EvaluationResult of condition values, resolved resources
+        (skipping those whose Condition is false) and resolved outputs.
+        """
+        context = _Context(self, self._parameter_values(parameters or {}))
+        conditions = dict((name, context.condition(name)) for name in self.condition_defs)
+        resources = {}
+        for name, resource in self.template.get('Resources', {}).iteritems():
+            if 'Condition' in resource and not context.condition(resource['Condition']):
+                continue
+            resources[name] = context.resolve(resource)
+        outputs = {}
+        for name, output in self.template.get('Outputs', {}).iteritems():
+            if 'Condition' in output and not context.condition(output['Condition']):
+                continue
+            outputs[name] = context.resolve(output.get('Value'))
+        return EvaluationResult(conditions, resources, outputs)
+
+
+class _Context(object):
+    def __init__(self, evaluator, parameters):
+        self.evaluator = evaluator
+        self.parameters = parameters
+        self.memo = {}
+        self.conditions = {}
+
+    def condition(self, name):
+        if name not in self.conditions:
+            if name not in self.evaluator.condition_defs:
+                raise EvaluationError('unknown condition {}'.format(name))
+            self.conditions[name] = None # Cycle guard
+            value = self.resolve(self.evaluator.condition_defs[name])
+            if not isinstance(value, bool):
+                raise EvaluationError('condition {} did not resolve to a boolean: {!r}'.format(name, value))
+            self.conditions[name] = value
+        elif self.conditions[name] is None:
+            raise EvaluationError('condition {} depends on itself'.format(name))
+        return self.conditions[name]
+
+    def resolve(self, value):
+        if not isinstance(value, (dict, list)):
+            return value
+        key = id(value)
+        if key not in self.memo:
+            self.memo[key] = self._resolve(value)
+        return self.memo[key]
+
+    def _resolve(self, value):
+        if isinstance(value, list):
+            return [v for v in (self.resolve(item) for item in value) if v is not NO_VALUE]
+        if is_expression(value):
+            fn, args = next(value.iteritems())
+            handler = getattr(self, '_fn_' + fn.replace('Fn::', '').replace('AWS::', ''), None)
+            if handler is not None:
+                return handler(args)
+        out = {}
+        for k, v in value.iteritems():
+            v = self.resolve(v)
+            if v is not NO_VALUE:
+                out[k] = v
+        return out
+
+    def _fn_Ref(self, name):
+        if name == 'AWS::NoValue':
+            return NO_VALUE
+        if name in self.parameters:
+            return self.parameters[name]
+        if name in self.evaluator.pseudo_parameters:
+            return self.evaluator.pseudo_parameters[name]
+        if name in self.evaluator.resource_names:
+            return self.evaluator.physical_ids.get(name, name)
+        if name in self.evaluator.template.get('Parameters', {}):
+            raise EvaluationError('no value for parameter {}'.format(name))
+        raise EvaluationError('Ref to unknown name {}'.format(name))
+
+    def _fn_Condition(self, name):
+        return self.condition(name)
+
+    def _fn_GetAtt(self, args):
+        name, attr = args
+        if name not in self.evaluator.resource_names:
+            raise EvaluationError('GetAtt of unknown resource {}'.format(name))
+        return self.evaluator.attributes.get((name, attr), {'Fn::GetAtt': args})
+
+    def _fn_Join(self, args):
+        delimiter, values = self.resolve(args)
+        if isinstance(values, list) and _is_concrete(values):
+            return delimiter.join(_join_item(value) for value in values)
+        return {'Fn::Join': [delimiter, values]}
+
+    def _fn_Select(self, args):
+        index, values = self.resolve(args)
+        if isinstance(values, list) and not is_expression(index):
+            try:
+                return values[int(index)]
+            except (ValueError, IndexError):
+                raise EvaluationError('bad Select index {!r} for {!r}'.format(index, values))
+        return {'Fn::Select': [index, values]}
+
+    def _fn_FindInMap(self, args):
+        args = self.resolve(args)
+        if not _is_concrete(args):
+            return {'Fn::FindInMap': args}
+        name, key, attr = args
+        try:
+            return self.evaluator.mappings[name][key][attr]
+        except KeyError:
+            raise EvaluationError('FindInMap {}/{}/{} not found'.format(name, key, attr))
+
+    def _fn_GetAZs(self, region):
+        region = self.resolve(region) or self.evaluator.pseudo_parameters['AWS::Region']
+        if region in self.evaluator.azs:
+            return list(self.evaluator.azs[region])
+        return [region + suffix for suffix in 'abc']
+
+    def _fn_Base64(self, value):
+        value = self.resolve(value)
+        if isinstance(value, basestring):
+            return base64.b64encode(value.encode('utf8') if isinstance(value, unicode) else value)
+        return {'Fn::Base64': value}
+
+    def _fn_If(self, args):
+        name, true, false = args
+        return self.resolve(true if self.condition(name) else false)
+
+    def _fn_Equals(self, args):
+        a, b = self.resolve(args)
+        if not (_is_concrete(a) and _is_concrete(b)):
+            raise EvaluationError('can not compare unresolved values {!r} and {!r}'.format(a, b))
+        return a == b
+
+    def _bool(self, value):
+        value = self.resolve(value)
+        if not isinstance(value, bool):
+            raise EvaluationError('expected a boolean, got {!r}'.format(value))
+        return value
+
+    def _fn_And(self, args):
+        return all([self._bool(arg) for arg in args])
+
+    def _fn_Or(self, args):
+        return any([self._bool(arg) for arg in args])
+
+    def _fn_Not(self, args):
+        return not self._bool(args[0])
+
+
+class _PartialContext(_Context):
+    """Resolve only what is fully determined, leaving the rest as expressions.
+
+    Parameters only resolve if given explicitly (defaults can be overridden
+    at deploy time), and pseudo-parameters, resource Refs, GetAtt and GetAZs
+    are never resolved. Conditions resolve to True, False or a simplified
+    expression.
+    """
+    def condition(self, name):
+        if name not in self.conditions:
+            if name not in self.evaluator.condition_defs:
+                raise EvaluationError('unknown condition {}'.format(name))
+            self.conditions[name] = None
+            self.conditions[name] = self.resolve(self.evaluator.condition_defs[name])
+        elif self.conditions[name] is None:
+            raise EvaluationError('condition {} depends on itself'.format(name))
+        return self.conditions[name]
+
+    def _fn_Ref(self, name):
+        if name == 'AWS::NoValue':
+            return NO_VALUE
+        if name in self.parameters:
+            return self.parameters[name]
+        if name not in self.evaluator.resource_names and name not in self.evaluator.pseudo_parameters \
+                and name not in self.evaluator.template.get('Parameters', {}):
+            raise EvaluationError('Ref to unknown name {}'.format(name))
+        return {'Ref': name}
+
+    def _fn_Condition(self, name):
+        value = self.condition(name)
+        return value if isinstance(value, bool) else {'Condition': name}
+
+    def _fn_GetAtt(self, args):
+        return {'Fn::GetAtt': args}
+
+    def _fn_GetAZs(self, region):
+        return {'Fn::GetAZs': self.resolve(region)}
+
+    def _fn_Base64(self, value):
+        return {'Fn::Base64': self.resolve(value)}
+
+    def _fn_Join(self, args):
+        delimiter, values = self.resolve(args)
+        if isinstance(values, list) and not is_expression(delimiter):
+            return simplify_join([delimiter, values])
+        return {'Fn::Join': [delimiter, values]}
+
+    def _fn_If(self, args):
+        name, true, false = args
+        value = self._fn_Condition(name)
+        if isinstance(value, bool):
+            return self.resolve(true if value else false)
+        true = self.resolve(true)
+        false = self.resolve(false)
+        # NoValue has to survive as a Ref when the branch isn't known yet
+        return {'Fn::If': [name,
+                           {'Ref': 'AWS::NoValue'} if true is NO_VALUE else true,
+                           {'Ref': 'AWS::NoValue'} if false is NO_VALUE else false]}
+
+    def _fn_Equals(self, args):
+        a, b = self.resolve(args)
+        if _is_concrete(a) and _is_concrete(b):
+            return a == b
+        return {'Fn::Equals': [a, b]}
+
+    def _fn_And(self, args):
+        values = [self.resolve(arg) for arg in args]
+        if any(value is False for value in values):
+            return False
+        values = [value for value in values if value is not True]
+        if not values:
+            return True
+        return values[0] if len(values) == 1 else {'Fn::And': values}
+
+    def _fn_Or(self, args):
+        values = [self.resolve(arg) for arg in args]
+        if any(value is True for value in values):
+            return True
+        values = [value for value in values if value is not False]
+        if not values:
+            return False
+        return values[0] if len(values) == 1 else {'Fn::Or': values}
+
+    def _fn_Not(self, args):
+        value = self.resolve(args[0])
+        if isinstance(value, bool):
+            return not value
+        return {'Fn::Not': [value]}
@@ -16,24 +16,100 @@
 # limitations under the License.
 #
 
+import weakref
+
 import troposphere
 
 from .base import StratospherePendingObject
 
 
 __all__ = ['And', 'Base64', 'Equals', 'FindInMap', 'GetAtt', 'GetAZs', 'If',
-           'Join', 'Name', 'Not', 'NoValue', 'Select', 'Ref']
+           'Join', 'Name', 'Not', 'NoValue', 'Or', 'Select', 'Ref']
+
+
+class _Uninternable(Exception):
+    pass
+
+
+def _getdata(obj):
+    if isinstance(obj, StratospherePendingObject):
+        return obj._stratosphere_name
+    if isinstance(obj, troposphere.BaseAWSObject):
+        return obj.title
+    return obj
+
+
+def _intern_key(value):
+    # Scalars are tagged with their type so 1, 1.0 and True stay distinct,
+    # but str and unicode serialize the same
+    if isinstance(value, basestring):
+        return (basestring, value)
+    if value is None or isinstance(value, (bool, int, long, float)):
+        return (type(value), value)
+    if isinstance(value, AWSHelperFn):
+        # Either interned itself, so identity is structure, or built from
+        # something unhashable in which case it is never equal to anything else
+        return value
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(_intern_key(item) for item in value))
+    if isinstance(value, dict) and not isinstance(value, StratospherePendingObject):
+        return (dict, tuple(sorted((key, _intern_key(item)) for key, item in value.iteritems())))
+    raise _Uninternable
+
+
+def _copy(value):
+    # Interned objects are shared, so they can't keep a reference to a
+    # container the caller might change later. Only called on values
+    # _intern_key accepted, so containers are plain lists, tuples and dicts.
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_copy(item) for item in value)
+    if isinstance(value, dict):
+        return dict((key, _copy(item)) for key, item in value.iteritems())
+    return value
+
+
+class _InternMeta(type):
+    """Hash-cons helper functions, so equal calls return the same object.
+
+    Helper objects are treated as immutable once built, and interned ones
+    get copies of any lists or dicts passed in. Arguments that can't be
+    keyed (like a raw troposphere object) just skip the interning.
+    """
+    def __init__(self, name, bases, d):
+        super(_InternMeta, self).__init__(name, bases, d)
+        self._interned = weakref.WeakValueDictionary()
+
+    def __call__(self, *args, **kwargs):
+        if kwargs:
+            return super(_InternMeta, self).__call__(*args, **kwargs)
+        try:
+            key = []
+            for i, arg in enumerate(args):
+                if i in self._getdata_args:
+                    # Only the name ends up in the data for these
+                    arg = _getdata(arg)
+                key.append(_intern_key(arg))
+            key = tuple(key)
+        except _Uninternable:
+            return super(_InternMeta, self).__call__(*args)
+        obj = self._interned.get(key)
+        if obj is None:
+            args = [arg if i in self._getdata_args else _copy(arg) for i, arg in enumerate(args)]
+            obj = super(_InternMeta, self).__call__(*args)
+            self._interned[key] = obj
+        return obj
 
 
 class AWSHelperFn(troposphere.AWSHelperFn):
-    def getdata(self, obj):
-        if isinstance(obj, StratospherePendingObject):
-            return obj._stratosphere_name
-        return super(AWSHelperFn, self).getdata(obj)
+    __metaclass__ = _InternMeta
 
+    # Positional arguments passed through getdata(), so objects only matter by name
+    _getdata_args = ()
 
-# Not really a function, but close enough
-NoValue = troposphere.Ref('AWS::NoValue')
+    def getdata(self, obj):
+        return _getdata(obj)
 
 
 # Functions not implemented in troposphere
@@ -67,11 +143,11 @@ class Base64(AWSHelperFn, troposphere.Base64):
 
 
 class FindInMap(AWSHelperFn, troposphere.FindInMap):
-    pass
+    _getdata_args = (0,)
 
 
 class GetAtt(AWSHelperFn, troposphere.GetAtt):
-    pass
+    _getdata_args = (0,)
 
 
 class GetAZs(AWSHelperFn, troposphere.GetAZs):
@@ -79,7 +155,7 @@ class GetAZs(AWSHelperFn, troposphere.GetAZs):
 
 
 class If(AWSHelperFn, troposphere.If):
-    pass
+    _getdata_args = (0,)
 
 
 class Join(AWSHelperFn, troposphere.Join):
@@ -87,12 +163,20 @@ class Join(AWSHelperFn, troposphere.Join):
 
 
 class Name(AWSHelperFn, troposphere.Name):
+    _getdata_args = (0,)
+
+
+class Or(AWSHelperFn, troposphere.Or):
     pass
 
 
 class Ref(AWSHelperFn, troposphere.Ref):
-    pass
+    _getdata_args = (0,)
 
 
 class Select(AWSHelperFn, troposphere.Select):
     pass
+
+
+# Not really a function, but close enough
+NoValue = Ref('AWS::NoValue')
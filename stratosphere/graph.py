@@ -0,0 +1,252 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import collections
+
+import troposphere
+
+from .base import StratospherePendingObject
+from .compact import CompactResource
+
+
+class CycleError(ValueError):
+    def __init__(self, cycle):
+        self.cycle = cycle
+        super(CycleError, self).__init__('dependency cycle: {}'.format(' -> '.join(cycle + cycle[:1])))
+
+
+def resource_body(obj):
+    """Return the JSON-level dict for a resource, without running validation."""
+    if isinstance(obj, (troposphere.BaseAWSObject, CompactResource)):
+        return obj.resource
+    if hasattr(obj, 'JSONrepr'):
+        return obj.JSONrepr()
+    return obj
+
+
+def iter_references(value):
+    """Yield (kind, name) for every Ref and GetAtt inside a value.
+
+    Works on both object trees (helper functions, troposphere objects,
+    pending objects) and plain JSON dicts. Pending objects count as a Ref.
+    Walked iteratively so deep Join trees don't hit the recursion limit.
+    """
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, StratospherePendingObject):
+            yield 'Ref', value._stratosphere_name
+        elif isinstance(value, dict):
+            if len(value) == 1:
+                if 'Ref' in value and isinstance(value['Ref'], basestring):
+                    yield 'Ref', value['Ref']
+                    continue
+                getatt = value.get('Fn::GetAtt')
+                if isinstance(getatt, (list, tuple)) and getatt:
+                    yield 'GetAtt', getatt[0]
+                    continue
+            stack.extend(value.itervalues())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif isinstance(value, (troposphere.BaseAWSObject, CompactResource)):
+            stack.append(value.resource)
+        elif isinstance(value, troposphere.AWSHelperFn) and hasattr(value, 'data'):
+            stack.append(value.data)
+        elif hasattr(value, 'JSONrepr'):
+            stack.append(value.JSONrepr())
+
+
+def _iter_dicts(value):
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            yield value
+            stack.extend(value.itervalues())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+
+
+def iter_condition_references(value):
+    """Yield the name of every condition used in plain JSON data.
+
+    Covers Condition attributes on resources and outputs, Fn::If, and
+    {"Condition": name} inside other conditions.
+    """
+    for d in _iter_dicts(value):
+        if isinstance(d.get('Condition'), basestring):
+            yield d['Condition']
+        args = d.get('Fn::If')
+        if isinstance(args, list) and args and isinstance(args[0], basestring):
+            yield args[0]
+
+
+def iter_mapping_references(value):
+    """Yield the name of every mapping used by Fn::FindInMap in plain JSON data."""
+    for d in _iter_dicts(value):
+        args = d.get('Fn::FindInMap')
+        if isinstance(args, list) and args and isinstance(args[0], basestring):
+            yield args[0]
+
+
+class DependencyGraph(object):
+    """An index of dependencies between resources.
+
+    Edges come from DependsOn, Ref and GetAtt. Only edges between the given
+    resources are kept, so references to parameters and pseudo-parameters
+    are ignored.
+    """
+    def __init__(self, resources):
+        self._deps = collections.OrderedDict()
+        self._rdeps = collections.OrderedDict()
+        for name in sorted(resources):
+            self._deps[name] = {}
+            self._rdeps[name] = {}
+        for name, obj in resources.iteritems():
+            body = resource_body(obj)
+            depends_on = body.get('DependsOn', [])
+            if isinstance(depends_on, basestring):
+                depends_on = [depends_on]
+            for target in depends_on:
+                self._add(name, target, 'DependsOn')
+            for key, value in body.iteritems():
+                if key == 'DependsOn':
+                    continue
+                for kind, target in iter_references(value):
+                    self._add(name, target, kind)
+
+    @classmethod
+    def from_template(cls, template):
+        if hasattr(template, 'materialize'):
+            template.materialize()
+        return cls(template.resources)
+
+    def _add(self, source, target, kind):
+        if target not in self._deps:
+            return
+        self._deps[source].setdefault(target, set()).add(kind)
+        self._rdeps[target].setdefault(source, set()).add(kind)
+
+    def __contains__(self, name):
+        return name in self._deps
+
+    def __len__(self):
+        return len(self._deps)
+
+    @property
+    def nodes(self):
+        return list(self._deps)
+
+    def edges(self):
+        """Yield (source, target, kinds) for every edge."""
+        for source, targets in self._deps.iteritems():
+            for target in sorted(targets):
+                yield source, target, targets[target]
+
+    def _closure(self, index, name):
+        seen = set()
+        queue = collections.deque([name])
+        while queue:
+            for other in index[queue.popleft()]:
+                if other not in seen:
+                    seen.add(other)
+                    queue.append(other)
+        seen.discard(name)
+        return sorted(seen)
+
+    def dependencies(self, name, recursive=False):
+        """Return the resources name depends on."""
+        if recursive:
+            return self._closure(self._deps, name)
+        return sorted(self._deps[name])
+
+    def dependents(self, name, recursive=False):
+        """Return the resources that depend on name."""
+        if recursive:
+            return self._closure(self._rdeps, name)
+        return sorted(self._rdeps[name])
+
+    def topological_order(self):
+        """Return resource names with every resource after its dependencies.
+
+        Ties are broken by name so the order is stable. Raises CycleError if
+        the graph has a cycle.
+        """
+        remaining = dict((name, len(deps)) for name, deps in self._deps.iteritems())
+        ready = collections.deque(sorted(name for name, count in remaining.iteritems() if count == 0))
+        order = []
+        while ready:
+            name = ready.popleft()
+            order.append(name)
+            for dependent in sorted(self._rdeps[name]):
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) != len(self._deps):
+            raise CycleError(self.find_cycles()[0])
+        return order
+
+    def find_cycles(self):
+        """Return every cycle as a list of names, using Tarjan's algorithm.
+
+        Each strongly connected component with more than one resource (or a
+        resource that depends on itself) is reported once.
+        """
+        index = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        cycles = []
+        counter = 0
+        for root in self._deps:
+            if root in index:
+                continue
+            # Iterative DFS, each frame is (node, iterator over its deps)
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(sorted(self._deps[root])))]
+            while work:
+                node, children = work[-1]
+                for child in children:
+                    if child not in index:
+                        index[child] = lowlink[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(sorted(self._deps[child]))))
+                        break
+                    elif child in on_stack:
+                        lowlink[node] = min(lowlink[node], index[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        if len(component) > 1 or node in self._deps[node]:
+                            cycles.append(sorted(component))
+        return cycles
@@ -0,0 +1,38 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# CloudFormation service limits
+# http://docs.aws.amazon.com/AWSCloudFormation/latest/UserGuide/cloudformation-limits.html
+
+MAX_RESOURCES = 200
+MAX_PARAMETERS = 60
+MAX_OUTPUTS = 60
+MAX_MAPPINGS = 100
+
+# Tags per resource
+MAX_TAGS = 50
+
+# Template body passed inline vs. uploaded to S3
+MAX_BODY_SIZE = 51200
+MAX_S3_BODY_SIZE = 460800
+
+# Rules per security group, counted separately for ingress and egress
+MAX_SECURITY_GROUP_RULES = 50
+
+# Instance UserData, after any compression but before base64
+MAX_USER_DATA_SIZE = 16384
@@ -0,0 +1,200 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+
+import troposphere
+
+from . import Output, Parameter, Template, autoscaling, cloudformation, ec2, elasticloadbalancing, iam
+from .base import StratospherePendingObject, StratosphereObject
+from . import functions
+
+
+def _unary(cls):
+    return lambda args: cls(args)
+
+
+def _nary(cls, count=None):
+    def build(args):
+        if not isinstance(args, list) or (count is not None and len(args) != count):
+            raise ValueError
+        return cls(*args)
+    return build
+
+
+# Intrinsic function name to a builder taking the JSON arguments
+FUNCTIONS = {
+    'Ref': _unary(functions.Ref),
+    'Fn::And': _nary(functions.And),
+    'Fn::Base64': _unary(functions.Base64),
+    'Fn::Equals': _nary(functions.Equals, 2),
+    'Fn::FindInMap': _nary(functions.FindInMap, 3),
+    'Fn::GetAtt': _nary(functions.GetAtt, 2),
+    'Fn::GetAZs': _unary(functions.GetAZs),
+    'Fn::If': _nary(functions.If, 3),
+    'Fn::Join': _nary(functions.Join, 2),
+    'Fn::Not': _nary(functions.Not, 1),
+    'Fn::Or': _nary(functions.Or),
+    'Fn::Select': _nary(functions.Select, 2),
+}
+
+# Resource attributes that aren't properties
+ATTRIBUTES = ('Condition', 'DeletionPolicy', 'DependsOn', 'Metadata', 'UpdatePolicy')
+
+
+def _object_pairs(pairs):
+    if len(pairs) == 1:
+        key, value = pairs[0]
+        build = FUNCTIONS.get(key)
+        if build is not None:
+            try:
+                return build(value)
+            except (ValueError, TypeError):
+                pass # Not a shape we know, keep it as data
+    return dict(pairs)
+
+
+def loads(s):
+    """Parse template JSON, with intrinsic functions as stratosphere.functions objects."""
+    return json.loads(s, object_pairs_hook=_object_pairs)
+
+
+class RawResource(StratosphereObject, troposphere.AWSObject):
+    """A resource kept as its JSON body, for types there is no class for."""
+    props = {}
+
+    def __init__(self, name, body, template=None):
+        self.name = name
+        self.type = body.get('Type')
+        troposphere.AWSObject.__init__(self, name)
+        self.properties = body.get('Properties', {})
+        self.resource = body
+        self.template = template
+
+    def JSONrepr(self):
+        return self.resource
+
+    def compact(self):
+        return self
+
+
+class _LoadedPendingObject(StratospherePendingObject):
+    def __init__(self, loader, name, type, body):
+        self._loader = loader
+        super(_LoadedPendingObject, self).__init__(name, type, body)
+
+    def to_object(self):
+        return self._loader.resource(self._stratosphere_name, dict(self))
+
+
+def resource_types(cls=Template):
+    """Map resource Type to class, from cls.STRATOSPHERE_TYPES() and then every resource class in stratosphere."""
+    types = {}
+    for module in (autoscaling, cloudformation, ec2, elasticloadbalancing, iam):
+        for value in vars(module).itervalues():
+            if isinstance(value, type) and issubclass(value, StratosphereObject) \
+                    and issubclass(value, troposphere.AWSObject) and getattr(value, 'type', None):
+                types.setdefault(value.type, value)
+    for value in cls.STRATOSPHERE_TYPES().itervalues():
+        if getattr(value, 'type', None):
+            types[value.type] = value
+    return types
+
+
+class Loader(object):
+    """Turn parsed template JSON into stratosphere objects.
+
+    Properties are set as they are in the JSON rather than going through
+    troposphere's validation (which would turn true into "true" and wants
+    nested property objects), so what comes out serializes the same as what
+    went in. Class-level defaults are not applied either.
+    """
+    def __init__(self, cls=Template):
+        self.cls = cls
+        self.types = resource_types(cls)
+
+    def _build(self, klass, name):
+        obj = klass.__new__(klass)
+        obj.name = name
+        troposphere.BaseAWSObject.__init__(obj, name)
+        obj.template = None
+        return obj
+
+    def resource(self, name, body):
+        klass = self.types.get(body.get('Type'))
+        props = body.get('Properties') or {}
+        # troposphere drops attributes from resources without properties
+        if klass is None or (not props and len(body) > 1) or \
+                set(body) - set(ATTRIBUTES) - set(['Type', 'Properties']):
+            return RawResource(name, body)
+        obj = self._build(klass, name)
+        obj.properties.update(props)
+        for key in ATTRIBUTES:
+            if key in body:
+                obj.resource[key] = body[key]
+        return obj
+
+    def declaration(self, klass, name, body):
+        obj = self._build(klass, name)
+        obj.properties.update(body)
+        return obj
+
+    def load(self, data, lazy=False, template=None):
+        """Fill a Template (a new self.cls by default) from parsed JSON.
+
+        With lazy, resources stay pending until something asks for them, see
+        Template.materialize().
+        """
+        if template is None:
+            template = self.cls()
+        unknown = set(data) - set(['AWSTemplateFormatVersion', 'Description', 'Parameters', 'Mappings',
+                                   'Conditions', 'Resources', 'Outputs'])
+        if unknown:
+            raise ValueError('unknown template sections: {}'.format(', '.join(sorted(unknown))))
+        if 'AWSTemplateFormatVersion' in data:
+            template.add_version(data['AWSTemplateFormatVersion'])
+        if 'Description' in data:
+            template.add_description(data['Description'])
+        for name, body in sorted(data.get('Parameters', {}).iteritems()):
+            template.add_parameter(self.declaration(Parameter, name, body))
+        for name, body in sorted(data.get('Mappings', {}).iteritems()):
+            template.add_mapping(name, body)
+        for name, body in sorted(data.get('Conditions', {}).iteritems()):
+            template.add_condition(name, body)
+        for name, body in sorted(data.get('Resources', {}).iteritems()):
+            if lazy:
+                klass = self.types.get(body.get('Type'), RawResource)
+                template._pending[name] = _LoadedPendingObject(self, name, klass, body)
+            else:
+                template.add_resource(self.resource(name, body))
+        for name, body in sorted(data.get('Outputs', {}).iteritems()):
+            template.add_output(self.declaration(Output, name, body))
+        return template
+
+
+def load_template(source, cls=Template, lazy=False):
+    """Load CloudFormation JSON (a string or file-like object) into a Template.
+
+    Intrinsic functions become stratosphere.functions objects, and
+    resources become instances of the class for their Type from
+    cls.STRATOSPHERE_TYPES(), or any other stratosphere resource class,
+    falling back to RawResource. cls must be constructible with no
+    arguments, and its own magic methods run before the JSON is added.
+    """
+    data = loads(source if isinstance(source, basestring) else source.read())
+    return Loader(cls).load(data, lazy=lazy)
@@ -0,0 +1,188 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import collections
+import multiprocessing
+
+
+# The matrix for the current render, inherited by forked workers like
+# stratosphere.render._TEMPLATES.
+_MATRIX = []
+
+_MISSING = object()
+# Key used in a read set when a magic method looked at the whole input table
+_KEYS = object()
+
+
+class TrackingInputs(collections.Mapping):
+    """Read-only view of a variant's inputs that records what gets looked at.
+
+    reads maps each key read to the value seen, or _MISSING if it wasn't
+    there. Iterating records the set of keys as well as every value.
+    """
+    def __init__(self, inputs):
+        self._inputs = inputs
+        self.reads = {}
+
+    def __getitem__(self, key):
+        value = self._inputs.get(key, _MISSING)
+        self.reads[key] = value
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        self.reads[_KEYS] = frozenset(self._inputs)
+        for key, value in self._inputs.iteritems():
+            self.reads[key] = value
+        return iter(self._inputs)
+
+    def __len__(self):
+        self.reads[_KEYS] = frozenset(self._inputs)
+        return len(self._inputs)
+
+    def matches(self, reads):
+        """Check if these inputs would give the same values for a recorded read set."""
+        for key, value in reads:
+            if key is _KEYS:
+                if frozenset(self._inputs) != value:
+                    return False
+            elif self._inputs.get(key, _MISSING) != value:
+                return False
+        return True
+
+
+class _MatrixTemplate(object):
+    # Mixed in ahead of the user's Template class. _matrix_memo is set on the
+    # generated subclass so every variant built from it shares one memo of
+    # magic method key -> [(reads, produced)].
+    _matrix_memo = None
+    _matrix_recording = None
+
+    def _process_magic(self, key, lazy=False):
+        entries = self._matrix_memo.setdefault(key, [])
+        for reads, produced in entries:
+            if self.inputs.matches(reads):
+                for section, name, obj in produced:
+                    d = getattr(self, section)
+                    if section in ('resources', 'parameters', 'outputs') and name in d:
+                        self.handle_duplicate_key(name)
+                    d[name] = obj
+                return
+        self.inputs.reads = {}
+        self._matrix_recording = []
+        try:
+            super(_MatrixTemplate, self)._process_magic(key, lazy)
+            entries.append((tuple(self.inputs.reads.iteritems()), self._matrix_recording))
+        finally:
+            self._matrix_recording = None
+
+    def _record(self, section, name, obj):
+        if self._matrix_recording is not None:
+            self._matrix_recording.append((section, name, obj))
+
+    def _update(self, d, values):
+        values = super(_MatrixTemplate, self)._update(d, values)
+        section = 'outputs' if d is self.outputs else 'parameters' if d is self.parameters else 'resources'
+        for value in (values if isinstance(values, list) else [values]):
+            self._record(section, value.title, value)
+        return values
+
+    def add_mapping(self, name, mapping):
+        super(_MatrixTemplate, self).add_mapping(name, mapping)
+        self._record('mappings', name, mapping)
+
+    def add_condition(self, name, condition):
+        super(_MatrixTemplate, self).add_condition(name, condition)
+        self._record('conditions', name, condition)
+
+
+def _variant_items(variants):
+    if isinstance(variants, collections.Mapping):
+        variants = variants.iteritems()
+    items = []
+    seen = set()
+    for name, inputs in variants:
+        if name in seen:
+            raise ValueError('duplicate variant name "{}"'.format(name))
+        seen.add(name)
+        items.append((name, inputs))
+    return items
+
+
+def build_matrix(cls, variants):
+    """Build one instance of a Template class per set of inputs.
+
+    variants is a dict (or list of pairs) of variant name to inputs dict,
+    which magic methods see as self.inputs. Each magic method's output is
+    reused for every later variant that has the same values for the inputs
+    it actually read, so methods that don't look at self.inputs only run
+    once. This relies on magic methods depending on nothing but self and
+    self.inputs; objects are shared between the variants, so don't mutate
+    them afterwards. Returns an OrderedDict of variant name to Template.
+    """
+    matrix_cls = type(cls.__name__, (_MatrixTemplate, cls), {
+        '__doc__': cls.__doc__,
+        '__module__': cls.__module__,
+        '_matrix_memo': {},
+    })
+    templates = collections.OrderedDict()
+    for name, inputs in _variant_items(variants):
+        templates[name] = matrix_cls(inputs=TrackingInputs(inputs))
+    return templates
+
+
+def _render_chunk(args):
+    start, stop, mode = args
+    cls, variants = _MATRIX
+    return [(name, template.to_json(mode=mode))
+            for name, template in build_matrix(cls, variants[start:stop]).iteritems()]
+
+
+def render_matrix(cls, variants, processes=1, mode=None):
+    """Render every variant of a Template class to JSON.
+
+    Returns an OrderedDict of variant name to JSON, see build_matrix() for
+    how work is shared. With more than one process the variants are split
+    into contiguous chunks, one per process, so each worker only shares work
+    within its own chunk; order variants so similar ones sit together. mode
+    is passed through to Template.to_json().
+    """
+    variants = _variant_items(variants)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(variants)))
+    size = -(-len(variants) // processes) if variants else 0
+    tasks = [(start, start + size, mode) for start in xrange(0, len(variants), size or 1)]
+    _MATRIX[:] = [cls, variants]
+    try:
+        if processes == 1:
+            chunks = [_render_chunk(task) for task in tasks]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                chunks = pool.map(_render_chunk, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        _MATRIX[:] = []
+    results = collections.OrderedDict()
+    for chunk in chunks:
+        results.update(chunk)
+    return results
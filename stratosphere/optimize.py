@@ -0,0 +1,118 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+
+from .evaluate import Evaluator
+from .graph import iter_condition_references, iter_mapping_references, iter_references
+
+
+def _prune_depends_on(resource, names):
+    depends_on = resource.get('DependsOn')
+    if depends_on is None:
+        return resource
+    resource = dict(resource)
+    if isinstance(depends_on, basestring):
+        depends_on = [depends_on]
+        single = True
+    else:
+        single = False
+    depends_on = [name for name in depends_on if name in names]
+    if not depends_on:
+        del resource['DependsOn']
+    else:
+        resource['DependsOn'] = depends_on[0] if single else depends_on
+    return resource
+
+
+def optimize(template, parameters=None):
+    """Fold constant expressions in a template and drop what that makes dead.
+
+    parameters fixes the values of some template parameters; they are
+    substituted everywhere and end up removed, so don't pass them at deploy
+    time. Mappings are treated as constants. Joins of literals are merged,
+    If/Equals/And/Or/Not trees are simplified, resources and outputs gated
+    on a condition that is now always false are dropped (along with
+    DependsOn entries pointing at them), and conditions, mappings and
+    parameters nothing uses any more are removed. Returns a new template
+    dict.
+    """
+    evaluator = Evaluator(template)
+    context = evaluator.partial(parameters)
+    src = evaluator.template
+
+    conditions = dict((name, context.condition(name)) for name in evaluator.condition_defs)
+
+    def gated(section):
+        out = {}
+        for name, value in src.get(section, {}).iteritems():
+            condition = value.get('Condition')
+            if condition is not None:
+                if condition not in conditions:
+                    raise ValueError('{} {} uses unknown condition {}'.format(section, name, condition))
+                if conditions[condition] is False:
+                    continue
+            value = context.resolve(value)
+            if condition is not None and conditions[condition] is True:
+                value = dict(value)
+                del value['Condition']
+            out[name] = value
+        return out
+
+    resources = gated('Resources')
+    for name, resource in resources.iteritems():
+        resources[name] = _prune_depends_on(resource, resources)
+    outputs = gated('Outputs')
+
+    # Only undecided conditions are left, any that became an alias of
+    # another condition get its definition instead
+    undecided = {}
+    for name, value in conditions.iteritems():
+        if isinstance(value, bool):
+            continue
+        while isinstance(value, dict) and value.keys() == ['Condition']:
+            value = conditions[value['Condition']]
+        undecided[name] = value
+    used_conditions = set()
+    stack = [resources, outputs]
+    while stack:
+        for name in iter_condition_references(stack.pop()):
+            if name in undecided and name not in used_conditions:
+                used_conditions.add(name)
+                stack.append(undecided[name])
+
+    t = {}
+    for key in ('AWSTemplateFormatVersion', 'Description'):
+        if key in src:
+            t[key] = src[key]
+    live = [resources, outputs, [undecided[name] for name in used_conditions]]
+    if used_conditions:
+        t['Conditions'] = dict((name, undecided[name]) for name in used_conditions)
+    used_mappings = set(iter_mapping_references(live))
+    mappings = dict((name, value) for name, value in src.get('Mappings', {}).iteritems() if name in used_mappings)
+    if mappings:
+        t['Mappings'] = mappings
+    used_names = set(name for kind, name in iter_references(live))
+    params = dict((name, value) for name, value in src.get('Parameters', {}).iteritems() if name in used_names)
+    if params:
+        t['Parameters'] = params
+    t['Resources'] = resources
+    if outputs:
+        t['Outputs'] = outputs
+    # The evaluator shares equal subtrees, give the caller something safe to mutate
+    return json.loads(json.dumps(t))
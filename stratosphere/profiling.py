@@ -0,0 +1,103 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import collections
+import gc
+import time
+
+
+ProfileEntry = collections.namedtuple('ProfileEntry', ['phase', 'key', 'calls', 'seconds', 'allocations'])
+
+
+class _Measurement(object):
+    def __init__(self, profiler, phase, key):
+        self.profiler = profiler
+        self.phase = phase
+        self.key = key
+
+    def __enter__(self):
+        # With the collector off, the generation 0 count only moves on
+        # allocation/deallocation of tracked objects, so it is a cheap
+        # net allocation counter.
+        self.gc_enabled = gc.isenabled()
+        gc.disable()
+        self.count = gc.get_count()[0]
+        self.start = time.time()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        elapsed = time.time() - self.start
+        allocations = gc.get_count()[0] - self.count
+        if self.gc_enabled:
+            gc.enable()
+        self.profiler.record(self.phase, self.key, elapsed, allocations)
+
+
+class _NullMeasurement(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+NULL_MEASUREMENT = _NullMeasurement()
+
+
+class Profiler(object):
+    """Collects wall time and allocation counts while a Template is built.
+
+    Pass one to Template(profiler=...). Phases recorded are ``call`` (keyed
+    by magic method), and ``to_object``, ``add`` and ``post_add`` (keyed by
+    object type). Allocations are the net number of GC-tracked objects
+    created, so things freed before the phase ends don't count.
+    """
+    def __init__(self, name=None):
+        self.name = name
+        self._data = collections.OrderedDict()
+
+    def measure(self, phase, key):
+        return _Measurement(self, phase, key)
+
+    def record(self, phase, key, seconds, allocations=0):
+        entry = self._data.get((phase, key))
+        if entry is None:
+            entry = self._data[(phase, key)] = [0, 0.0, 0]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] += allocations
+
+    def report(self):
+        """Return a list of ProfileEntry, most expensive first."""
+        entries = [ProfileEntry(phase, key, calls, seconds, allocations)
+                   for (phase, key), (calls, seconds, allocations) in self._data.iteritems()]
+        entries.sort(key=lambda entry: entry.seconds, reverse=True)
+        return entries
+
+    def phases(self):
+        """Return a dict of phase to total seconds."""
+        totals = collections.OrderedDict()
+        for (phase, key), (calls, seconds, allocations) in self._data.iteritems():
+            totals[phase] = totals.get(phase, 0.0) + seconds
+        return totals
+
+    def to_collapsed(self):
+        """Export in the collapsed stack format used by flamegraph.pl, in microseconds."""
+        root = self.name or 'Template'
+        lines = []
+        for (phase, key), (calls, seconds, allocations) in self._data.iteritems():
+            lines.append('{};{};{} {}'.format(root, phase, key, int(seconds * 1000000)))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,174 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import argparse
+import collections
+import importlib
+import inspect
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import traceback
+
+from .cache import BuildCache
+
+
+RenderResult = collections.namedtuple('RenderResult', ['name', 'path', 'duration', 'error', 'cached'])
+
+# Templates for the current render, inherited by forked workers so that
+# locally-defined classes don't need to be importable (or picklable).
+_TEMPLATES = []
+
+
+def find_templates(target):
+    """Expand a Template class, module or import string into Template classes.
+
+    Strings are either ``package.module`` or ``package.module:ClassName``.
+    For modules, only Template subclasses defined in that module are used so
+    shared base templates imported from elsewhere aren't rendered twice.
+    """
+    from . import Template
+    if isinstance(target, basestring):
+        module_name, _, class_name = target.partition(':')
+        target = importlib.import_module(module_name)
+        if class_name:
+            target = getattr(target, class_name)
+    if inspect.isclass(target):
+        return [target]
+    templates = []
+    for value in vars(target).itervalues():
+        if inspect.isclass(value) and issubclass(value, Template) and value is not Template \
+                and value.__module__ == target.__name__:
+            templates.append(value)
+    return sorted(templates, key=lambda cls: cls.__name__)
+
+
+def _write_file(path, write):
+    """Call write with a file object and move the result to path once it succeeds.
+
+    Serialization errors (like a missing required property) surface half way
+    through writing, so this keeps them from leaving a truncated file over
+    the last good output.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.{}.'.format(os.path.basename(path)),
+                               suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            write(f)
+        # mkstemp creates files only the owner can read
+        os.chmod(tmp, 0644)
+        os.rename(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _render_one(args):
+    index, output_dir, cache, mode = args
+    cls = _TEMPLATES[index]
+    path = os.path.join(output_dir, '{}.json'.format(cls.__name__))
+    start = time.time()
+    cached = False
+    try:
+        if cache is None:
+            template = cls()
+            _write_file(path, lambda f: template.write_json(f, mode=mode))
+        else:
+            key = cache.key(cls, {'mode': mode} if mode else None)
+            data = cache.get(key)
+            cached = data is not None
+            if not cached:
+                data = cls().to_json(mode=mode)
+                cache.put(key, data)
+            _write_file(path, lambda f: f.write(data))
+    except Exception:
+        return RenderResult(cls.__name__, None, time.time() - start, traceback.format_exc(), cached)
+    return RenderResult(cls.__name__, path, time.time() - start, None, cached)
+
+
+def render_templates(targets, output_dir, processes=None, cache=None, mode=None):
+    """Render Template classes to JSON files in output_dir across a process pool.
+
+    Returns a list of RenderResult in the same order as the expanded targets.
+    A failing template records its traceback in ``error`` rather than aborting
+    the rest of the render. Set processes=1 to render in-process. If a
+    BuildCache is given, templates whose source hasn't changed are copied out
+    of the cache instead of being instantiated. mode is passed through to
+    Template.to_json().
+    """
+    templates = []
+    for target in targets:
+        templates.extend(find_templates(target))
+    seen = set()
+    for cls in templates:
+        if cls.__name__ in seen:
+            raise ValueError('duplicate template name "{}"'.format(cls.__name__))
+        seen.add(cls.__name__)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    _TEMPLATES[:] = templates
+    try:
+        tasks = [(i, output_dir, cache, mode) for i in xrange(len(templates))]
+        if processes == 1 or len(tasks) <= 1:
+            results = [_render_one(task) for task in tasks]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_render_one, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        _TEMPLATES[:] = []
+    if cache is not None:
+        cache.evict()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render Stratosphere templates to JSON.')
+    parser.add_argument('targets', nargs='+', metavar='TARGET',
+                        help='module or module:Class to render')
+    parser.add_argument('-o', '--output', default='.', help='output directory')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: one per core)')
+    parser.add_argument('--mode', choices=['pretty', 'minified', 'canonical'], default=None,
+                        help='output format (default: pretty)')
+    parser.add_argument('--cache', metavar='DIR', help='build cache directory')
+    parser.add_argument('--cache-size', type=int, default=64, metavar='MB',
+                        help='maximum build cache size in megabytes (default: 64)')
+    args = parser.parse_args(argv)
+    sys.path.insert(0, os.getcwd())
+    cache = BuildCache(args.cache, args.cache_size*1024*1024) if args.cache else None
+    results = render_templates(args.targets, args.output, processes=args.jobs, cache=cache,
+                               mode=args.mode)
+    failed = 0
+    for result in results:
+        if result.error:
+            failed += 1
+            sys.stderr.write('{} failed after {:.3f}s:\n{}'.format(result.name, result.duration, result.error))
+        else:
+            sys.stdout.write('{} -> {} ({:.3f}s{})\n'.format(result.name, result.path, result.duration,
+                                                          ', cached' if result.cached else ''))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
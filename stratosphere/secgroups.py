@@ -0,0 +1,215 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import bisect
+import collections
+import json
+
+from . import limits
+from .cidr import collapse, format_cidr, parse_cidr, supernet
+from .split import template_dict
+
+
+GroupReport = collections.namedtuple('GroupReport', ['name', 'direction', 'before', 'after', 'within_limit'])
+SecurityGroupAnalysis = collections.namedtuple('SecurityGroupAnalysis', ['template', 'groups', 'duplicates'])
+
+ALL = '-1'
+PROTOCOLS = {'6': 'tcp', '17': 'udp', '1': 'icmp'}
+# Protocols whose ports form ranges that can be merged
+RANGED = ('tcp', 'udp')
+
+_RULE_KEYS = frozenset(['IpProtocol', 'FromPort', 'ToPort', 'CidrIp'])
+
+_DIRECTIONS = (('SecurityGroupIngress', 'ingress', 'AWS::EC2::SecurityGroupIngress'),
+               ('SecurityGroupEgress', 'egress', 'AWS::EC2::SecurityGroupEgress'))
+
+
+def _parse_rule(rule):
+    """Return (protocol, block, (from, to)) for a literal CIDR rule, or None for anything else."""
+    if not isinstance(rule, dict) or set(rule) - _RULE_KEYS or 'CidrIp' not in rule:
+        return None
+    if any(isinstance(value, (dict, list)) for value in rule.itervalues()):
+        return None # Intrinsic functions
+    try:
+        protocol = str(rule.get('IpProtocol', ALL)).lower()
+        protocol = PROTOCOLS.get(protocol, protocol)
+        block = parse_cidr(rule['CidrIp'])
+        ports = (int(rule.get('FromPort', -1)), int(rule.get('ToPort', -1)))
+    except (ValueError, TypeError):
+        return None
+    if protocol not in RANGED:
+        if protocol != 'icmp':
+            ports = (-1, -1) # Meaningless for anything else
+        elif ports[0] == -1:
+            ports = (-1, -1) # All ICMP types
+    elif ports[0] > ports[1]:
+        return None
+    return protocol, block, ports
+
+
+def _merge_ports(protocol, ports):
+    ports = sorted(set(ports))
+    if protocol not in RANGED:
+        return [(-1, -1)] if (-1, -1) in ports else ports
+    merged = [ports[0]]
+    for start, end in ports[1:]:
+        if start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _covers(protocol, merged, ports):
+    """Check if a normalized port list from _merge_ports covers ports."""
+    if protocol not in RANGED:
+        return (-1, -1) in merged or ports in merged
+    i = bisect.bisect_right(merged, (ports[0], float('inf'))) - 1
+    return i >= 0 and merged[i][0] <= ports[0] and ports[1] <= merged[i][1]
+
+
+def _compact_pass(index):
+    # Merge port ranges of rules with the same protocol and block
+    for protocol, blocks in index.iteritems():
+        for block, ports in blocks.iteritems():
+            blocks[block] = _merge_ports(protocol, ports)
+    # Drop rules covered by a rule for an enclosing block. Walks the (at most
+    # 32) enclosing blocks of each rule, so this stays near-linear.
+    everything = index.get(ALL, {})
+    for protocol, blocks in index.iteritems():
+        for block in blocks.keys():
+            covered = []
+            for prefixlen in xrange(block[1] - (1 if protocol == ALL else 0), -1, -1):
+                if supernet(block, prefixlen) in everything:
+                    covered = blocks[block]
+                    break
+            else:
+                for prefixlen in xrange(block[1] - 1, -1, -1):
+                    outer = blocks.get(supernet(block, prefixlen))
+                    if outer:
+                        covered.extend(ports for ports in blocks[block] if _covers(protocol, outer, ports))
+            if covered:
+                remaining = [ports for ports in blocks[block] if ports not in covered]
+                if remaining:
+                    blocks[block] = remaining
+                else:
+                    del blocks[block]
+    # Merge blocks that share the same protocol and ports
+    for protocol, blocks in index.iteritems():
+        by_ports = collections.defaultdict(list)
+        for block, ports_list in blocks.iteritems():
+            for ports in ports_list:
+                by_ports[ports].append(block)
+        blocks.clear()
+        for ports, members in by_ports.iteritems():
+            for block in collapse(members):
+                blocks.setdefault(block, []).append(ports)
+
+
+def _count(index):
+    return sum(len(ports) for blocks in index.itervalues() for ports in blocks.itervalues())
+
+
+def compact_rules(rules):
+    """Return an equivalent, minimal list of security group rule dicts.
+
+    Rules with a literal CidrIp are merged: port ranges that touch or
+    overlap are joined, rules covered by a rule for an enclosing block (or
+    an all-traffic rule) are dropped, and blocks with the same protocol and
+    ports are collapsed into their supernets. Anything else (source
+    security groups, intrinsic functions) is kept as-is, minus exact
+    duplicates.
+    """
+    index = collections.defaultdict(lambda: collections.defaultdict(list))
+    opaque = collections.OrderedDict()
+    string_ports = False
+    for rule in rules:
+        parsed = _parse_rule(rule)
+        if parsed is None:
+            opaque.setdefault(json.dumps(rule, sort_keys=True), rule)
+            continue
+        protocol, block, ports = parsed
+        index[protocol][block].append(ports)
+        string_ports = string_ports or isinstance(rule.get('FromPort'), basestring)
+    count = None
+    while count != _count(index):
+        count = _count(index)
+        _compact_pass(index)
+
+    fmt = str if string_ports else int
+    out = []
+    for protocol in sorted(index):
+        for block in sorted(index[protocol]):
+            for from_port, to_port in sorted(index[protocol][block]):
+                out.append({'IpProtocol': protocol, 'FromPort': fmt(from_port), 'ToPort': fmt(to_port),
+                            'CidrIp': format_cidr(block)})
+    out.extend(opaque.itervalues())
+    return out
+
+
+def _ref_name(value):
+    if isinstance(value, dict) and value.keys() == ['Ref']:
+        return value['Ref']
+    return None
+
+
+def compact_security_groups(template, limit=limits.MAX_SECURITY_GROUP_RULES):
+    """Compact the inline rules of every security group in a template.
+
+    Takes a Template or template dict and returns a SecurityGroupAnalysis
+    with the rewritten template dict, a GroupReport per group and direction
+    (standalone SecurityGroupIngress/Egress resources pointing at the group
+    count towards it but aren't rewritten), and a list of groups in the
+    same VPC that end up with identical rules. Duplicates are only
+    candidates for merging, since other rules may refer to each group.
+    """
+    t = template_dict(template)
+    resources = t.get('Resources', {})
+    standalone = collections.Counter()
+    for resource in resources.itervalues():
+        for _, direction, type in _DIRECTIONS:
+            if resource.get('Type') == type:
+                name = _ref_name(resource.get('Properties', {}).get('GroupId'))
+                if name:
+                    standalone[name, direction] += 1
+
+    groups = []
+    signatures = collections.defaultdict(list)
+    for name, resource in sorted(resources.iteritems()):
+        if resource.get('Type') != 'AWS::EC2::SecurityGroup':
+            continue
+        props = resource.get('Properties', {})
+        signature = [props.get('VpcId')]
+        for key, direction, _ in _DIRECTIONS:
+            rules = props.get(key)
+            extra = standalone[name, direction]
+            if not isinstance(rules, list):
+                signature.append(rules)
+                if rules is None and extra:
+                    groups.append(GroupReport(name, direction, extra, extra, extra <= limit))
+                continue
+            compacted = compact_rules(rules)
+            props[key] = compacted
+            signature.append(sorted(json.dumps(rule, sort_keys=True) for rule in compacted))
+            after = len(compacted) + extra
+            groups.append(GroupReport(name, direction, len(rules) + extra, after, after <= limit))
+        if any(signature[1:]) and not any(standalone[name, direction] for _, direction, _ in _DIRECTIONS):
+            signatures[json.dumps(signature, sort_keys=True)].append(name)
+    duplicates = sorted(names for names in signatures.itervalues() if len(names) > 1)
+    return SecurityGroupAnalysis(t, groups, duplicates)
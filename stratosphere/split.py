@@ -0,0 +1,574 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import collections
+import copy
+import heapq
+import itertools
+import json
+import re
+
+from .evaluate import LIST_PARAMETER_TYPES
+from .graph import DependencyGraph, iter_condition_references, iter_mapping_references
+from .limits import MAX_OUTPUTS, MAX_PARAMETERS, MAX_RESOURCES, MAX_S3_BODY_SIZE
+
+
+SplitResult = collections.namedtuple('SplitResult', ['parent', 'children'])
+
+STACK_TYPE = 'AWS::CloudFormation::Stack'
+
+TEMPLATE_URL_PARAMETER = 'TemplateBaseURL'
+
+# GetAtt attributes that are lists. Stack outputs and parameters can only
+# be strings, so these cross stacks joined with commas.
+LIST_ATTRIBUTES = frozenset([
+    ('AWS::DirectoryService::MicrosoftAD', 'DnsIpAddresses'),
+    ('AWS::DirectoryService::SimpleAD', 'DnsIpAddresses'),
+    ('AWS::EC2::NetworkInterface', 'SecondaryPrivateIpAddresses'),
+    ('AWS::EC2::Subnet', 'Ipv6CidrBlocks'),
+    ('AWS::EC2::VPC', 'CidrBlockAssociations'),
+    ('AWS::EC2::VPC', 'Ipv6CidrBlocks'),
+    ('AWS::ElasticLoadBalancingV2::LoadBalancer', 'SecurityGroups'),
+    ('AWS::Route53::HostedZone', 'NameServers'),
+])
+
+
+def template_dict(template):
+    """Return a fresh JSON-level dict for a Template or template dict."""
+    if isinstance(template, dict):
+        return copy.deepcopy(template)
+    return json.loads(template.to_json())
+
+
+def _size(value):
+    # Measure the way to_json() will write it out
+    return len(json.dumps(value, indent=4, separators=(', ', ': ')))
+
+
+def _resource_size(name, body):
+    # Nested two levels down in the final template, which adds indentation
+    return _size({'Resources': {name: body}}) - len('{\n    "Resources": {\n    }\n}')
+
+
+def _dfs_order(graph):
+    """Dependencies-first DFS post-order, which keeps related resources next to each other."""
+    order = []
+    seen = set()
+    for root in graph.nodes:
+        if root in seen:
+            continue
+        seen.add(root)
+        work = [(root, iter(graph.dependencies(root)))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in seen:
+                    seen.add(child)
+                    work.append((child, iter(graph.dependencies(child))))
+                    break
+            else:
+                work.pop()
+                order.append(node)
+    return order
+
+
+def _references(value, resources, parameters):
+    """Return the (name, attr) pairs of resources and the parameter names value references.
+
+    attr is None for a Ref. These match what _Splitter.rewrite() turns into
+    outputs and parameters.
+    """
+    keys = set()
+    params = set()
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            if len(value) == 1:
+                ref = value.get('Ref')
+                if isinstance(ref, basestring):
+                    if ref in resources:
+                        keys.add((ref, None))
+                    elif ref in parameters:
+                        params.add(ref)
+                    continue
+                getatt = value.get('Fn::GetAtt')
+                if isinstance(getatt, list) and len(getatt) == 2 and getatt[0] in resources:
+                    keys.add((getatt[0], getatt[1]))
+                    continue
+            stack.extend(value.itervalues())
+        elif isinstance(value, list):
+            stack.extend(value)
+    return keys, params
+
+
+def _used_conditions(conditions, values):
+    """Return the conditions referenced by values, following conditions that use other conditions."""
+    used = set()
+    stack = list(values)
+    while stack:
+        for name in iter_condition_references(stack.pop()):
+            if name in conditions and name not in used:
+                used.add(name)
+                stack.append(conditions[name])
+    return used
+
+
+class _Cluster(object):
+    """A group of resources that will share a child stack."""
+    def __init__(self, id, names, size, keys, params, provides, position):
+        self.id = id
+        self.names = names
+        self.size = size
+        # (name, attr) pairs referenced by members, including each other
+        self.keys = keys
+        # Template parameters used by members
+        self.params = params
+        # (name, attr) pairs of members that something references
+        self.provides = provides
+        self.position = position
+        # Parameter and output counts, filled in by _Partitioner
+        self.imports = None
+        self.exports = None
+
+
+class _Partitioner(object):
+    """Agglomerative grouping of resources into child stacks.
+
+    Every resource starts in a cluster of its own. Resources that
+    reference more than a stack can import are repaired first, see
+    repair(). Then pairs of clusters are merged in order of how many
+    references run between them, so resources end up next to the things
+    they reference, and what is left is packed first fit decreasing. A
+    merge is only made if the result stays within the resource, size,
+    parameter and output limits and doesn't make the stacks depend on each
+    other in a cycle.
+    """
+    def __init__(self, resources, graph, references, parent_keys, max_resources, max_size, max_parameters,
+                 max_outputs):
+        self.graph = graph
+        self.parent_keys = parent_keys
+        self.max_resources = max_resources
+        self.max_size = max_size
+        self.max_parameters = max_parameters
+        self.max_outputs = max_outputs
+        self.users = collections.defaultdict(set)
+        for name, (keys, params) in references.iteritems():
+            for key in keys:
+                self.users[key].add(name)
+        provides = collections.defaultdict(set)
+        for key in itertools.chain(self.users, parent_keys):
+            provides[key[0]].add(key)
+        self.clusters = {}
+        self.owner = {}
+        # Cluster id to the ids it depends on and the ids depending on it
+        self.succ = {}
+        self.pred = {}
+        self.order = {}
+        for position, name in enumerate(_dfs_order(graph)):
+            self.order[name] = position
+            keys, params = references[name]
+            cluster = _Cluster(position, frozenset([name]), _resource_size(name, resources[name]), keys, params,
+                               provides[name], position)
+            self.clusters[cluster.id] = cluster
+            self.owner[name] = cluster.id
+        self.next_id = len(self.clusters)
+        for source, target, kinds in graph.edges():
+            if source != target:
+                self.succ.setdefault(self.owner[source], set()).add(self.owner[target])
+                self.pred.setdefault(self.owner[target], set()).add(self.owner[source])
+
+    def imports(self, cluster):
+        if cluster.imports is None:
+            names = cluster.names
+            cluster.imports = sum(1 for key in cluster.keys if key[0] not in names) + len(cluster.params)
+        return cluster.imports
+
+    def exports(self, cluster):
+        if cluster.exports is None:
+            names = cluster.names
+            cluster.exports = sum(1 for key in cluster.provides
+                                  if key in self.parent_keys or not self.users[key] <= names)
+        return cluster.exports
+
+    def _reaches(self, start, goal, skip):
+        """Check for a path from start to goal that doesn't use the edge skip -> goal."""
+        stack = [other for other in self.succ.get(start, ()) if other != goal]
+        seen = set(stack)
+        while stack:
+            node = stack.pop()
+            if node == goal:
+                return True
+            for other in self.succ.get(node, ()):
+                if other not in seen and not (node == skip and other == goal):
+                    seen.add(other)
+                    stack.append(other)
+        return False
+
+    def _combine(self, a, b, repairing=None):
+        """Return the cluster a and b would make, or None if it breaks a limit.
+
+        Normally the result has to be within every limit. While repairing
+        a cluster that is over the parameter or output limit, the result
+        only has to be no further over than that cluster already is.
+        """
+        if len(a.names) + len(b.names) > self.max_resources or a.size + b.size > self.max_size:
+            return None
+        cluster = _Cluster(None, a.names | b.names, a.size + b.size, a.keys | b.keys, a.params | b.params,
+                           a.provides | b.provides, min(a.position, b.position))
+        max_parameters, max_outputs = self.max_parameters, self.max_outputs
+        if repairing is not None:
+            max_parameters = max(max_parameters, self.imports(repairing))
+            max_outputs = max(max_outputs, self.exports(repairing))
+        if self.imports(cluster) > max_parameters or self.exports(cluster) > max_outputs:
+            return None
+        return cluster
+
+    def _acyclic(self, a, b):
+        return not (self._reaches(a.id, b.id, a.id) or self._reaches(b.id, a.id, b.id))
+
+    def merged(self, a, b, repairing=None):
+        """Return the cluster a and b would make, or None if it isn't allowed."""
+        cluster = self._combine(a, b, repairing)
+        if cluster is None or not self._acyclic(a, b):
+            return None
+        return cluster
+
+    def over(self, cluster):
+        return self.imports(cluster) > self.max_parameters or self.exports(cluster) > self.max_outputs
+
+    def repair(self, cluster):
+        """Merge neighbours into a cluster until it is within the parameter and output limits.
+
+        Each step takes the neighbour that cuts the most parameters and
+        outputs per resource it adds, so a resource with too many
+        references pulls in the things it references rather than getting
+        pulled into someone else's stack.
+        """
+        while self.over(cluster):
+            cost = self.imports(cluster) + self.exports(cluster)
+            candidates = []
+            for other_id in self.weights(cluster):
+                other = self.clusters[other_id]
+                merged = self._combine(cluster, other, cluster)
+                if merged is None:
+                    continue
+                saved = cost + self.imports(other) + self.exports(other) - self.imports(merged) - self.exports(merged)
+                if saved > 0:
+                    candidates.append((-float(saved) / len(other.names), other.position, other, merged))
+            candidates.sort(key=lambda candidate: candidate[:2])
+            for _, _, other, merged in candidates:
+                if self._acyclic(cluster, other):
+                    cluster = self.commit(cluster, other, merged)
+                    break
+            else:
+                return cluster # Stuck, partition() will raise
+        return cluster
+
+    def commit(self, a, b, cluster):
+        cluster.id = self.next_id
+        self.next_id += 1
+        del self.clusters[a.id], self.clusters[b.id]
+        self.clusters[cluster.id] = cluster
+        for name in cluster.names:
+            self.owner[name] = cluster.id
+        old = (a.id, b.id)
+        succ = (self.succ.pop(a.id, set()) | self.succ.pop(b.id, set())) - set(old)
+        pred = (self.pred.pop(a.id, set()) | self.pred.pop(b.id, set())) - set(old)
+        for other in succ:
+            self.pred[other] = (self.pred[other] - set(old)) | set([cluster.id])
+        for other in pred:
+            self.succ[other] = (self.succ[other] - set(old)) | set([cluster.id])
+        if succ:
+            self.succ[cluster.id] = succ
+        if pred:
+            self.pred[cluster.id] = pred
+        return cluster
+
+    def weights(self, cluster):
+        """Return {other cluster id: number of distinct references between them}."""
+        weights = collections.Counter()
+        for key in cluster.keys:
+            other = self.owner[key[0]]
+            if other != cluster.id:
+                weights[other] += 1
+        for key in cluster.provides:
+            for user in self.users[key]:
+                other = self.owner[user]
+                if other != cluster.id:
+                    weights[other] += 1
+        return weights
+
+    def _push(self, heap, cluster):
+        for other_id, weight in self.weights(cluster).iteritems():
+            other = self.clusters[other_id]
+            heapq.heappush(heap, (-weight, len(cluster.names) + len(other.names),
+                                  min(cluster.position, other.position), max(cluster.position, other.position),
+                                  cluster.id, other_id))
+
+    def partition(self):
+        # Worst first, since those are the most constrained
+        over = [cluster for cluster in self.clusters.itervalues() if self.over(cluster)]
+        over.sort(key=lambda cluster: (-self.imports(cluster) - self.exports(cluster), cluster.position))
+        for cluster in over:
+            if cluster.id in self.clusters:
+                self.repair(cluster)
+
+        heap = []
+        for cluster in self.clusters.values():
+            self._push(heap, cluster)
+        while heap:
+            _, _, _, _, a_id, b_id = heapq.heappop(heap)
+            # Entries for clusters that have since been merged are stale
+            if a_id not in self.clusters or b_id not in self.clusters:
+                continue
+            a, b = self.clusters[a_id], self.clusters[b_id]
+            cluster = self.merged(a, b)
+            if cluster is not None:
+                self._push(heap, self.commit(a, b, cluster))
+
+        # First fit decreasing for whatever is left
+        bins = []
+        for cluster in sorted(self.clusters.values(), key=lambda cluster: (-len(cluster.names), cluster.position)):
+            for i, b in enumerate(bins):
+                merged = self.merged(b, cluster)
+                if merged is not None:
+                    bins[i] = self.commit(b, cluster, merged)
+                    break
+            else:
+                bins.append(cluster)
+
+        for cluster in bins:
+            if self.over(cluster):
+                raise ValueError('can\'t split the template within the limits, the stack for {} would need {} '
+                                 'parameters and {} outputs'.format(
+                                     ', '.join(sorted(cluster.names)[:5]) + (', ...' if len(cluster.names) > 5 else ''),
+                                     self.imports(cluster), self.exports(cluster)))
+        bins.sort(key=lambda cluster: cluster.position)
+        return [sorted(cluster.names, key=self.order.get) for cluster in bins]
+
+
+class _Splitter(object):
+    def __init__(self, t, bins, stack_prefix):
+        self.t = t
+        self.resources = t.get('Resources', {})
+        self.parameters = t.get('Parameters', {})
+        self.conditions = t.get('Conditions', {})
+        self.mappings = t.get('Mappings', {})
+        self.owner = {}
+        self.stack_names = []
+        for i, names in enumerate(bins, 1):
+            stack_name = '{}{}'.format(stack_prefix, i)
+            self.stack_names.append(stack_name)
+            for name in names:
+                self.owner[name] = stack_name
+        self.taken = set(self.resources) | set(self.parameters) | set(self.stack_names)
+        self.export_names = {}
+        # export name -> parameter Type where it isn't String
+        self.export_types = {}
+        # stack name -> {export name: value}
+        self.exports = collections.defaultdict(collections.OrderedDict)
+
+    def export(self, name, attr=None):
+        """Make sure the owning child outputs a value and return the output name."""
+        key = (name, attr)
+        if key not in self.export_names:
+            export_name = name if attr is None else name + re.sub(r'[^a-zA-Z0-9]', '', attr)
+            if attr is not None:
+                while export_name in self.taken:
+                    export_name += 'Export'
+                self.taken.add(export_name)
+            self.export_names[key] = export_name
+            if attr is None:
+                value = {'Ref': name}
+            elif (self.resources[name].get('Type'), attr) in LIST_ATTRIBUTES:
+                value = {'Fn::Join': [',', {'Fn::GetAtt': [name, attr]}]}
+                self.export_types[export_name] = 'CommaDelimitedList'
+            else:
+                value = {'Fn::GetAtt': [name, attr]}
+            self.exports[self.owner[name]][export_name] = value
+        return self.export_names[key]
+
+    def rewrite(self, value, stack_name, imports):
+        """Copy value, swapping references to other children's resources for parameters.
+
+        imports collects {parameter name: value in the parent}. A stack_name
+        of None means the value lives in the parent.
+        """
+        if isinstance(value, dict):
+            if len(value) == 1:
+                ref = value.get('Ref')
+                if isinstance(ref, basestring):
+                    if ref in self.owner and self.owner[ref] != stack_name:
+                        export_name = self.export(ref)
+                        imported = {'Fn::GetAtt': [self.owner[ref], 'Outputs.{}'.format(export_name)]}
+                        if stack_name is None:
+                            return imported
+                        imports[export_name] = imported
+                        return {'Ref': export_name}
+                    if ref in self.parameters and stack_name is not None:
+                        imports[ref] = {'Ref': ref}
+                        if self.parameters[ref].get('Type', '').startswith(LIST_PARAMETER_TYPES):
+                            imports[ref] = {'Fn::Join': [',', imports[ref]]}
+                    return {'Ref': ref}
+                getatt = value.get('Fn::GetAtt')
+                if isinstance(getatt, list) and len(getatt) == 2 and getatt[0] in self.owner \
+                        and self.owner[getatt[0]] != stack_name:
+                    export_name = self.export(getatt[0], getatt[1])
+                    imported = {'Fn::GetAtt': [self.owner[getatt[0]], 'Outputs.{}'.format(export_name)]}
+                    if stack_name is None:
+                        return imported
+                    imports[export_name] = imported
+                    return {'Ref': export_name}
+            return dict((k, self.rewrite(v, stack_name, imports)) for k, v in value.iteritems())
+        elif isinstance(value, list):
+            return [self.rewrite(v, stack_name, imports) for v in value]
+        return value
+
+    def used_conditions(self, values):
+        return _used_conditions(self.conditions, values)
+
+    def child(self, stack_name, names):
+        imports = {}
+        stack_deps = set()
+        resources = {}
+        for name in names:
+            body = self.rewrite(self.resources[name], stack_name, imports)
+            depends_on = body.get('DependsOn')
+            if depends_on is not None:
+                targets = [depends_on] if isinstance(depends_on, basestring) else depends_on
+                local = []
+                for target in targets:
+                    if self.owner.get(target, stack_name) != stack_name:
+                        stack_deps.add(self.owner[target])
+                    else:
+                        local.append(target)
+                if not local:
+                    del body['DependsOn']
+                elif isinstance(depends_on, list):
+                    body['DependsOn'] = local
+            resources[name] = body
+        conditions = self.used_conditions(resources.itervalues())
+        for name in conditions:
+            self.rewrite(self.conditions[name], stack_name, imports)
+        child = {'Resources': resources}
+        if 'AWSTemplateFormatVersion' in self.t:
+            child['AWSTemplateFormatVersion'] = self.t['AWSTemplateFormatVersion']
+        if conditions:
+            child['Conditions'] = dict((name, self.conditions[name]) for name in conditions)
+        mappings = set(iter_mapping_references([resources, child.get('Conditions', {})]))
+        if mappings:
+            child['Mappings'] = dict((name, self.mappings[name]) for name in mappings if name in self.mappings)
+        return child, imports, stack_deps
+
+
+def split_template(template, max_resources=MAX_RESOURCES, max_size=MAX_S3_BODY_SIZE, template_url=None,
+                   stack_prefix='Stack'):
+    """Split a template that is over the CloudFormation limits into nested stacks.
+
+    Returns a SplitResult of the parent template dict and an OrderedDict of
+    child stack name to template dict. A template that already fits comes
+    back as the parent with no children. References between children are
+    passed through the parent as stack outputs and parameters. Every child
+    is kept within the parameter and output limits as well, and
+    ValueError is raised if no split that does so can be found (say a
+    resource references more than MAX_RESOURCES others).
+
+    template_url is called with each child's stack name and should return
+    the TemplateURL value to use. By default the parent gets a
+    TemplateBaseURL parameter and children are expected at
+    <TemplateBaseURL>/<stack name>.json.
+    """
+    t = template_dict(template)
+    resources = t.get('Resources', {})
+    if len(resources) <= max_resources and _size(t) <= max_size:
+        return SplitResult(t, collections.OrderedDict())
+
+    # Leave room in each child for the parameters, mappings and conditions
+    # it may need plus the cross-stack plumbing.
+    overhead = _size(dict((k, t[k]) for k in ('Parameters', 'Mappings', 'Conditions') if k in t))
+    budget = max_size - overhead - max_size // 10
+    if budget <= 0:
+        raise ValueError('template parameters, mappings and conditions alone exceed {} bytes'.format(max_size))
+    graph = DependencyGraph(resources)
+    parameters = t.get('Parameters', {})
+    conditions = t.get('Conditions', {})
+    references = {}
+    for name, body in resources.iteritems():
+        keys, params = _references(body, resources, parameters)
+        # Conditions a resource uses go into its stack too, with their parameters
+        for condition in _used_conditions(conditions, [body]):
+            params |= _references(conditions[condition], resources, parameters)[1]
+        references[name] = (keys, params)
+    parent_keys = _references(t.get('Outputs', {}), resources, parameters)[0]
+    bins = _Partitioner(resources, graph, references, parent_keys, max_resources, budget, MAX_PARAMETERS,
+                        MAX_OUTPUTS).partition()
+    if len(bins) > MAX_RESOURCES:
+        raise ValueError('can\'t split the template, it would need {} child stacks'.format(len(bins)))
+    splitter = _Splitter(t, bins, stack_prefix)
+
+    children = collections.OrderedDict()
+    stack_resources = {}
+    for stack_name, names in zip(splitter.stack_names, bins):
+        child, imports, stack_deps = splitter.child(stack_name, names)
+        children[stack_name] = child
+        if template_url is None:
+            url = {'Fn::Join': ['', [{'Ref': TEMPLATE_URL_PARAMETER}, '/{}.json'.format(stack_name)]]}
+        else:
+            url = template_url(stack_name)
+        stack = {'Type': STACK_TYPE, 'Properties': {'TemplateURL': url}}
+        if imports:
+            stack['Properties']['Parameters'] = imports
+        if stack_deps:
+            stack['DependsOn'] = sorted(stack_deps)
+        stack_resources[stack_name] = (stack, imports)
+
+    # Parent outputs can create more exports, so do them before filling in child outputs
+    outputs = dict((name, splitter.rewrite(output, None, {})) for name, output in t.get('Outputs', {}).iteritems())
+
+    for stack_name, child in children.iteritems():
+        stack, imports = stack_resources[stack_name]
+        parameters = {}
+        for name in imports:
+            if name in splitter.parameters:
+                parameters[name] = splitter.parameters[name]
+            else:
+                parameters[name] = {'Type': splitter.export_types.get(name, 'String')}
+        if parameters:
+            child['Parameters'] = parameters
+        exports = splitter.exports.get(stack_name)
+        if exports:
+            child['Outputs'] = dict((name, {'Value': value}) for name, value in exports.iteritems())
+
+    parent = {'Resources': dict((name, stack) for name, (stack, imports) in stack_resources.iteritems())}
+    for key in ('AWSTemplateFormatVersion', 'Description', 'Mappings', 'Conditions'):
+        if key in t:
+            parent[key] = t[key]
+    parameters = dict(splitter.parameters)
+    if template_url is None:
+        parameters[TEMPLATE_URL_PARAMETER] = {
+            'Type': 'String',
+            'Description': 'URL prefix the child stack templates are uploaded to.',
+        }
+    if len(parameters) > MAX_PARAMETERS:
+        raise ValueError('the parent template would have {} parameters, the limit is {}{}'.format(
+            len(parameters), MAX_PARAMETERS, ' (pass template_url to save one)' if template_url is None else ''))
+    parent['Parameters'] = parameters
+    if outputs:
+        parent['Outputs'] = outputs
+    return SplitResult(parent, children)
@@ -0,0 +1,109 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import collections
+
+import troposphere
+
+from . import limits
+
+
+TagPolicy = collections.namedtuple('TagPolicy', ['taggable', 'description_extra', 'extra'])
+
+_UNTAGGABLE = TagPolicy(False, {}, {})
+
+_policies = {}
+
+
+def tag_policy(cls):
+    """Return the TagPolicy for a class, worked out once per class.
+
+    DESCRIPTION_TAG_EXTRA on the class adds fields to the Description tag
+    and TAG_EXTRA to every other tag added here (autoscaling groups need
+    PropagateAtLaunch on both).
+    """
+    policy = _policies.get(cls)
+    if policy is None:
+        if 'Tags' in getattr(cls, 'props', {}):
+            policy = TagPolicy(True, dict(getattr(cls, 'DESCRIPTION_TAG_EXTRA', {})),
+                               dict(getattr(cls, 'TAG_EXTRA', {})))
+        else:
+            policy = _UNTAGGABLE
+        _policies[cls] = policy
+    return policy
+
+
+def _tag_key(tag):
+    if isinstance(tag, dict):
+        key = tag.get('Key')
+    else:
+        key = getattr(tag, 'data', {}).get('Key')
+    try:
+        hash(key)
+    except TypeError:
+        return None # An intrinsic function, can't tell what it is
+    return key
+
+
+def _check_count(cls, tags, name):
+    if len(tags) > limits.MAX_TAGS:
+        raise ValueError('{} has {} tags, the limit is {}'.format(name or cls.__name__, len(tags), limits.MAX_TAGS))
+
+
+def apply_tags(cls, props, description=None, defaults=None, name=None):
+    """Merge a Description tag and default tags into props['Tags'] in place.
+
+    Existing tags keep their positions and win, then the Description tag
+    and defaults (a dict of key to value) in sorted key order are appended.
+    props['Tags'] can be a list of tag dicts or helper objects, or a
+    troposphere Tags object; anything else (e.g. an If) is left alone.
+    Raises ValueError on a repeated key or if the result is over MAX_TAGS.
+    Returns True if the class takes tags.
+    """
+    policy = tag_policy(cls)
+    if not policy.taggable:
+        return False
+    existing = props.get('Tags', [])
+    if isinstance(existing, troposphere.Tags):
+        existing = existing.tags
+    if not isinstance(existing, list):
+        return True
+    keys = set()
+    for tag in existing:
+        key = _tag_key(tag)
+        if key is None:
+            continue
+        if key in keys:
+            raise ValueError('{} has more than one tag "{}"'.format(name or cls.__name__, key))
+        keys.add(key)
+    if description is None and not defaults:
+        _check_count(cls, existing, name)
+        return True
+    tags = list(existing)
+    if description is not None and 'Description' not in keys:
+        tag = {'Key': 'Description', 'Value': description}
+        tag.update(policy.description_extra)
+        tags.append(tag)
+    for key in sorted(defaults or ()):
+        if key not in keys:
+            tag = {'Key': key, 'Value': defaults[key]}
+            tag.update(policy.extra)
+            tags.append(tag)
+    _check_count(cls, tags, name)
+    props['Tags'] = tags
+    return True
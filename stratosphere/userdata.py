@@ -0,0 +1,238 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import base64
+import collections
+import gzip
+import hashlib
+import json
+import os
+import re
+import StringIO
+
+import troposphere
+
+from .functions import Base64, GetAtt, Join, Ref
+
+
+Payload = collections.namedtuple('Payload', ['value', 'size', 'static'])
+
+# ${Name} is a Ref, ${Name.Attr} a GetAtt and ${!Name} a literal ${Name}
+_VARIABLE = re.compile(r'\$\{(!?)([\w:]+)(?:\.([\w.]+))?\}')
+
+# cloud-init picks the handler for a part from its first line
+CONTENT_TYPES = (
+    ('#!', 'text/x-shellscript'),
+    ('#cloud-config', 'text/cloud-config'),
+    ('#cloud-boothook', 'text/cloud-boothook'),
+    ('#include', 'text/x-include-url'),
+    ('#part-handler', 'text/part-handler'),
+    ('#upstart-job', 'text/upstart-job'),
+)
+
+
+
+class _LRU(object):
+    """A small dict that forgets the least recently used entry past size."""
+    def __init__(self, size):
+        self.size = size
+        self._data = collections.OrderedDict()
+
+    def get(self, key):
+        value = self._data.pop(key, None)
+        if value is not None:
+            self._data[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.size:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Built payloads by content hash, so templates sharing a script build it once
+_payloads = _LRU(32)
+# File contents by path, with the mtime they were read at
+_files = _LRU(32)
+
+
+def _append(pieces, piece):
+    if isinstance(piece, basestring) and pieces and isinstance(pieces[-1], basestring):
+        pieces[-1] += piece
+    elif piece != '':
+        pieces.append(piece)
+
+
+def interpolate(text):
+    """Split text into a list of strings, Refs and GetAtts, for use in a Join."""
+    pieces = []
+    pos = 0
+    for match in _VARIABLE.finditer(text):
+        _append(pieces, text[pos:match.start()])
+        escape, name, attr = match.groups()
+        if escape:
+            _append(pieces, '${' + match.group(0)[3:])
+        elif attr:
+            _append(pieces, GetAtt(name, attr))
+        else:
+            _append(pieces, Ref(name))
+        pos = match.end()
+    _append(pieces, text[pos:])
+    return pieces
+
+
+def guess_content_type(content):
+    for prefix, content_type in CONTENT_TYPES:
+        if content.startswith(prefix):
+            return content_type
+    return 'text/plain'
+
+
+def read_file(path):
+    """Read a file, reusing the last read unless it has changed since."""
+    mtime = os.path.getmtime(path)
+    cached = _files.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = _files[path] = (mtime, f.read())
+    return cached[1]
+
+
+def _encode(piece):
+    return piece.encode('utf-8') if isinstance(piece, unicode) else piece
+
+
+def _gzip(data):
+    buf = StringIO.StringIO()
+    # Fixed mtime so the same input always gives the same output
+    with gzip.GzipFile(filename='', mode='wb', fileobj=buf, mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+class UserData(object):
+    """Assemble instance UserData from fragments and files.
+
+    Fragments are interpolated with ${Name} and ${Name.Attr}. With more
+    than one part, or mime=True, they are wrapped as multipart MIME for
+    cloud-init. A payload with nothing left to resolve is gzipped (if
+    compress is set) and base64 encoded here, so the template gets a plain
+    string instead of a Base64(Join(...)) tree. Otherwise it can't be
+    compressed, since the values aren't known until the stack is created.
+    Building the same payload again returns the first result, as long as
+    it's one of the last few built.
+    """
+    def __init__(self, compress=True, mime=None):
+        self.compress = compress
+        self.mime = mime
+        self.parts = []
+
+    def add(self, content, content_type=None, filename=None, variables=True):
+        """Add a fragment, a string or a list of strings and intrinsic functions."""
+        if isinstance(content, basestring):
+            if content_type is None:
+                content_type = guess_content_type(content)
+            content = interpolate(content) if variables else [content]
+        elif content_type is None:
+            content_type = 'text/plain'
+        content = tuple(_encode(piece) if isinstance(piece, basestring) else piece for piece in content)
+        self.parts.append((content_type, filename, content))
+        return self
+
+    def add_file(self, path, content_type=None, variables=True):
+        return self.add(read_file(path), content_type, os.path.basename(path), variables)
+
+    def _key(self):
+        digest = hashlib.sha1(repr((self.compress, self.mime)))
+        for content_type, filename, content in self.parts:
+            digest.update(repr((content_type, filename, len(content))))
+            for piece in content:
+                if isinstance(piece, basestring):
+                    digest.update('s{}:'.format(len(piece)))
+                    digest.update(piece)
+                else:
+                    digest.update('f' + json.dumps(piece, cls=troposphere.awsencode, sort_keys=True))
+        return digest.hexdigest()
+
+    def _pieces(self, key):
+        if not (self.mime or (self.mime is None and len(self.parts) > 1)):
+            return list(self.parts[0][2]) if self.parts else []
+        boundary = '==============={}=='.format(key[:20])
+        pieces = ['Content-Type: multipart/mixed; boundary="{}"\nMIME-Version: 1.0\n\n'.format(boundary)]
+        for i, (content_type, filename, content) in enumerate(self.parts):
+            _append(pieces, '--{}\nContent-Type: {}; charset="utf-8"\nMIME-Version: 1.0\n'
+                            'Content-Transfer-Encoding: 8bit\n'
+                            'Content-Disposition: attachment; filename="{}"\n\n'.format(
+                                boundary, content_type, filename or 'part-{:03d}'.format(i + 1)))
+            for piece in content:
+                _append(pieces, piece)
+            _append(pieces, '\n')
+        _append(pieces, '--{}--\n'.format(boundary))
+        return pieces
+
+    def build(self):
+        """Return a Payload, with the value to set as UserData and its size in bytes.
+
+        The size is what counts towards limits.MAX_USER_DATA_SIZE, after
+        compression but before base64. For payloads with intrinsic
+        functions it only counts the literal text, so is a lower bound.
+        """
+        key = self._key()
+        payload = _payloads.get(key)
+        if payload is None:
+            pieces = self._pieces(key)
+            if all(isinstance(piece, str) for piece in pieces):
+                data = ''.join(pieces)
+                if self.compress:
+                    data = _gzip(data)
+                payload = Payload(base64.b64encode(data), len(data), True)
+            else:
+                size = sum(len(piece) for piece in pieces if isinstance(piece, str))
+                payload = Payload(Base64(Join('', pieces)), size, False)
+            _payloads[key] = payload
+        return payload
+
+
+def payload_size(value):
+    """Return the size in bytes of a UserData value from template JSON, or None.
+
+    Plain strings are base64 decoded. For Fn::Base64 only literal text is
+    counted, so that is a lower bound.
+    """
+    if isinstance(value, basestring):
+        try:
+            return len(base64.b64decode(value))
+        except TypeError:
+            return None
+    if not isinstance(value, dict) or value.keys() != ['Fn::Base64']:
+        return None
+    value = value['Fn::Base64']
+    if isinstance(value, basestring):
+        return len(_encode(value))
+    if isinstance(value, dict) and value.keys() == ['Fn::Join'] and isinstance(value['Fn::Join'], list) \
+            and len(value['Fn::Join']) == 2 and isinstance(value['Fn::Join'][1], list):
+        separator, pieces = value['Fn::Join']
+        size = sum(len(_encode(piece)) for piece in pieces if isinstance(piece, basestring))
+        if isinstance(separator, basestring):
+            size += len(_encode(separator)) * max(len(pieces) - 1, 0)
+        return size
+    return None
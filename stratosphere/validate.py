@@ -0,0 +1,275 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import argparse
+import collections
+import inspect
+import json
+import multiprocessing
+import os
+import sys
+
+from . import Template, limits
+from .canonical import to_plain
+from .evaluate import PSEUDO_PARAMETERS
+from .graph import iter_condition_references, iter_references, resource_body
+from .render import find_templates
+from .userdata import payload_size
+
+
+Problem = collections.namedtuple('Problem', ['template', 'severity', 'section', 'name', 'message'])
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# Templates for the current run, inherited by forked workers the same way
+# as in stratosphere.render
+_TEMPLATES = []
+
+PSEUDO_PARAMETER_NAMES = frozenset(PSEUDO_PARAMETERS) | frozenset(['AWS::NoValue'])
+
+
+def _schemas(cls):
+    """Map resource Type to (known props, required props) for a Template class."""
+    schemas = {}
+    for value_type in cls.STRATOSPHERE_TYPES().itervalues():
+        type = getattr(value_type, 'type', None)
+        if type:
+            schemas[type] = (frozenset(value_type.props),
+                             tuple(sorted(k for k, (_, required) in value_type.props.iteritems() if required)))
+    return schemas
+
+
+def _plain(obj):
+    # Resources go through resource_body() so troposphere's own required
+    # prop check doesn't stop us before we can report it
+    return to_plain(resource_body(obj))
+
+
+def _template_data(template):
+    """Return (data, problems) with the template as plain JSON, section by section."""
+    if isinstance(template, dict):
+        return template, []
+    template.materialize()
+    data = {}
+    problems = []
+    for section, key in (('resources', 'Resources'), ('parameters', 'Parameters'), ('outputs', 'Outputs'),
+                         ('mappings', 'Mappings'), ('conditions', 'Conditions')):
+        values = getattr(template, section)
+        if not values:
+            continue
+        data[key] = {}
+        for name, value in values.iteritems():
+            try:
+                data[key][name] = _plain(value)
+            except (ValueError, TypeError) as e:
+                problems.append((ERROR, key, name, str(e)))
+    if template.description:
+        data['Description'] = template.description
+    if template.version:
+        data['AWSTemplateFormatVersion'] = template.version
+    data.setdefault('Resources', {})
+    return data, problems
+
+
+def _check_references(value, context, problems):
+    names, resource_names, conditions = context[:3]
+    for kind, target in iter_references(value):
+        if kind == 'Ref':
+            if target not in names and target not in PSEUDO_PARAMETER_NAMES:
+                problems.append('Ref to unknown name {}'.format(target))
+        elif target not in resource_names:
+            problems.append('GetAtt of unknown resource {}'.format(target))
+    for condition in iter_condition_references(value):
+        if condition not in conditions:
+            problems.append('unknown condition {}'.format(condition))
+
+
+def _check_resource(name, body, context):
+    """Return a list of problem messages for one resource."""
+    names, resource_names, conditions, schemas = context
+    problems = []
+    if not isinstance(body, dict) or 'Type' not in body:
+        return ['resource has no Type']
+    props = body.get('Properties', {})
+    schema = schemas.get(body['Type'])
+    if schema is not None:
+        known, required = schema
+        for prop in required:
+            if prop not in props:
+                problems.append('missing required property {}'.format(prop))
+        for prop in sorted(props):
+            if prop not in known:
+                problems.append('unknown property {}'.format(prop))
+    for key in ('SecurityGroupIngress', 'SecurityGroupEgress'):
+        rules = props.get(key)
+        if isinstance(rules, list) and len(rules) > limits.MAX_SECURITY_GROUP_RULES:
+            problems.append('{} has {} rules, the limit is {} (see stratosphere.secgroups)'.format(
+                key, len(rules), limits.MAX_SECURITY_GROUP_RULES))
+    tags = props.get('Tags')
+    if isinstance(tags, list) and len(tags) > limits.MAX_TAGS:
+        problems.append('{} tags, the limit is {}'.format(len(tags), limits.MAX_TAGS))
+    size = payload_size(props.get('UserData'))
+    if size is not None and size > limits.MAX_USER_DATA_SIZE:
+        problems.append('UserData is {} bytes, the limit is {} (see stratosphere.userdata)'.format(
+            size, limits.MAX_USER_DATA_SIZE))
+    depends_on = body.get('DependsOn', [])
+    for target in (depends_on if isinstance(depends_on, list) else [depends_on]):
+        if not isinstance(target, basestring):
+            problems.append('DependsOn entry {!r} is not a resource name'.format(target))
+        elif target == name:
+            problems.append('DependsOn itself')
+        elif target not in resource_names:
+            problems.append('DependsOn unknown resource {}'.format(target))
+    _check_references(dict((k, v) for k, v in body.iteritems() if k != 'DependsOn'), context, problems)
+    return problems
+
+
+def _check_template(template_name, data, problems):
+    """Checks for the whole template and its non-resource sections, run in-process."""
+    def problem(severity, section, name, message):
+        problems.append(Problem(template_name, severity, section, name, message))
+
+    for section, limit in (('Resources', limits.MAX_RESOURCES), ('Parameters', limits.MAX_PARAMETERS),
+                           ('Outputs', limits.MAX_OUTPUTS), ('Mappings', limits.MAX_MAPPINGS)):
+        count = len(data.get(section, {}))
+        if count > limit:
+            problem(ERROR, section, None, '{} entries, the limit is {}'.format(count, limit))
+    # Measure the minified size since that is what we'd upload if it came to it
+    size = len(json.dumps(data, sort_keys=True, separators=(',', ':')))
+    if size > limits.MAX_S3_BODY_SIZE:
+        problem(ERROR, None, None, 'template is {} bytes, the limit is {}'.format(size, limits.MAX_S3_BODY_SIZE))
+    elif size > limits.MAX_BODY_SIZE:
+        problem(WARNING, None, None, 'template is {} bytes, it has to be uploaded to S3'.format(size))
+    resources = data.get('Resources', {})
+    context = (frozenset(resources) | frozenset(data.get('Parameters', {})), frozenset(resources),
+               frozenset(data.get('Conditions', {})))
+    for name, output in sorted(data.get('Outputs', {}).iteritems()):
+        messages = []
+        _check_references(output, context, messages)
+        for message in messages:
+            problem(ERROR, 'Outputs', name, message)
+    for name, condition in sorted(data.get('Conditions', {}).iteritems()):
+        for target in iter_condition_references(condition):
+            if target not in context[2]:
+                problem(ERROR, 'Conditions', name, 'unknown condition {}'.format(target))
+    return context
+
+
+def _expand(templates):
+    if isinstance(templates, collections.Mapping):
+        return list(templates.iteritems())
+    expanded = []
+    for target in templates:
+        if isinstance(target, tuple):
+            expanded.append(target)
+        elif isinstance(target, (dict, Template)):
+            name = 'template{}'.format(len(expanded)) if isinstance(target, dict) else target.__class__.__name__
+            expanded.append((name, target))
+        else:
+            expanded.extend((cls.__name__, cls) for cls in find_templates(target))
+    return expanded
+
+
+def _check_one(template_name, template):
+    """Build one template and return every Problem with it."""
+    problems = []
+    try:
+        if inspect.isclass(template):
+            template = template()
+        cls = Template if isinstance(template, dict) else template.__class__
+        data, messages = _template_data(template)
+    except Exception as e:
+        return [Problem(template_name, ERROR, None, None, 'failed to build: {}'.format(e))]
+    for severity, section, name, message in messages:
+        problems.append(Problem(template_name, severity, section, name, message))
+    context = _check_template(template_name, data, problems) + (_schemas(cls),)
+    for name, body in sorted(data['Resources'].iteritems()):
+        for message in _check_resource(name, body, context):
+            problems.append(Problem(template_name, ERROR, 'Resources', name, message))
+    return problems
+
+
+def _check_index(index):
+    return _check_one(*_TEMPLATES[index])
+
+
+def _results(templates, processes):
+    """Yield the list of problems for each template as it is finished."""
+    if processes == 1 or len(templates) <= 1:
+        for template_name, template in templates:
+            yield _check_one(template_name, template)
+        return
+    _TEMPLATES[:] = templates
+    pool = multiprocessing.Pool(processes)
+    try:
+        for problems in pool.imap_unordered(_check_index, xrange(len(templates))):
+            yield problems
+    finally:
+        # Also stops templates still being built when failing fast or if
+        # the caller stops early
+        pool.terminate()
+        pool.join()
+        _TEMPLATES[:] = []
+
+
+def validate_templates(templates, processes=None, fail_fast=False):
+    """Check templates offline and yield a Problem for everything wrong.
+
+    templates is a list of Template classes, instances, template dicts,
+    (name, template) pairs or anything find_templates() takes, or a dict of
+    name to template. Each template gets count and size limit checks, and
+    every resource is checked for missing or unknown properties, Refs and
+    GetAtts to names that don't exist, bad DependsOn entries and unknown
+    conditions. Templates are built and checked one per task across a
+    process pool (processes=1 checks in-process), and their problems are
+    yielded as each finishes, whole-template problems first. With
+    fail_fast, stop at the first error without building anything else.
+    """
+    results = _results(_expand(templates), processes)
+    try:
+        for problems in results:
+            for problem in problems:
+                yield problem
+                if fail_fast and problem.severity == ERROR:
+                    return
+    finally:
+        results.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Validate Stratosphere templates offline.')
+    parser.add_argument('targets', nargs='+', metavar='TARGET',
+                        help='module or module:Class to validate')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: one per core)')
+    parser.add_argument('--fail-fast', action='store_true', help='stop at the first error')
+    args = parser.parse_args(argv)
+    sys.path.insert(0, os.getcwd())
+    errors = 0
+    for problem in validate_templates(args.targets, processes=args.jobs, fail_fast=args.fail_fast):
+        if problem.severity == ERROR:
+            errors += 1
+        where = '.'.join(part for part in (problem.section, problem.name) if part)
+        sys.stdout.write('{}: {}{}: {}\n'.format(problem.template, problem.severity,
+                                                 ' in {}'.format(where) if where else '', problem.message))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+
+import pytest
+
+import stratosphere
+import stratosphere.cache
+from stratosphere import Ref
+from stratosphere.cache import BuildCache
+from stratosphere.render import render_templates
+
+
+class CachedTemplate(stratosphere.Template):
+    def subnet(self):
+        return {'VpcId': Ref('vpc-teapot'), 'CidrBlock': '10.0.0.0/16'}
+
+
+class OtherTemplate(CachedTemplate):
+    def subnet(self):
+        return {'VpcId': Ref('vpc-teapot'), 'CidrBlock': '10.1.0.0/16'}
+
+
+class SubnetMixin(object):
+    def subnet_tags(self):
+        return {'Name': 'teapot'}
+
+
+class MixinTemplate(stratosphere.Template, SubnetMixin):
+    def subnet(self):
+        return {'VpcId': Ref('vpc-teapot'), 'CidrBlock': '10.0.0.0/16', 'Tags': self.subnet_tags()}
+
+
+class TestBuildCache(object):
+    def test_render(self, tmpdir):
+        cache = BuildCache(str(tmpdir))
+        data, hit = cache.render(CachedTemplate)
+        assert not hit
+        assert data == CachedTemplate().to_json()
+        assert cache.render(CachedTemplate) == (data, True)
+
+    def test_key(self, tmpdir):
+        cache = BuildCache(str(tmpdir))
+        assert cache.key(CachedTemplate) == cache.key(CachedTemplate)
+        assert cache.key(CachedTemplate) != cache.key(OtherTemplate)
+        assert cache.key(CachedTemplate) != cache.key(CachedTemplate, {'env': 'prod'})
+
+    def test_key_package(self, tmpdir, monkeypatch):
+        cache = BuildCache(str(tmpdir))
+        key = cache.key(CachedTemplate)
+        monkeypatch.setattr(stratosphere.cache, '_package_digest', 'upgraded')
+        assert cache.key(CachedTemplate) != key
+
+    def test_key_mixin(self, tmpdir):
+        cache = BuildCache(str(tmpdir))
+        key = cache.key(MixinTemplate)
+        assert key is not None
+        cache._sources[SubnetMixin] = 'class SubnetMixin(object): pass'
+        assert cache.key(MixinTemplate) != key
+
+    def test_put_error(self, tmpdir, monkeypatch):
+        cache = BuildCache(str(tmpdir))
+        def rename(src, dst):
+            raise OSError('teapot')
+        monkeypatch.setattr(os, 'rename', rename)
+        with pytest.raises(OSError):
+            cache.put('key', '{}')
+        assert os.listdir(str(tmpdir)) == []
+
+    def test_evict(self, tmpdir):
+        cache = BuildCache(str(tmpdir), max_size=10)
+        cache.put('old', 'x' * 8)
+        os.utime(str(tmpdir.join('old.json')), (0, 0))
+        cache.put('new', 'x' * 8)
+        cache.evict()
+        assert cache.get('old') is None
+        assert cache.get('new') == 'x' * 8
+
+    def test_render_templates(self, tmpdir):
+        cache = BuildCache(str(tmpdir.join('cache')))
+        output = str(tmpdir.join('out'))
+        results = render_templates([CachedTemplate, OtherTemplate], output, processes=2, cache=cache)
+        assert [r.cached for r in results] == [False, False]
+        results = render_templates([CachedTemplate, OtherTemplate], output, processes=2, cache=cache)
+        assert [r.cached for r in results] == [True, True]
+        assert tmpdir.join('out', 'OtherTemplate.json').read() == OtherTemplate().to_json()
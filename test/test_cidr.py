@@ -0,0 +1,94 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+
+import pytest
+
+import stratosphere
+from stratosphere import GetAZs, Ref, Select
+from stratosphere.cidr import CidrAllocator
+
+
+ALLOCATOR = CidrAllocator('10.0.0.0/8')
+
+
+class VpcTemplate(stratosphere.Template):
+    def vpc(self):
+        return {'CidrBlock': ALLOCATOR.allocate(16, key='prod')}
+
+    def subnet_A(self):
+        cidr, az = ALLOCATOR.az_subnets(self.vpc()['CidrBlock'], 24, key='public')[0]
+        return {'VpcId': Ref(self.vpc()), 'CidrBlock': cidr, 'AvailabilityZone': az}
+
+
+class TestCidrAllocator(object):
+    def test_allocate(self):
+        allocator = CidrAllocator('10.0.0.0/16')
+        assert allocator.allocate(24) == '10.0.0.0/24'
+        assert allocator.allocate(23) == '10.0.2.0/23'
+        assert allocator.allocate(24) == '10.0.1.0/24'
+        assert allocator.reserve('10.0.8.0/22') == '10.0.8.0/22'
+        assert allocator.allocate(21) == '10.0.16.0/21'
+        assert allocator.allocate(22) == '10.0.4.0/22'
+        assert len(allocator) == 6
+
+    def test_overlaps(self):
+        allocator = CidrAllocator('10.0.0.0/16')
+        allocator.reserve('10.0.4.0/22')
+        assert allocator.overlaps('10.0.5.0/24') == '10.0.4.0/22'
+        assert allocator.overlaps('10.0.0.0/16') == '10.0.4.0/22'
+        assert allocator.overlaps('10.0.8.0/24') is None
+        with pytest.raises(ValueError):
+            allocator.reserve('10.0.6.0/23')
+        with pytest.raises(ValueError):
+            allocator.reserve('10.1.0.0/24')
+
+    def test_keys(self):
+        allocator = CidrAllocator('10.0.0.0/16')
+        assert allocator.allocate(24, key='a') == allocator.allocate(24, key='a') == '10.0.0.0/24'
+        assert allocator.allocate(24, key='b') == '10.0.1.0/24'
+        with pytest.raises(ValueError):
+            allocator.allocate(23, key='a')
+
+    def test_exhausted(self):
+        allocator = CidrAllocator('10.0.0.0/23')
+        allocator.allocate(24)
+        allocator.allocate(24)
+        with pytest.raises(ValueError):
+            allocator.allocate(28)
+
+    def test_child(self):
+        allocator = CidrAllocator('10.0.0.0/8')
+        vpc = allocator.allocate(16)
+        assert allocator.child(vpc) is allocator.child(vpc)
+        # An unallocated block is reserved so it isn't handed out again
+        assert allocator.child('10.1.0.0/16').allocate(24) == '10.1.0.0/24'
+        assert allocator.allocate(16) == '10.2.0.0/16'
+        with pytest.raises(ValueError):
+            allocator.child('10.1.0.0/24')
+        with pytest.raises(ValueError):
+            allocator.az_subnets('192.168.0.0/16', 24)
+
+    def test_template(self):
+        data = json.loads(VpcTemplate().to_json())
+        assert data['Resources']['VPC']['Properties']['CidrBlock'] == '10.0.0.0/16'
+        subnet = data['Resources']['A']['Properties']
+        assert subnet['CidrBlock'] == '10.0.0.0/24'
+        assert subnet['AvailabilityZone'] == {'Fn::Select': ['0', {'Fn::GetAZs': ''}]}
+        assert ALLOCATOR.az_subnets('10.0.0.0/16', 24, key='public')[2] == ('10.0.2.0/24', Select('2', GetAZs('')))
@@ -0,0 +1,104 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import pytest
+
+import stratosphere
+from stratosphere import Ref
+from stratosphere.deploy import CREATE, UPDATE, Backend, Deployer, FakeBackend, StackOutput, StackSpec
+from stratosphere.graph import CycleError
+
+
+class NetworkTemplate(stratosphere.Template):
+    def vpc(self):
+        return {'CidrBlock': '10.0.0.0/16'}
+
+    def out_VpcId(self):
+        return {'Value': Ref(self.vpc())}
+
+
+class AppTemplate(stratosphere.Template):
+    def param_VpcId(self):
+        return {'Type': 'String'}
+
+    def subnet(self):
+        return {'VpcId': Ref(self.param_VpcId()), 'CidrBlock': '10.0.0.0/24'}
+
+    def out_SubnetId(self):
+        return {'Value': Ref(self.subnet())}
+
+
+class TestDeploy(object):
+    def test_order_and_outputs(self):
+        backend = FakeBackend()
+        results = Deployer(backend).deploy([
+            StackSpec('app', AppTemplate, {'VpcId': StackOutput('network', 'VpcId')}),
+            StackSpec('network', NetworkTemplate()),
+        ])
+        assert list(results) == ['app', 'network']
+        assert backend.calls == [(CREATE, 'network'), (CREATE, 'app')]
+        assert results['network'].outputs == {'VpcId': 'network-VPC'}
+        assert results['app'].outputs == {'SubnetId': 'app-Subnet'}
+        assert backend.stacks['app'][1] == {'VpcId': 'network-VPC'}
+        # Everything exists now, so this time it updates
+        results = Deployer(backend).deploy([StackSpec('app', AppTemplate, {'VpcId': StackOutput('network', 'VpcId')})])
+        assert results['app'].action == UPDATE
+        assert results['app'].error is None
+
+    def test_concurrency(self):
+        backend = FakeBackend(latency=0.05)
+        specs = [StackSpec('net{}'.format(i), NetworkTemplate) for i in xrange(6)]
+        results = Deployer(backend, max_workers=3).deploy(specs)
+        assert all(result.error is None for result in results.itervalues())
+        assert backend.max_active == 3
+
+    def test_throttling(self):
+        delays = []
+        backend = FakeBackend(throttle=3)
+        results = Deployer(backend, base_delay=1.0, sleep=delays.append).deploy([StackSpec('network', NetworkTemplate)])
+        assert results['network'].attempts == 4
+        assert delays == [1.0, 2.0, 4.0]
+        results = Deployer(FakeBackend(throttle=10), max_retries=2, sleep=delays.append).deploy(
+            [StackSpec('network', NetworkTemplate)])
+        assert 'ThrottlingError' in results['network'].error
+
+    def test_failure_skips_dependents(self):
+        backend = FakeBackend(failures=['network'])
+        results = Deployer(backend).deploy([
+            StackSpec('network', NetworkTemplate),
+            StackSpec('app', AppTemplate, {'VpcId': StackOutput('network', 'VpcId')}),
+            StackSpec('other', NetworkTemplate),
+        ])
+        assert 'stack network failed' in results['network'].error
+        assert results['app'].error == 'dependency network failed'
+        assert results['other'].error is None
+        assert (CREATE, 'app') not in backend.calls
+
+    def test_cycle(self):
+        with pytest.raises(CycleError):
+            Deployer(FakeBackend()).deploy([
+                StackSpec('a', NetworkTemplate, depends_on=['b']),
+                StackSpec('b', NetworkTemplate, depends_on=['a']),
+            ])
+
+    def test_incomplete_backend(self):
+        class HalfBackend(Backend):
+            def stack_exists(self, name):
+                return False
+        with pytest.raises(TypeError):
+            HalfBackend()
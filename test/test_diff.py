@@ -0,0 +1,99 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import stratosphere
+from stratosphere import Ref
+from stratosphere.diff import Change, diff_templates
+
+
+class OldTemplate(stratosphere.Template):
+    def param_Foo(self):
+        return {'Type': 'String'}
+
+    def vpc(self):
+        return {'CidrBlock': '10.0.0.0/16'}
+
+    def subnet(self):
+        """I am a teapot."""
+        return {
+            'VpcId': Ref(self.vpc()),
+            'CidrBlock': '10.0.0.0/24',
+            'Tags': [{'Key': 'Foo', 'Value': 'Bar'}],
+        }
+
+    def rtb(self):
+        return {'VpcId': Ref('vpc-teapot')}
+
+    def ig(self):
+        return {}
+
+
+class TestDiff(object):
+    def test_no_changes(self):
+        assert diff_templates(OldTemplate(), OldTemplate()) == []
+
+    def test_reordered_tags(self):
+        class NewTemplate(OldTemplate):
+            def subnet(self):
+                subnet = super(NewTemplate, self).subnet()
+                subnet['Tags'].insert(0, {'Key': 'Description', 'Value': 'I am a teapot.'})
+                return subnet
+        assert diff_templates(OldTemplate(), NewTemplate()) == []
+
+    def test_changes(self):
+        class NewTemplate(OldTemplate):
+            ig = None
+            def param_Foo(self):
+                return {'Type': 'String', 'Default': 'foo'}
+            def rtb(self):
+                return {'VpcId': Ref('Foo')}
+            def param_Bar(self):
+                return {'Type': 'String'}
+        assert diff_templates(OldTemplate(), NewTemplate()) == [
+            Change('Parameters', 'Bar', 'Add', None, [], None),
+            Change('Parameters', 'Foo', 'Modify', None, [], None),
+            Change('Resources', 'InternetGateway', 'Remove', 'AWS::EC2::InternetGateway', [], None),
+            Change('Resources', 'RouteTable', 'Modify', 'AWS::EC2::RouteTable', ['VpcId'], 'Conditional'),
+        ]
+
+    def test_replacement_cascade(self):
+        class NewTemplate(OldTemplate):
+            def vpc(self):
+                return {'CidrBlock': '10.1.0.0/16'}
+        assert diff_templates(OldTemplate(), NewTemplate()) == [
+            Change('Resources', 'Subnet', 'Modify', 'AWS::EC2::Subnet', ['VpcId'], 'Conditional'),
+            Change('Resources', 'VPC', 'Modify', 'AWS::EC2::VPC', ['CidrBlock'], 'True'),
+        ]
+
+    def test_replacement_depends_on(self):
+        class DependsTemplate(OldTemplate):
+            def rtb(self):
+                return {'VpcId': Ref('vpc-teapot'), 'DependsOn': self.vpc()}
+        class NewTemplate(DependsTemplate):
+            def vpc(self):
+                return {'CidrBlock': '10.1.0.0/16'}
+        assert [change.name for change in diff_templates(DependsTemplate(), NewTemplate())] == ['Subnet', 'VPC']
+
+    def test_dicts(self):
+        old = {'Resources': {'A': {'Type': 'AWS::EC2::Subnet', 'Properties': {'CidrBlock': '10.0.0.0/24'}}}}
+        new = {'Resources': {'A': {'Type': 'AWS::EC2::Subnet', 'Properties': {'CidrBlock': '10.0.1.0/24'}},
+                             'B': {'Type': 'AWS::EC2::VPC'}}}
+        assert diff_templates(old, new) == [
+            Change('Resources', 'A', 'Modify', 'AWS::EC2::Subnet', ['CidrBlock'], 'True'),
+            Change('Resources', 'B', 'Add', 'AWS::EC2::VPC', [], None),
+        ]
@@ -0,0 +1,126 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import pytest
+
+import stratosphere
+from stratosphere import And, Equals, FindInMap, GetAtt, GetAZs, If, Join, Not, NoValue, Ref, Select
+from stratosphere.evaluate import EvaluationError, Evaluator
+
+
+class EvalTemplate(stratosphere.Template):
+    def param_Env(self):
+        return {'Type': 'String', 'Default': 'dev', 'AllowedValues': ['dev', 'prod']}
+
+    def param_Octet(self):
+        return {'Type': 'String'}
+
+    def map_Cidrs(self):
+        return {'dev': {'Vpc': '10.0.0.0/16'}, 'prod': {'Vpc': '10.1.0.0/16'}}
+
+    def cond_IsProd(self):
+        return Equals(Ref('Env'), 'prod')
+
+    def cond_IsDev(self):
+        return {'Fn::Not': [{'Condition': 'IsProd'}]}
+
+    def cond_IsBig(self):
+        return And(If('IsProd', True, False), Not(Equals(Ref('Octet'), '0')))
+
+    def vpc(self):
+        return {'CidrBlock': FindInMap(self.map_Cidrs(), Ref('Env'), 'Vpc')}
+
+    def subnet(self):
+        return {
+            'VpcId': Ref(self.vpc()),
+            'CidrBlock': Join('.', ['10', Ref('Octet'), '0', '0/24']),
+            'AvailabilityZone': Select('1', GetAZs('')),
+            'Tags': If('IsProd', NoValue, [{'Key': 'Dev', 'Value': 'true'}]),
+        }
+
+    def rtb(self):
+        return {'VpcId': Ref(self.vpc()), 'Condition': 'IsProd'}
+
+    def out_Vpc(self):
+        return {'Value': GetAtt(self.vpc(), 'CidrBlock')}
+
+
+class TestEvaluator(object):
+    def test_evaluate(self):
+        result = Evaluator(EvalTemplate()).evaluate({'Octet': '4'})
+        assert result.conditions == {'IsProd': False, 'IsDev': True, 'IsBig': False}
+        assert sorted(result.resources) == ['Subnet', 'VPC']
+        assert result.resources['VPC']['Properties'] == {'CidrBlock': '10.0.0.0/16'}
+        assert result.resources['Subnet']['Properties'] == {
+            'VpcId': 'VPC',
+            'CidrBlock': '10.4.0.0/24',
+            'AvailabilityZone': 'us-east-1b',
+            'Tags': [{'Key': 'Dev', 'Value': 'true'}],
+        }
+        assert result.outputs == {'Vpc': {'Fn::GetAtt': ['VPC', 'CidrBlock']}}
+
+    def test_evaluate_prod(self):
+        evaluator = Evaluator(EvalTemplate(), pseudo_parameters={'AWS::Region': 'us-west-2'},
+                              attributes={('VPC', 'CidrBlock'): '10.1.0.0/16'})
+        result = evaluator.evaluate({'Env': 'prod', 'Octet': '4'})
+        assert result.conditions == {'IsProd': True, 'IsDev': False, 'IsBig': True}
+        assert result.resources['RouteTable']['Properties'] == {'VpcId': 'VPC'}
+        assert 'Tags' not in result.resources['Subnet']['Properties']
+        assert result.resources['Subnet']['Properties']['AvailabilityZone'] == 'us-west-2b'
+        assert result.outputs == {'Vpc': '10.1.0.0/16'}
+
+    def test_errors(self):
+        evaluator = Evaluator(EvalTemplate())
+        with pytest.raises(EvaluationError):
+            evaluator.evaluate()
+        with pytest.raises(EvaluationError):
+            evaluator.evaluate({'Env': 'staging', 'Octet': '4'})
+        with pytest.raises(EvaluationError):
+            evaluator.evaluate({'Octet': '4', 'Teapot': 'short'})
+
+    def test_shared_subexpressions(self):
+        join = {'Fn::Join': ['', ['a', {'Ref': 'AWS::Region'}]]}
+        template = {'Resources': {
+            'A': {'Type': 'AWS::EC2::VPC', 'Properties': {'CidrBlock': join}},
+            'B': {'Type': 'AWS::EC2::VPC', 'Properties': {'CidrBlock': dict(join)}},
+        }}
+        evaluator = Evaluator(template)
+        assert evaluator.template['Resources']['A']['Properties'] is evaluator.template['Resources']['B']['Properties']
+        result = evaluator.evaluate()
+        assert result.resources['A']['Properties']['CidrBlock'] == 'aus-east-1'
+
+    def test_join_scalars(self):
+        template = {'Resources': {'A': {'Type': 'AWS::EC2::VPC', 'Properties': {
+            'CidrBlock': {'Fn::Join': ['-', ['a', 1, 2.5, True, False]]},
+        }}}}
+        result = Evaluator(template).evaluate()
+        assert result.resources['A']['Properties']['CidrBlock'] == 'a-1-2.5-true-false'
+
+    def test_join_non_scalar(self):
+        for value in (['b'], {'c': 'd'}, None):
+            template = {'Resources': {'A': {'Type': 'AWS::EC2::VPC', 'Properties': {
+                'CidrBlock': {'Fn::Join': ['-', ['a', value]]},
+            }}}}
+            with pytest.raises(EvaluationError):
+                Evaluator(template).evaluate()
+
+    def test_partial(self):
+        template = {'Parameters': {'Env': {'Type': 'String', 'Default': 'dev'}}, 'Resources': {}}
+        value = {'Fn::Join': ['-', ['a', 'b', {'Ref': 'Env'}]]}
+        assert Evaluator(template).partial().resolve(value) == {'Fn::Join': ['-', ['a-b', {'Ref': 'Env'}]]}
+        assert Evaluator(template).partial({'Env': 'prod'}).resolve(value) == 'a-b-prod'
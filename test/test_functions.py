@@ -0,0 +1,74 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+
+import troposphere
+
+import stratosphere
+from stratosphere import GetAtt, Join, NoValue, Or, Ref, Select
+from stratosphere.base import StratospherePendingObject
+
+
+class TestInterning(object):
+    def test_same_args(self):
+        assert Ref('VPC') is Ref('VPC')
+        assert GetAtt('ELB', 'DNSName') is GetAtt('ELB', 'DNSName')
+        assert Join('', ['a', Ref('VPC')]) is Join('', ['a', Ref('VPC')])
+        assert Ref('VPC') is not Ref('Subnet')
+
+    def test_no_value(self):
+        assert Ref('AWS::NoValue') is NoValue
+        assert NoValue.JSONrepr() == {'Ref': 'AWS::NoValue'}
+
+    def test_types_distinct(self):
+        assert Select(1, ['a']) is not Select(True, ['a'])
+        assert Select(1, ['a']) is not Select(1, ('a',))
+        assert json.dumps(Select(True, ['a']).JSONrepr()) == '{"Fn::Select": [true, ["a"]]}'
+
+    def test_pending_object(self):
+        pending = StratospherePendingObject('VPC', stratosphere.ec2.VPC, CidrBlock='10.0.0.0/16')
+        assert Ref(pending) is Ref('VPC')
+        assert GetAtt(stratosphere.ec2.VPC('VPC', CidrBlock='10.0.0.0/16'), 'CidrBlock') is GetAtt('VPC', 'CidrBlock')
+        # Joined values aren't run through getdata(), so the object matters
+        assert Join('', [pending]) is not Join('', [pending])
+
+    def test_uninternable(self):
+        tags = troposphere.Tags(Name='foo')
+        assert Join('', [tags]) is not Join('', [tags])
+        assert Join('', [tags]).JSONrepr() == {'Fn::Join': ['', [tags]]}
+
+    def test_mutated_args(self):
+        values = ['x']
+        join = Join('', values)
+        values.append('y')
+        assert join.JSONrepr() == {'Fn::Join': ['', ['x']]}
+        assert Join('', ['x']) is join
+        assert Join('', values).JSONrepr() == {'Fn::Join': ['', ['x', 'y']]}
+        mapping = {'a': ['b']}
+        select = Select(0, [mapping])
+        mapping['a'].append('c')
+        assert Select(0, [{'a': ['b']}]).JSONrepr() == {'Fn::Select': [0, [{'a': ['b']}]]}
+        assert Select(0, [{'a': ['b']}]) is select
+
+    def test_troposphere_or(self):
+        condition = Or(Ref('A'), Ref('B'))
+        assert isinstance(condition, troposphere.Or)
+        assert Or(Ref('A'), Ref('B')) is condition
+        assert json.loads(json.dumps(condition, cls=troposphere.awsencode)) == {
+            'Fn::Or': [{'Ref': 'A'}, {'Ref': 'B'}]}
@@ -0,0 +1,68 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import pytest
+
+import stratosphere
+from stratosphere import GetAtt, Join, Ref
+from stratosphere.graph import CycleError, DependencyGraph
+
+
+class GraphTemplate(stratosphere.Template):
+    def param_Foo(self):
+        return {'Type': 'String'}
+
+    def vpc(self):
+        return {'CidrBlock': '10.0.0.0/16'}
+
+    def subnet(self):
+        return {'VpcId': Ref(self.vpc()), 'CidrBlock': Join('', [Ref('Foo'), '/24'])}
+
+    def rtb(self):
+        return {'VpcId': GetAtt(self.vpc(), 'VpcId'), 'DependsOn': self.subnet()}
+
+    def srta(self):
+        return {'SubnetId': Ref(self.subnet()), 'RouteTableId': Ref(self.rtb())}
+
+
+class TestDependencyGraph(object):
+    def test_graph(self):
+        graph = GraphTemplate().dependency_graph()
+        assert graph.nodes == ['RouteTable', 'Subnet', 'SubnetRouteTableAssociation', 'VPC']
+        assert graph.dependencies('RouteTable') == ['Subnet', 'VPC']
+        assert graph.dependents('VPC') == ['RouteTable', 'Subnet']
+        assert graph.dependents('VPC', recursive=True) == ['RouteTable', 'Subnet', 'SubnetRouteTableAssociation']
+        edges = dict(((s, t), k) for s, t, k in graph.edges())
+        assert edges[('RouteTable', 'Subnet')] == set(['DependsOn'])
+        assert edges[('RouteTable', 'VPC')] == set(['GetAtt'])
+
+    def test_topological_order(self):
+        graph = GraphTemplate().dependency_graph()
+        assert graph.topological_order() == ['VPC', 'Subnet', 'RouteTable', 'SubnetRouteTableAssociation']
+        assert graph.find_cycles() == []
+
+    def test_cycle(self):
+        graph = DependencyGraph({
+            'A': {'Type': 'AWS::EC2::VPC', 'DependsOn': 'B'},
+            'B': {'Type': 'AWS::EC2::VPC', 'Properties': {'Foo': {'Fn::GetAtt': ['A', 'Bar']}}},
+            'C': {'Type': 'AWS::EC2::VPC', 'Properties': {'Foo': {'Ref': 'C'}}},
+            'D': {'Type': 'AWS::EC2::VPC', 'DependsOn': ['A']},
+        })
+        assert graph.find_cycles() == [['A', 'B'], ['C']]
+        with pytest.raises(CycleError):
+            graph.topological_order()
@@ -0,0 +1,92 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import StringIO
+
+import stratosphere
+from stratosphere import Equals, GetAtt, If, Join, NoValue, Ref
+from stratosphere.loader import RawResource, load_template, loads
+
+
+class SourceTemplate(stratosphere.Template):
+    """A template to load back in."""
+
+    def param_Env(self):
+        return {'Type': 'String', 'Default': 'dev', 'AllowedValues': ['dev', 'prod']}
+
+    def cond_IsProd(self):
+        return Equals(Ref(self.param_Env()), 'prod')
+
+    def map_Cidrs(self):
+        return {'dev': {'Block': '10.0.0.0/16'}}
+
+    def vpc(self):
+        return {'CidrBlock': '10.0.0.0/16', 'EnableDnsSupport': 'true'}
+
+    def subnet(self):
+        return {
+            'VpcId': Ref(self.vpc()),
+            'CidrBlock': Join('.', ['10', '0', '1', '0/24']),
+            'AvailabilityZone': If('IsProd', 'us-east-1a', NoValue),
+            'DependsOn': self.ig(),
+        }
+
+    def ig(self):
+        return {}
+
+    def out_Vpc(self):
+        return {'Value': GetAtt(self.vpc(), 'CidrBlock')}
+
+
+class TestLoader(object):
+    def test_round_trip(self):
+        data = SourceTemplate().to_json()
+        template = load_template(data)
+        assert template.to_json() == data
+        assert isinstance(template.resources['VPC'], stratosphere.ec2.VPC)
+        assert template.resources['Subnet'].VpcId is Ref('VPC')
+        assert template.resources['Subnet'].resource['DependsOn'] == 'InternetGateway'
+        assert template.dependency_graph().dependencies('Subnet') == ['InternetGateway', 'VPC']
+
+    def test_functions(self):
+        data = loads('{"a": {"Fn::GetAtt": ["ELB", "DNSName"]}, "b": {"Ref": "X", "Other": 1}, '
+                     '"c": {"Fn::Equals": [1]}}')
+        assert data['a'] is GetAtt('ELB', 'DNSName')
+        assert data['b'] == {'Ref': 'X', 'Other': 1}
+        assert data['c'] == {'Fn::Equals': [1]}
+
+    def test_raw(self):
+        data = {'Resources': {
+            'Queue': {'Type': 'AWS::SQS::Queue', 'Properties': {'DelaySeconds': 5}},
+            'Gateway': {'Type': 'AWS::EC2::InternetGateway', 'DeletionPolicy': 'Retain'},
+            'Bool': {'Type': 'AWS::EC2::VPC', 'Properties': {'CidrBlock': '10.0.0.0/16', 'EnableDnsSupport': True}},
+        }}
+        template = load_template(StringIO.StringIO(json.dumps(data)))
+        assert isinstance(template.resources['Queue'], RawResource)
+        assert isinstance(template.resources['Gateway'], RawResource)
+        assert json.loads(template.to_json()) == data
+
+    def test_lazy(self):
+        data = SourceTemplate().to_json()
+        template = load_template(data, lazy=True)
+        assert template.resources == {}
+        assert template.logical_ids() == ['InternetGateway', 'Subnet', 'VPC']
+        assert template.get_object('VPC').CidrBlock == '10.0.0.0/16'
+        assert list(template._pending) == ['InternetGateway', 'Subnet']
+        assert template.to_json() == data
@@ -0,0 +1,85 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import collections
+import json
+
+import pytest
+
+import stratosphere
+from stratosphere import Ref
+from stratosphere.matrix import build_matrix, render_matrix
+
+
+CALLS = collections.Counter()
+
+
+class FleetTemplate(stratosphere.Template):
+    """A fleet."""
+
+    def vpc(self):
+        CALLS['vpc'] += 1
+        return {'CidrBlock': '10.0.0.0/16'}
+
+    def subnet(self):
+        CALLS['subnet'] += 1
+        return {'VpcId': Ref(self.vpc()), 'CidrBlock': self.inputs['cidr']}
+
+    def param_Env(self):
+        CALLS['param_Env'] += 1
+        return {'Type': 'String', 'Default': self.inputs.get('env', 'dev')}
+
+
+VARIANTS = collections.OrderedDict([
+    ('dev', {'cidr': '10.0.1.0/24'}),
+    ('prod', {'cidr': '10.0.2.0/24', 'env': 'prod'}),
+    ('qa', {'cidr': '10.0.1.0/24', 'env': 'dev'}),
+])
+
+
+class TestMatrix(object):
+    def setup_method(self, method):
+        CALLS.clear()
+
+    def test_build(self):
+        templates = build_matrix(FleetTemplate, VARIANTS)
+        assert list(templates) == ['dev', 'prod', 'qa']
+        for name, inputs in VARIANTS.iteritems():
+            expected = json.loads(FleetTemplate(inputs=inputs).to_json())
+            assert json.loads(templates[name].to_json()) == expected
+        assert templates['prod'].resources['Subnet'].CidrBlock == '10.0.2.0/24'
+        assert templates['dev'].parameters['Env'].Default == 'dev'
+
+    def test_shared_work(self):
+        build_matrix(FleetTemplate, VARIANTS)
+        # vpc doesn't read any inputs, subnet only reads cidr (which repeats
+        # in qa) and param_Env's missing key in dev is not the same as 'dev'
+        assert CALLS['vpc'] == 1 + 2
+        assert CALLS['subnet'] == 2
+        assert CALLS['param_Env'] == 3
+
+    def test_render_parallel(self):
+        serial = render_matrix(FleetTemplate, VARIANTS)
+        parallel = render_matrix(FleetTemplate, VARIANTS.items(), processes=2)
+        assert serial == parallel
+        assert list(parallel) == ['dev', 'prod', 'qa']
+        assert json.loads(parallel['qa'])['Description'] == 'A fleet.'
+
+    def test_duplicate_variant(self):
+        with pytest.raises(ValueError):
+            build_matrix(FleetTemplate, [('dev', {}), ('dev', {})])
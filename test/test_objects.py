@@ -54,3 +54,19 @@ class TestObjects(object):
                 },
             },
         }
+
+    def test_defaults_per_class(self):
+        class MySubnet(stratosphere.ec2.Subnet):
+            CidrBlock = '10.0.0.0/16'
+        class MyOtherSubnet(MySubnet):
+            def AvailabilityZone(self):
+                return 'us-east-1a'
+        assert MySubnet('One', VpcId='vpc-teapot').properties == {
+            'VpcId': 'vpc-teapot', 'CidrBlock': '10.0.0.0/16'}
+        assert MyOtherSubnet('Two', VpcId='vpc-teapot').properties == {
+            'VpcId': 'vpc-teapot', 'CidrBlock': '10.0.0.0/16', 'AvailabilityZone': 'us-east-1a'}
+        assert MySubnet('Three', VpcId='vpc-teapot', CidrBlock='10.1.0.0/16').properties['CidrBlock'] == '10.1.0.0/16'
+        assert vars(MySubnet)['_stratosphere_defaults'] == ('CidrBlock',)
+        assert sorted(vars(MyOtherSubnet)['_stratosphere_defaults']) == ['AvailabilityZone', 'CidrBlock']
+        assert stratosphere.ec2.Subnet._defaults() == ()
+        assert vars(stratosphere.ec2.Subnet)['_stratosphere_defaults'] == ()
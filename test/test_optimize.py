@@ -0,0 +1,114 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import stratosphere
+from stratosphere import And, Equals, FindInMap, If, Join, NoValue, Ref
+from stratosphere.optimize import optimize
+
+
+class OptTemplate(stratosphere.Template):
+    def param_Env(self):
+        return {'Type': 'String', 'Default': 'dev'}
+
+    def param_Region(self):
+        return {'Type': 'String'}
+
+    def param_Unused(self):
+        return {'Type': 'String'}
+
+    def map_Cidrs(self):
+        return {'dev': {'Vpc': '10.0.0.0/16'}, 'prod': {'Vpc': '10.1.0.0/16'}}
+
+    def map_Amis(self):
+        return {'us-east-1': {'Ami': 'ami-1'}}
+
+    def cond_IsProd(self):
+        return Equals(Ref('Env'), 'prod')
+
+    def cond_IsEast(self):
+        return Equals(Ref('Region'), 'us-east-1')
+
+    def cond_IsProdEast(self):
+        return And({'Condition': 'IsProd'}, {'Condition': 'IsEast'})
+
+    def vpc(self):
+        return {
+            'CidrBlock': FindInMap(self.map_Cidrs(), Ref('Env'), 'Vpc'),
+            'Tags': [{'Key': 'Name', 'Value': Join('-', ['vpc', Ref('Env'), 'main'])}],
+        }
+
+    def subnet(self):
+        return {
+            'VpcId': Ref(self.vpc()),
+            'CidrBlock': If('IsProdEast', '10.1.0.0/24', '10.0.0.0/24'),
+            'AvailabilityZone': If('IsProd', 'us-east-1a', NoValue),
+        }
+
+    def rtb(self):
+        return {'VpcId': Ref(self.vpc()), 'Condition': 'IsProd'}
+
+    def route(self):
+        return {
+            'RouteTableId': Ref('RouteTable'),
+            'DestinationCidrBlock': '0.0.0.0/0',
+            'GatewayId': Ref('Region'),
+            'Condition': 'IsProd',
+        }
+
+    def srta(self):
+        return {
+            'SubnetId': Ref(self.subnet()),
+            'RouteTableId': Ref(self.vpc()),
+            'DependsOn': ['RouteTable', 'Subnet'],
+        }
+
+
+class TestOptimize(object):
+    def test_no_parameters(self):
+        t = optimize(OptTemplate())
+        assert sorted(t['Parameters']) == ['Env', 'Region']
+        assert sorted(t['Conditions']) == ['IsEast', 'IsProd', 'IsProdEast']
+        assert sorted(t['Mappings']) == ['Cidrs']
+        assert sorted(t['Resources']) == ['Route', 'RouteTable', 'Subnet', 'SubnetRouteTableAssociation', 'VPC']
+        assert t['Resources']['VPC']['Properties']['Tags'] == [
+            {'Key': 'Name', 'Value': {'Fn::Join': ['-', ['vpc', {'Ref': 'Env'}, 'main']]}},
+        ]
+        assert t['Resources']['Subnet']['Properties']['AvailabilityZone'] == \
+            {'Fn::If': ['IsProd', 'us-east-1a', {'Ref': 'AWS::NoValue'}]}
+
+    def test_dev(self):
+        t = optimize(OptTemplate(), {'Env': 'dev'})
+        assert 'Conditions' not in t
+        assert 'Mappings' not in t
+        assert 'Parameters' not in t
+        assert sorted(t['Resources']) == ['Subnet', 'SubnetRouteTableAssociation', 'VPC']
+        assert t['Resources']['VPC']['Properties'] == {
+            'CidrBlock': '10.0.0.0/16',
+            'Tags': [{'Key': 'Name', 'Value': 'vpc-dev-main'}],
+        }
+        assert t['Resources']['Subnet']['Properties'] == {'VpcId': {'Ref': 'VPC'}, 'CidrBlock': '10.0.0.0/24'}
+        assert t['Resources']['SubnetRouteTableAssociation']['DependsOn'] == ['Subnet']
+
+    def test_prod(self):
+        t = optimize(OptTemplate(), {'Env': 'prod'})
+        assert t['Conditions'] == {'IsProdEast': {'Fn::Equals': [{'Ref': 'Region'}, 'us-east-1']}}
+        assert t['Resources']['Subnet']['Properties']['CidrBlock'] == \
+            {'Fn::If': ['IsProdEast', '10.1.0.0/24', '10.0.0.0/24']}
+        assert t['Resources']['Subnet']['Properties']['AvailabilityZone'] == 'us-east-1a'
+        assert 'Condition' not in t['Resources']['RouteTable']
+        assert t['Resources']['VPC']['Properties']['CidrBlock'] == '10.1.0.0/16'
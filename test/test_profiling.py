@@ -0,0 +1,58 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import gc
+
+import stratosphere
+from stratosphere import Ref
+from stratosphere.profiling import Profiler
+
+
+class ProfiledTemplate(stratosphere.Template):
+    def param_Foo(self):
+        return {'Type': 'String'}
+
+    def subnet_One(self):
+        return {'VpcId': Ref('vpc-teapot'), 'CidrBlock': '10.0.0.0/16'}
+
+    def subnet_Two(self):
+        return {'VpcId': Ref('vpc-teapot'), 'CidrBlock': '10.1.0.0/16'}
+
+
+class TestProfiler(object):
+    def test_report(self):
+        profiler = Profiler()
+        ProfiledTemplate(profiler=profiler)
+        entries = dict(((e.phase, e.key), e) for e in profiler.report())
+        assert sorted(entries) == [
+            ('add', 'Parameter'), ('add', 'Subnet'),
+            ('call', 'param_Foo'), ('call', 'subnet_One'), ('call', 'subnet_Two'),
+            ('to_object', 'Parameter'), ('to_object', 'Subnet'),
+        ]
+        assert entries[('to_object', 'Subnet')].calls == 2
+        assert entries[('call', 'subnet_One')].calls == 1
+        assert entries[('to_object', 'Subnet')].allocations > 0
+        assert sorted(profiler.phases()) == ['add', 'call', 'to_object']
+        assert gc.isenabled()
+
+    def test_collapsed(self):
+        profiler = Profiler()
+        ProfiledTemplate(profiler=profiler)
+        lines = profiler.to_collapsed().splitlines()
+        assert len(lines) == 7
+        assert any(line.startswith('ProfiledTemplate;call;subnet_One ') for line in lines)
@@ -0,0 +1,68 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+
+import stratosphere
+from stratosphere import Ref
+from stratosphere.render import render_templates
+
+
+class OneTemplate(stratosphere.Template):
+    def subnet(self):
+        return {'VpcId': Ref('vpc-teapot'), 'CidrBlock': '10.0.0.0/16'}
+
+
+class TwoTemplate(stratosphere.Template):
+    def param_Foo(self):
+        return {'Type': 'String'}
+
+
+class BrokenTemplate(stratosphere.Template):
+    def subnet(self):
+        raise ValueError('I am a teapot')
+
+
+class TestRender(object):
+    def test_render(self, tmpdir):
+        results = render_templates([OneTemplate, TwoTemplate], str(tmpdir), processes=2)
+        assert [r.name for r in results] == ['OneTemplate', 'TwoTemplate']
+        assert all(r.error is None for r in results)
+        assert json.load(tmpdir.join('OneTemplate.json'))['Resources']['Subnet']['Type'] == 'AWS::EC2::Subnet'
+        assert json.load(tmpdir.join('TwoTemplate.json'))['Parameters'] == {'Foo': {'Type': 'String'}}
+
+    def test_render_error(self, tmpdir):
+        results = render_templates([BrokenTemplate, OneTemplate], str(tmpdir), processes=2)
+        assert results[0].path is None
+        assert 'I am a teapot' in results[0].error
+        assert results[1].error is None
+
+    def test_render_module(self, tmpdir):
+        results = render_templates([__name__], str(tmpdir), processes=1)
+        assert [r.name for r in results] == ['BrokenTemplate', 'OneTemplate', 'TwoTemplate']
+
+    def test_render_error_keeps_output(self, tmpdir):
+        class InvalidTemplate(stratosphere.Template):
+            def subnet(self):
+                return {'VpcId': Ref('vpc-teapot')} # No CidrBlock, fails while writing
+        tmpdir.join('InvalidTemplate.json').write('{"previous": true}')
+        results = render_templates([InvalidTemplate], str(tmpdir), processes=1)
+        assert results[0].path is None
+        assert 'CidrBlock' in results[0].error
+        assert json.load(tmpdir.join('InvalidTemplate.json')) == {'previous': True}
+        assert [path.basename for path in tmpdir.listdir()] == ['InvalidTemplate.json']
@@ -0,0 +1,95 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import pytest
+
+import stratosphere
+from stratosphere import Ref
+from stratosphere.cidr import collapse, format_cidr, parse_cidr
+from stratosphere.secgroups import GroupReport, compact_rules, compact_security_groups
+
+
+def rule(cidr, from_port, to_port=None, protocol='tcp'):
+    return {'IpProtocol': protocol, 'FromPort': from_port, 'ToPort': from_port if to_port is None else to_port,
+            'CidrIp': cidr}
+
+
+class TestCidr(object):
+    def test_parse(self):
+        assert parse_cidr('10.1.0.0/16') == (0x0a010000, 16)
+        assert format_cidr(parse_cidr('192.168.1.128/25')) == '192.168.1.128/25'
+        for bad in ('10.0.0.1/16', '10.0.0.0/33', '10.0.0/8', 'teapot'):
+            with pytest.raises(ValueError):
+                parse_cidr(bad)
+
+    def test_collapse(self):
+        blocks = [parse_cidr(cidr) for cidr in ('10.0.0.0/24', '10.0.1.0/24', '10.0.2.0/23', '10.0.1.128/25',
+                                                 '10.0.8.0/24')]
+        assert [format_cidr(block) for block in collapse(blocks)] == ['10.0.0.0/22', '10.0.8.0/24']
+
+
+class TestCompactRules(object):
+    def test_ports(self):
+        assert compact_rules([rule('10.0.0.0/8', 80), rule('10.0.0.0/8', 81, 90), rule('10.0.0.0/8', 85, 100),
+                              rule('10.0.0.0/8', 443)]) == [rule('10.0.0.0/8', 80, 100), rule('10.0.0.0/8', 443)]
+
+    def test_blocks(self):
+        assert compact_rules([rule('10.0.0.0/25', 22), rule('10.0.0.128/25', 22), rule('10.0.1.0/24', 22),
+                              rule('10.0.1.0/24', 22, protocol='udp')]) == [
+            rule('10.0.0.0/23', 22), rule('10.0.1.0/24', 22, protocol='udp')]
+
+    def test_subsumed(self):
+        assert compact_rules([rule('10.0.0.0/8', 0, 65535), rule('10.1.0.0/16', 80), rule('10.1.0.0/16', 53, protocol='17'),
+                              rule('192.168.0.0/16', -1, protocol='-1'), rule('192.168.1.0/24', 8, protocol='icmp')]) == [
+            rule('192.168.0.0/16', -1, protocol='-1'),
+            rule('10.0.0.0/8', 0, 65535),
+            rule('10.1.0.0/16', 53, protocol='udp'),
+        ]
+
+    def test_opaque(self):
+        source = {'IpProtocol': 'tcp', 'FromPort': 80, 'ToPort': 80, 'SourceSecurityGroupId': {'Ref': 'Elb'}}
+        cidr = {'IpProtocol': 'tcp', 'FromPort': 80, 'ToPort': 80, 'CidrIp': {'Ref': 'Cidr'}}
+        assert compact_rules([source, cidr, dict(source), rule('10.0.0.0/8', '22')]) == [
+            rule('10.0.0.0/8', '22'), source, cidr]
+
+
+class TestCompactSecurityGroups(object):
+    def test_template(self):
+        class MyTemplate(stratosphere.Template):
+            def sg_One(self):
+                return {'GroupDescription': 'One', 'VpcId': 'vpc-teapot', 'SecurityGroupIngress': [
+                    rule('10.0.{}.0/24'.format(i), 443) for i in xrange(64)]}
+
+            def sg_Two(self):
+                return {'GroupDescription': 'Two', 'VpcId': 'vpc-teapot', 'SecurityGroupIngress': [
+                    rule('10.0.0.0/18', 443)]}
+
+            def sg_Three(self):
+                return {'GroupDescription': 'Three', 'VpcId': 'vpc-teapot', 'SecurityGroupIngress': [
+                    rule('10.{}.0.0/16'.format(i * 2), 22) for i in xrange(60)]}
+        template = MyTemplate()
+        template.add_resource(stratosphere.ec2.SecurityGroupIngress(
+            'Extra', GroupId=Ref('Three'), IpProtocol='tcp', FromPort='80', ToPort='80', CidrIp='10.0.0.0/8'))
+        analysis = compact_security_groups(template)
+        assert analysis.template['Resources']['One']['Properties']['SecurityGroupIngress'] == [rule('10.0.0.0/18', 443)]
+        assert analysis.groups == [
+            GroupReport('One', 'ingress', 64, 1, True),
+            GroupReport('Three', 'ingress', 61, 61, False),
+            GroupReport('Two', 'ingress', 1, 1, True),
+        ]
+        assert analysis.duplicates == [['One', 'Two']]
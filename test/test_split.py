@@ -0,0 +1,156 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+
+import pytest
+
+import stratosphere
+from stratosphere import GetAtt, Ref
+from stratosphere.split import split_template
+from stratosphere.validate import ERROR, validate_templates
+
+
+class SplitTemplate(stratosphere.Template):
+    def param_Cidr(self):
+        return {'Type': 'String'}
+
+    def vpc(self):
+        return {'CidrBlock': Ref('Cidr')}
+
+    def subnet_One(self):
+        return {'VpcId': Ref(self.vpc()), 'CidrBlock': '10.0.0.0/24'}
+
+    def subnet_Two(self):
+        return {'VpcId': Ref(self.vpc()), 'CidrBlock': '10.0.1.0/24', 'DependsOn': self.subnet_One()}
+
+    def rtb(self):
+        return {'VpcId': GetAtt(self.vpc(), 'VpcId')}
+
+    def ig(self):
+        return {}
+
+    def out_VpcId(self):
+        return {'Value': Ref(self.vpc())}
+
+
+def hub_template(subnets, asgs):
+    """A VPC with subnets and route tables, plus ASGs that each use every subnet."""
+    d = {}
+    def vpc(self):
+        return {'CidrBlock': '10.0.0.0/8'}
+    d['vpc'] = vpc
+    for i in xrange(subnets):
+        d['subnet_Subnet{}'.format(i)] = lambda self, i=i: {'VpcId': Ref('VPC'), 'CidrBlock': '10.0.{}.0/24'.format(i)}
+        d['rtb_RouteTable{}'.format(i)] = lambda self: {'VpcId': Ref('VPC')}
+        d['srta_Association{}'.format(i)] = lambda self, i=i: {
+            'SubnetId': Ref('Subnet{}'.format(i)), 'RouteTableId': Ref('RouteTable{}'.format(i))}
+    for i in xrange(asgs):
+        d['lc_Config{}'.format(i)] = lambda self: {'ImageId': 'ami-12345678', 'InstanceType': 'm3.medium'}
+        d['asg_Group{}'.format(i)] = lambda self, i=i: {
+            'AvailabilityZones': ['us-east-1a'], 'LaunchConfigurationName': Ref('Config{}'.format(i)),
+            'MinSize': '1', 'MaxSize': '1', 'VPCZoneIdentifier': [Ref('Subnet{}'.format(j)) for j in xrange(subnets)]}
+    return type('HubTemplate', (stratosphere.Template,), d)
+
+
+class TestSplit(object):
+    def test_fits(self):
+        result = split_template(SplitTemplate())
+        assert result.children == {}
+        assert result.parent == json.loads(SplitTemplate().to_json())
+
+    def test_split(self):
+        result = split_template(SplitTemplate(), max_resources=3)
+        assert list(result.children) == ['Stack1', 'Stack2']
+        owner = dict((name, stack) for stack, child in result.children.iteritems() for name in child['Resources'])
+        assert sorted(owner) == ['InternetGateway', 'One', 'RouteTable', 'Two', 'VPC']
+        assert all(len(child['Resources']) <= 3 for child in result.children.itervalues())
+        # Every reference that crosses stacks goes through an output and a parameter
+        for stack_name, child in result.children.iteritems():
+            stack = result.parent['Resources'][stack_name]
+            assert stack['Type'] == 'AWS::CloudFormation::Stack'
+            for name, value in stack['Properties'].get('Parameters', {}).iteritems():
+                assert name in child['Parameters']
+                if 'Fn::GetAtt' in value:
+                    source, output = value['Fn::GetAtt']
+                    assert output[len('Outputs.'):] in result.children[source]['Outputs']
+        vpc_stack = owner['VPC']
+        assert result.children[vpc_stack]['Parameters'] == {'Cidr': {'Type': 'String'}}
+        assert result.parent['Outputs']['VpcId'] == {'Value': {'Fn::GetAtt': [vpc_stack, 'Outputs.VPC']}}
+        assert 'TemplateBaseURL' in result.parent['Parameters']
+
+    def test_depends_on(self):
+        result = split_template(SplitTemplate(), max_resources=1,
+                                template_url=lambda name: 'https://example.com/{}'.format(name))
+        assert len(result.children) == 5
+        stacks = result.parent['Resources']
+        two = [name for name, child in result.children.iteritems() if 'Two' in child['Resources']][0]
+        one = [name for name, child in result.children.iteritems() if 'One' in child['Resources']][0]
+        assert 'DependsOn' not in result.children[two]['Resources']['Two']
+        assert stacks[two]['DependsOn'] == [one]
+        assert stacks[two]['Properties']['TemplateURL'] == 'https://example.com/{}'.format(two)
+        assert 'TemplateBaseURL' not in result.parent['Parameters']
+
+    def test_limits(self):
+        result = split_template(hub_template(70, 4)(), max_resources=100)
+        assert len(result.children) > 1
+        templates = dict(result.children, Parent=result.parent)
+        assert [p for p in validate_templates(templates, processes=1) if p.severity == ERROR] == []
+        # Groups in different stacks couldn't both hold subnets the other uses
+        stack = [child for child in result.children.itervalues() if 'Group0' in child['Resources']][0]
+        assert all('Group{}'.format(i) in stack['Resources'] for i in xrange(4))
+
+    def test_impossible(self):
+        # The groups have to share a stack, and 12 resources doesn't leave
+        # room for enough subnets to get under 60 parameters
+        with pytest.raises(ValueError) as excinfo:
+            split_template(hub_template(70, 4)(), max_resources=12)
+        assert 'parameters' in str(excinfo.value)
+
+    def test_parameter_types(self):
+        template = {'Parameters': {'Zones': {'Type': 'CommaDelimitedList'}}, 'Resources': {
+            'Zone': {'Type': 'AWS::Route53::HostedZone', 'Properties': {'Name': 'example.com'}},
+            'Group': {'Type': 'AWS::AutoScaling::AutoScalingGroup', 'Properties': {
+                'AvailabilityZones': {'Ref': 'Zones'}, 'MinSize': '1', 'MaxSize': '1',
+                'LaunchConfigurationName': 'lc', 'Tags': [
+                    {'Key': 'DNS', 'Value': {'Fn::Join': [' ', {'Fn::GetAtt': ['Zone', 'NameServers']}]},
+                     'PropagateAtLaunch': True},
+                    {'Key': 'Zone', 'Value': {'Ref': 'Zone'}, 'PropagateAtLaunch': True}]}},
+        }}
+        result = split_template(template, max_resources=1)
+        owner = dict((name, stack) for stack, child in result.children.iteritems() for name in child['Resources'])
+        zone, group = owner['Zone'], owner['Group']
+        assert result.children[zone]['Outputs']['ZoneNameServers'] == {
+            'Value': {'Fn::Join': [',', {'Fn::GetAtt': ['Zone', 'NameServers']}]}}
+        assert result.children[group]['Parameters'] == {
+            'Zones': {'Type': 'CommaDelimitedList'},
+            'ZoneNameServers': {'Type': 'CommaDelimitedList'},
+            'Zone': {'Type': 'String'},
+        }
+        assert result.parent['Resources'][group]['Properties']['Parameters']['Zones'] == {
+            'Fn::Join': [',', {'Ref': 'Zones'}]}
+
+    def test_parent_parameters(self):
+        template = json.loads(SplitTemplate().to_json())
+        for i in xrange(59):
+            template['Parameters']['Extra{}'.format(i)] = {'Type': 'String'}
+        with pytest.raises(ValueError) as excinfo:
+            split_template(template, max_resources=3)
+        assert 'template_url' in str(excinfo.value)
+        result = split_template(template, max_resources=3, template_url=lambda name: name)
+        assert len(result.parent['Parameters']) == 60
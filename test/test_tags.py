@@ -0,0 +1,121 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+
+import pytest
+import troposphere
+
+import stratosphere
+from stratosphere import If, Ref, autoscaling, ec2, iam, limits
+from stratosphere.tags import apply_tags, tag_policy
+from stratosphere.validate import validate_templates
+
+
+class TestTagPolicy(object):
+    def test_policy(self):
+        assert tag_policy(ec2.VPC).taggable
+        assert not tag_policy(iam.Role).taggable
+        assert tag_policy(autoscaling.AutoScalingGroup).extra == {'PropagateAtLaunch': True}
+        assert tag_policy(ec2.VPC) is tag_policy(ec2.VPC)
+
+
+class TestApplyTags(object):
+    def test_merge(self):
+        props = {'Tags': [{'Key': 'Team', 'Value': 'mine'}]}
+        assert apply_tags(ec2.VPC, props, description='Hello', defaults={'Team': 'ops', 'Env': 'prod'})
+        assert props['Tags'] == [
+            {'Key': 'Team', 'Value': 'mine'},
+            {'Key': 'Description', 'Value': 'Hello'},
+            {'Key': 'Env', 'Value': 'prod'},
+        ]
+
+    def test_untaggable(self):
+        props = {}
+        assert not apply_tags(iam.Role, props, defaults={'Env': 'prod'})
+        assert props == {}
+
+    def test_tags_object(self):
+        props = {'Tags': troposphere.Tags(Env='dev')}
+        apply_tags(ec2.VPC, props, defaults={'Env': 'prod', 'Team': 'ops'})
+        assert props['Tags'] == [{'Key': 'Env', 'Value': 'dev'}, {'Key': 'Team', 'Value': 'ops'}]
+
+    def test_intrinsic(self):
+        tags = If('Cond', [], [])
+        props = {'Tags': tags}
+        apply_tags(ec2.VPC, props, defaults={'Env': 'prod'})
+        assert props['Tags'] is tags
+
+    def test_intrinsic_key_order(self):
+        props = {'Tags': [{'Key': Ref('TagName'), 'Value': 'x'}, {'Key': 'Team', 'Value': 'mine'}]}
+        apply_tags(ec2.VPC, props, description='Hello', defaults={'Env': 'prod'})
+        assert [tag['Key'] for tag in props['Tags']] == [Ref('TagName'), 'Team', 'Description', 'Env']
+
+    def test_duplicate(self):
+        for defaults in ({'Env': 'prod'}, None):
+            props = {'Tags': [{'Key': 'Team', 'Value': 'a'}, {'Key': 'Team', 'Value': 'b'}]}
+            with pytest.raises(ValueError):
+                apply_tags(ec2.VPC, props, defaults=defaults, name='Vpc')
+
+    def test_limit(self):
+        props = {'Tags': [{'Key': str(i), 'Value': 'x'} for i in xrange(limits.MAX_TAGS)]}
+        apply_tags(ec2.VPC, props, defaults={'0': 'y'})
+        with pytest.raises(ValueError):
+            apply_tags(ec2.VPC, props, defaults={'Env': 'prod'}, name='Vpc')
+
+
+class TestDefaultTags(object):
+    def test_template(self):
+        class MyTemplate(stratosphere.Template):
+            DEFAULT_TAGS = {'Env': 'prod'}
+
+            def vpc(self):
+                """My VPC."""
+                return {'CidrBlock': '10.0.0.0/16'}
+
+            def asg(self):
+                return {'MaxSize': 1, 'MinSize': 1, 'AvailabilityZones': ['us-east-1a'],
+                        'LaunchConfigurationName': 'lc',
+                        'Tags': [troposphere.autoscaling.Tag('Env', 'dev', False)]}
+
+            def role(self):
+                return {'AssumeRolePolicyDocument': {}}
+        for compact in (False, True):
+            data = json.loads(MyTemplate(compact=compact).to_json())
+            assert data['Resources']['VPC']['Properties']['Tags'] == [
+                {'Key': 'Description', 'Value': 'My VPC.'},
+                {'Key': 'Env', 'Value': 'prod'},
+            ]
+            assert data['Resources']['AutoScalingGroup']['Properties']['Tags'] == [
+                {'Key': 'Env', 'Value': 'dev', 'PropagateAtLaunch': False},
+            ]
+            assert 'Tags' not in data['Resources']['Role']['Properties']
+
+    def test_limit_without_defaults(self):
+        class MyTemplate(stratosphere.Template):
+            def vpc(self):
+                return {'CidrBlock': '10.0.0.0/16',
+                        'Tags': [{'Key': str(i), 'Value': 'x'} for i in xrange(limits.MAX_TAGS + 10)]}
+        with pytest.raises(ValueError):
+            MyTemplate()
+
+    def test_validate(self):
+        data = {'Resources': {'VPC': {'Type': 'AWS::EC2::VPC', 'Properties': {
+            'CidrBlock': '10.0.0.0/16', 'Tags': [{'Key': str(i), 'Value': 'x'} for i in xrange(limits.MAX_TAGS + 10)]}}}}
+        problems = list(validate_templates({'Tagged': data}, processes=1))
+        assert [p.message for p in problems] == ['60 tags, the limit is 50']
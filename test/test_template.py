@@ -17,9 +17,12 @@
 #
 
 import json
+import StringIO
+
+import pytest
 
 import stratosphere
-from stratosphere import Ref, FindInMap
+from stratosphere import Ref, FindInMap, Join
 
 class TestTemplate(object):
     def d(self, cls):
@@ -249,3 +252,175 @@ class TestTemplate(object):
                 },
             },
         }
+
+    def test_magic_registry(self):
+        class MyTemplate(stratosphere.Template):
+            def subnet(self):
+                return {'VpcId': Ref('vpc-teapot'), 'CidrBlock': '10.0.0.0/16'}
+            def vpc(self):
+                return {'CidrBlock': '10.0.0.0/16'}
+        class MyTemplate2(MyTemplate):
+            vpc = None
+            def param_Foo(self):
+                return {'Type': 'String'}
+        assert MyTemplate._stratosphere_magic == ('subnet', 'vpc')
+        assert MyTemplate2._stratosphere_magic == ('param_Foo', 'subnet')
+        assert sorted(self.d(MyTemplate2)['Resources']) == ['Subnet']
+
+    def test_write_json(self):
+        class MyTemplate(stratosphere.Template):
+            """I am a teapot."""
+            def param_Foo(self):
+                return {'Type': 'String'}
+            def map_MyMap(self):
+                return {'Region': {'Cidr': '10.0.0.0/16'}}
+            def subnet(self):
+                return {'VpcId': Ref('vpc-teapot'), 'CidrBlock': FindInMap(self.map_MyMap(), 'Region', 'Cidr')}
+        template = MyTemplate()
+        for kwargs in [{}, {'indent': None, 'separators': (',', ':')}]:
+            buf = StringIO.StringIO()
+            template.write_json(buf, buffer_size=16, **kwargs)
+            assert buf.getvalue() == template.to_json(**kwargs)
+
+    def test_lazy(self):
+        calls = []
+        class MySubnet(stratosphere.ec2.Subnet):
+            def __init__(self, *args, **kwargs):
+                calls.append(args[0])
+                super(MySubnet, self).__init__(*args, **kwargs)
+        class MyTemplate(stratosphere.Template):
+            @classmethod
+            def STRATOSPHERE_TYPES(cls):
+                types = stratosphere.Template.STRATOSPHERE_TYPES()
+                types['subnet'] = MySubnet
+                return types
+            def param_Foo(self):
+                return {'Type': 'String'}
+            def subnet_One(self):
+                return {'VpcId': Ref('vpc-teapot'), 'CidrBlock': '10.0.0.0/16'}
+            def subnet_Two(self):
+                return {'VpcId': Ref('vpc-teapot'), 'CidrBlock': '10.1.0.0/16'}
+        template = MyTemplate(lazy=True)
+        assert template.logical_ids() == ['One', 'Two']
+        assert calls == []
+        assert template.get_object('Two').CidrBlock == '10.1.0.0/16'
+        assert calls == ['Two']
+        assert json.loads(template.to_json()) == json.loads(MyTemplate().to_json())
+        assert calls == ['Two', 'One', 'One', 'Two']
+
+    def test_minified(self):
+        class MyTemplate(stratosphere.Template):
+            def subnet(self):
+                return {'VpcId': Ref('vpc-teapot'), 'CidrBlock': '10.0.0.0/16'}
+        template = MyTemplate()
+        data = template.to_json(mode=stratosphere.MINIFIED)
+        assert ' ' not in data
+        assert json.loads(data) == json.loads(template.to_json())
+        assert template.json_size(stratosphere.MINIFIED) == len(data)
+
+    def test_canonical(self):
+        class MyTemplate(stratosphere.Template):
+            def subnet_One(self):
+                return {
+                    'VpcId': Ref('vpc-teapot'),
+                    'CidrBlock': Join('', ['10.0', '.0.0', '/16']),
+                    'Tags': [{'Key': 'B', 'Value': '2'}, {'Key': 'A', 'Value': '1'}],
+                }
+            def subnet_Two(self):
+                return {
+                    'VpcId': Ref('vpc-teapot'),
+                    'CidrBlock': Join('.', ['10', Ref('Foo'), '0', '0/16']),
+                    'DependsOn': [self.subnet_One()],
+                }
+        data = json.loads(MyTemplate().to_json(mode=stratosphere.CANONICAL))
+        one = data['Resources']['One']['Properties']
+        two = data['Resources']['Two']
+        assert one['CidrBlock'] == '10.0.0.0/16'
+        assert one['Tags'] == [{'Key': 'A', 'Value': '1'}, {'Key': 'B', 'Value': '2'}]
+        assert two['Properties']['CidrBlock'] == {'Fn::Join': ['.', ['10', {'Ref': 'Foo'}, '0.0/16']]}
+        assert two['DependsOn'] == 'One'
+
+    def test_size_report(self):
+        class MyTemplate(stratosphere.Template):
+            def subnet(self):
+                return {'VpcId': Ref('vpc-teapot'), 'CidrBlock': '10.0.0.0/16'}
+        template = MyTemplate()
+        report = template.size_report()
+        assert list(report) == ['pretty', 'minified', 'canonical']
+        assert report['pretty'].size == len(template.to_json())
+        assert report['minified'].size < report['pretty'].size
+        assert report['pretty'].fits_inline
+
+    def test_compact(self):
+        class MyTemplate(stratosphere.Template):
+            def vpc(self):
+                return {'CidrBlock': '10.0.0.0/16'}
+
+            def subnet(self):
+                """A subnet."""
+                return {'VpcId': Ref(self.vpc()), 'CidrBlock': '10.0.0.0/24', 'DependsOn': self.ig()}
+
+            def ig(self):
+                return {}
+        template = MyTemplate(compact=True)
+        assert template.to_json() == MyTemplate().to_json()
+        subnet = template.resources['Subnet']
+        assert isinstance(subnet, stratosphere.compact.CompactResource)
+        assert subnet.CidrBlock == '10.0.0.0/24'
+        assert subnet.name == 'Subnet'
+        assert template.dependency_graph().dependencies('Subnet') == ['InternetGateway', 'VPC']
+
+    def test_compact_validates(self):
+        class MyTemplate(stratosphere.Template):
+            def subnet(self):
+                return {'VpcId': Ref('vpc-teapot')}
+        with pytest.raises(ValueError):
+            MyTemplate(compact=True)
+
+    def test_batch(self):
+        class MyTemplate(stratosphere.Template):
+            def vpc(self):
+                return {'CidrBlock': '10.0.0.0/16'}
+
+            def subnet_Tiers(self):
+                """Tier subnet."""
+                for i, tier in enumerate(['Public', 'Private']):
+                    yield tier, {'VpcId': Ref(self.vpc()), 'CidrBlock': '10.0.{}.0/24'.format(i)}
+                    yield 'rtb', '{}RouteTable'.format(tier), {'VpcId': Ref(self.vpc())}
+                    yield '{}Association'.format(tier), stratosphere.ec2.SubnetRouteTableAssociation(
+                        '{}Association'.format(tier), SubnetId=Ref(tier), RouteTableId=Ref('{}RouteTable'.format(tier)))
+        data = self.d(MyTemplate)
+        assert sorted(data['Resources']) == ['Private', 'PrivateAssociation', 'PrivateRouteTable', 'Public',
+                                             'PublicAssociation', 'PublicRouteTable', 'VPC']
+        assert data['Resources']['Private']['Properties']['CidrBlock'] == '10.0.1.0/24'
+        assert data['Resources']['Private']['Properties']['Tags'] == [{'Key': 'Description', 'Value': 'Tier subnet.'}]
+        assert data['Resources']['PublicRouteTable']['Type'] == 'AWS::EC2::RouteTable'
+        assert data['Resources']['PublicAssociation']['Type'] == 'AWS::EC2::SubnetRouteTableAssociation'
+        template = MyTemplate(lazy=True)
+        assert template.logical_ids() == sorted(data['Resources'])
+        assert json.loads(template.to_json()) == data
+
+    def test_batch_duplicate(self):
+        class MyTemplate(stratosphere.Template):
+            def subnet_Many(self):
+                yield 'One', {'VpcId': 'vpc-teapot', 'CidrBlock': '10.0.0.0/24'}
+                yield 'One', {'VpcId': 'vpc-teapot', 'CidrBlock': '10.0.1.0/24'}
+        with pytest.raises(ValueError) as excinfo:
+            MyTemplate()
+        assert str(excinfo.value) == 'duplicate name "One" from subnet_Many'
+
+    def test_batch_unknown_type(self):
+        class MyTemplate(stratosphere.Template):
+            def subnet_Many(self):
+                yield 'teapot', 'One', {}
+        with pytest.raises(ValueError) as excinfo:
+            MyTemplate()
+        assert str(excinfo.value) == 'unknown type prefix "teapot" from subnet_Many'
+
+    def test_batch_title_mismatch(self):
+        class MyTemplate(stratosphere.Template):
+            def subnet_Many(self):
+                yield 'One', stratosphere.ec2.Subnet('Two', VpcId='vpc-teapot', CidrBlock='10.0.0.0/24')
+        with pytest.raises(ValueError) as excinfo:
+            MyTemplate()
+        assert str(excinfo.value) == 'subnet_Many yielded "One" for an object named "Two"'
@@ -0,0 +1,102 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import base64
+import gzip
+import json
+import os
+import StringIO
+
+import troposphere
+
+import stratosphere
+from stratosphere import GetAtt, Ref, limits, userdata
+from stratosphere.userdata import UserData, interpolate, payload_size
+from stratosphere.validate import validate_templates
+
+
+def _gunzip(value):
+    return gzip.GzipFile(fileobj=StringIO.StringIO(base64.b64decode(value))).read()
+
+
+class TestInterpolate(object):
+    def test_interpolate(self):
+        assert interpolate('a ${Vpc} b ${Elb.DNSName} ${!Literal} ${AWS::Region}') == [
+            'a ', Ref('Vpc'), ' b ', GetAtt('Elb', 'DNSName'), ' ${Literal} ', Ref('AWS::Region')]
+
+    def test_plain(self):
+        assert interpolate('echo $HOME ${}') == ['echo $HOME ${}']
+
+
+class TestUserData(object):
+    def test_static(self):
+        payload = UserData().add('#!/bin/sh\necho hi\n').build()
+        assert payload.static
+        assert _gunzip(payload.value) == '#!/bin/sh\necho hi\n'
+        assert payload.size == len(base64.b64decode(payload.value))
+        assert payload_size(payload.value) == payload.size
+
+    def test_uncompressed(self):
+        payload = UserData(compress=False).add('#!/bin/sh\necho hi\n').build()
+        assert base64.b64decode(payload.value) == '#!/bin/sh\necho hi\n'
+
+    def test_dynamic(self):
+        payload = UserData().add('#!/bin/sh\necho ${Elb.DNSName}\n').build()
+        assert not payload.static
+        assert json.loads(json.dumps(payload.value, cls=troposphere.awsencode)) == {'Fn::Base64': {'Fn::Join': [
+            '', ['#!/bin/sh\necho ', {'Fn::GetAtt': ['Elb', 'DNSName']}, '\n']]}}
+        assert payload.size == len('#!/bin/sh\necho \n')
+
+    def test_mime(self):
+        payload = UserData(compress=False).add('#cloud-config\npackages: [git]\n').add('#!/bin/sh\necho hi\n').build()
+        data = base64.b64decode(payload.value)
+        assert data.startswith('Content-Type: multipart/mixed; boundary="')
+        assert 'Content-Type: text/cloud-config; charset="utf-8"' in data
+        assert 'filename="part-002"\n\n#!/bin/sh\necho hi\n' in data
+        assert data.endswith('--\n')
+
+    def test_file(self, tmpdir):
+        path = tmpdir.join('setup.sh')
+        path.write('#!/bin/sh\necho ${Name}\n')
+        payload = UserData(mime=True).add_file(str(path)).build()
+        data = json.dumps(payload.value, cls=troposphere.awsencode)
+        assert 'filename=\\"setup.sh\\"' in data
+        assert 'text/x-shellscript' in data
+
+    def test_memoized(self):
+        script = '#!/bin/sh\n' + 'echo hello\n' * 1000
+        one = UserData().add(script).build()
+        assert UserData().add(script).build() is one
+        assert UserData(compress=False).add(script).build() is not one
+        assert one.size < 100
+
+    def test_memo_bounded(self):
+        for i in xrange(userdata._payloads.size + 1):
+            UserData().add('echo {}\n'.format(i)).build()
+        assert len(userdata._payloads) == userdata._payloads.size
+
+
+class TestValidateUserData(object):
+    def test_size(self):
+        class BigTemplate(stratosphere.Template):
+            def instance(self):
+                return {'ImageId': 'ami-12345', 'UserData': UserData(compress=False).add(
+                    os.urandom(limits.MAX_USER_DATA_SIZE + 1), 'application/octet-stream', variables=False).build().value}
+        problems = list(validate_templates([BigTemplate], processes=1))
+        assert [p.message for p in problems] == ['UserData is {} bytes, the limit is {} (see stratosphere.userdata)'.format(
+            limits.MAX_USER_DATA_SIZE + 1, limits.MAX_USER_DATA_SIZE)]
@@ -0,0 +1,115 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import stratosphere
+from stratosphere import GetAtt, If, Ref
+from stratosphere.validate import ERROR, WARNING, validate_templates
+
+
+class GoodTemplate(stratosphere.Template):
+    def param_Cidr(self):
+        return {'Type': 'String'}
+
+    def vpc(self):
+        return {'CidrBlock': Ref('Cidr')}
+
+    def subnet(self):
+        return {'VpcId': Ref(self.vpc()), 'CidrBlock': '10.0.0.0/24', 'DependsOn': self.vpc()}
+
+    def out_Region(self):
+        return {'Value': Ref('AWS::Region')}
+
+
+class BadTemplate(stratosphere.Template):
+    def vpc(self):
+        return {'CidrBlock': If('IsProd', '10.0.0.0/16', '10.1.0.0/16')}
+
+    def subnet(self):
+        return {'VpcId': Ref('Missing'), 'DependsOn': ['VPC', 'Nope']}
+
+    def out_Dns(self):
+        return {'Value': GetAtt('LoadBalancer', 'DNSName')}
+
+
+def _messages(problems):
+    return sorted((p.section, p.name, p.message) for p in problems)
+
+
+class TestValidate(object):
+    def test_good(self):
+        assert list(validate_templates([GoodTemplate], processes=1)) == []
+
+    def test_bad(self):
+        problems = list(validate_templates([BadTemplate], processes=1))
+        assert all(p.template == 'BadTemplate' and p.severity == ERROR for p in problems)
+        assert _messages(problems) == [
+            ('Outputs', 'Dns', 'GetAtt of unknown resource LoadBalancer'),
+            ('Resources', 'Subnet', 'DependsOn unknown resource Nope'),
+            ('Resources', 'Subnet', 'Ref to unknown name Missing'),
+            ('Resources', 'Subnet', 'missing required property CidrBlock'),
+            ('Resources', 'VPC', 'unknown condition IsProd'),
+        ]
+
+    def test_dict(self):
+        template = {'Resources': {'Subnet': {'Type': 'AWS::EC2::Subnet', 'Properties': {
+            'VpcId': 'vpc-teapot', 'CidrBlock': '10.0.0.0/24', 'Teapot': True}}}}
+        problems = list(validate_templates({'mine': template}, processes=1))
+        assert [(p.template, p.name, p.message) for p in problems] == [('mine', 'Subnet', 'unknown property Teapot')]
+
+    def test_security_group_rules(self):
+        rules = [{'IpProtocol': 'tcp', 'FromPort': i, 'ToPort': i, 'CidrIp': '10.0.0.0/8'} for i in xrange(51)]
+        template = {'Resources': {'Group': {'Type': 'AWS::EC2::SecurityGroup', 'Properties': {
+            'GroupDescription': 'Group', 'SecurityGroupIngress': rules}}}}
+        problems = list(validate_templates([template], processes=1))
+        assert [p.message for p in problems] == [
+            'SecurityGroupIngress has 51 rules, the limit is 50 (see stratosphere.secgroups)']
+
+    def test_limits(self):
+        resources = dict(('Queue{}'.format(i), {'Type': 'AWS::SQS::Queue', 'Properties': {'Padding': 'x' * 300}})
+                         for i in xrange(201))
+        problems = list(validate_templates([{'Resources': resources}], processes=1))
+        assert [(p.severity, p.section, p.message) for p in problems] == [
+            (ERROR, 'Resources', '201 entries, the limit is 200'),
+            (WARNING, None, 'template is 73471 bytes, it has to be uploaded to S3'),
+        ]
+
+    def test_parallel_fail_fast(self):
+        templates = [GoodTemplate, BadTemplate, GoodTemplate()]
+        problems = list(validate_templates(templates, processes=2))
+        assert _messages(problems) == _messages(validate_templates(templates, processes=1))
+        problems = list(validate_templates(templates, processes=2, fail_fast=True))
+        assert len(problems) == 1
+
+    def test_fail_fast_stops_building(self):
+        built = []
+        class LaterTemplate(GoodTemplate):
+            def __init__(self):
+                built.append(self)
+                super(LaterTemplate, self).__init__()
+        problems = list(validate_templates([BadTemplate, LaterTemplate], processes=1, fail_fast=True))
+        assert len(problems) == 1
+        assert built == []
+
+    def test_parallel_local(self):
+        class BrokenTemplate(stratosphere.Template):
+            def vpc(self):
+                raise ValueError('I am a teapot')
+        problems = list(validate_templates([BrokenTemplate, BadTemplate], processes=2))
+        assert ('BrokenTemplate', None, 'failed to build: I am a teapot') in [
+            (p.template, p.section, p.message) for p in problems]
+        assert len(problems) == 6